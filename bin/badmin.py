@@ -16,6 +16,11 @@
 # You should have received a copy of the GNU General Public License
 # along with olwclients. If not, see <http://www.gnu.org/licenses/>.
 
+import olwagent
+
+# Runs the command in the agent if one is running, before the slower imports below.
+olwagent.forward()
+
 import argparse
 import sys
 from olwclient import *
@@ -156,7 +161,7 @@ pqact.add_argument("queue_names", nargs='*', type=str, default=None,
 pqact.set_defaults(func=qact)
 
 cmd_args = parser.parse_args()
-connection = OpenLavaConnection(cmd_args)
+connection = olwagent.connect(cmd_args)
 
 try:
     cmd_args.func(cmd_args)
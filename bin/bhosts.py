@@ -15,13 +15,18 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with olwclients. If not, see <http://www.gnu.org/licenses/>.
+import olwagent
+
+# Runs the command in the agent if one is running, before the slower imports below.
+olwagent.forward()
+
 import argparse
 from olwclient import *
 import sys
 
 
 def print_long():
-    for host in Host.get_hosts_by_names(connection, args.hostnames):
+    for host in source.get_hosts_by_names(connection, args.hostnames):
         print "HOST  %s" % host.host_name
         print "\n"
         print "STATUS           CPUF  JL/U    MAX  NJOBS    RUN  SSUSP  USUSP    RSV DISPATCH_WINDOW"
@@ -61,7 +66,7 @@ def print_long():
 
 def print_short():
     print "HOST_NAME          STATUS       JL/U    MAX  NJOBS    RUN  SSUSP  USUSP    RSV"
-    for host in Host.get_hosts_by_names(connection, args.hostnames):
+    for host in source.get_hosts_by_names(connection, args.hostnames):
         print "%-18.18s %-12.12s %-7.7s %-4.4s %-8.8s %-4.4s %-6.6s %-8.8s %-4.4s" % \
               (host.host_name,
                ",".join([s.friendly for s in host.statuses]),
@@ -72,7 +77,7 @@ def print_short():
 
 def print_wide():
     print "HOST_NAME          STATUS       JL/U    MAX  NJOBS    RUN  SSUSP  USUSP    RSV"
-    for host in Host.get_hosts_by_names(connection, args.hostnames):
+    for host in source.get_hosts_by_names(connection, args.hostnames):
         print "%-18s %-12s %-7s %-4s %-8s %-4s %-6s %-8s %-4s" % (
             host.host_name,
             ",".join([s.friendly for s in host.statuses]),
@@ -89,6 +94,8 @@ Fields are displayed without truncation.")
 parser.add_argument("-l", action='store_true', dest="long", help="Displays  host  information in a (long) multi-line \
 format. In addition to the default fields, displays information about the CPU factor, the dispatch windows, the \
 current load, and the load thresholds.")
+parser.add_argument("--snapshot", dest="snapshot", default=None,
+                    help="Reads hosts from a snapshot file written by olwsnapshot.py instead of the server.")
 parser.add_argument("hostnames", default=None, nargs="*", help="Only  displays  information  about the specified \
 hosts or host groups. For host groups")
 
@@ -96,7 +103,8 @@ args = parser.parse_args()
 if len(args.hostnames) == 0:
         args.hostnames = ["all"]
 
-connection = OpenLavaConnection(args)
+connection = olwagent.connect(args)
+source = Snapshot(args.snapshot) if args.snapshot else Host
 try:
     if args.long:
         print_long()
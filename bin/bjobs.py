@@ -15,91 +15,90 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with olwclients. If not, see <http://www.gnu.org/licenses/>.
+import olwagent
+
+# Runs the command in the agent if one is running, before the slower imports below.
+olwagent.forward()
+
 import argparse
 import getpass
 import re
+import signal
 import sys
+import time
 
 from olwclient import *
 
+output = []
+output_flushed = [0]
 
-def print_long():
-    for job in jobs:
-        print
-        status = job.status.friendly
-        job_id = job.job_id
-        if job.array_index != 0:
-            job_id = "%s[%s]" % (job.job_id, job.array_index)
 
-        row = "Job <%s>, User <%s>, Project <%s>, Status <%s>, Queue <%s>, Command <%s>" % (
-            job_id, job.user_name, job.project_names[0], status, job.queue, job.command)
+def write(line=""):
+    # Rows are written in batches, at least every tenth of a second so the first rows appear straight away.
+    output.append(line)
+    now = time.time()
+    if len(output) >= 1000 or now - output_flushed[0] >= 0.1:
+        flush()
+        output_flushed[0] = now
 
-        if len(row) > 80:
-            print row[:80]
-            row = row[80:]
-            if len(row) > 0:
-                if len(row) > 80:
-                    print "            %s" % row[:70]
-                else:
-                    print "            %s" % row
 
-        else:
-            print row
-        print "%s: submitted from host: <%s>, CWD <%s>" % (job.submit_time_datetime, job.submission_host.name, job.cwd)
-        if job.status.name == "JOB_STAT_PEND":
-            print "PENDING REASONS:"
-            print job.pending_reasons
+def flush():
+    if output:
+        output.append("")
+        sys.stdout.write("\n".join(output))
+        sys.stdout.flush()
+        del output[:]
 
-        print
 
+def short_status(job):
+    status = job.status.name
+    if status == "JOB_STAT_RUN":
+        return "RUN"
+    elif status == "JOB_STAT_PEND":
+        return "PEND"
+    elif status == "JOB_STAT_DONE":
+        return "DONE"
+    elif status == "JOB_STAT_EXIT":
+        return "EXIT"
+    elif status == "JOB_STAT_USUSP":
+        return "USUSP"
+    elif status == "JOB_STAT_SSUSP":
+        return "SSUSP"
+    return "UNKNOWN"
 
-def print_short():
-    print "%-7.7s %-7.7s %-5.5s %-10.10s %-11.11s %-11.11s %-10.10s %12.12s" % (
-        "JOBID",
-        "USER",
-        "STAT",
-        "QUEUE",
-        "FROM_HOST",
-        "EXEC_HOST",
-        "JOB_NAME",
-        "SUBMIT_TIME",
-    )
-
-    for job in jobs:
-        status = job.status.name
-        if status == "JOB_STAT_RUN":
-            status = "RUN"
-        elif status == "JOB_STAT_PEND":
-            status = "PEND"
-        elif status == "JOB_STAT_DONE":
-            status = "DONE"
-        elif status == "JOB_STAT_EXIT":
-            status = "EXIT"
-        elif status == "JOB_STAT_USUSP":
-            status = "USUSP"
-        elif status == "JOB_STAT_SSUSP":
-            status = "SSUSP"
-        else:
-            status = "UNKNOWN"
-
-        job_id = job.job_id
-        if job.array_index != 0:
-            job_id = "%s[%s]" % (job.job_id, job.array_index)
-
-        print "%-7.7s %-7.7s %-5.5s %-10.10s %-11.11s %-11.11s %-11.11s %-12s" % (
-            job_id,
-            job.user_name,
-            status,
-            job.queue,
-            job.submission_host.name,
-            " ".join([x.name for x in job.execution_hosts]),
-            job.name,
-            job.submit_time_datetime,
-        )
-
-
-def print_wide():
-    print "%-7.7s %-7.7s %-5.5s %-10.10s %-11.11s %-11.11s %-10.10s %12.12s" % (
+
+def print_long(job):
+    write()
+    status = job.status.friendly
+    job_id = job.job_id
+    if job.array_index != 0:
+        job_id = "%s[%s]" % (job.job_id, job.array_index)
+
+    row = "Job <%s>, User <%s>, Project <%s>, Status <%s>, Queue <%s>, Command <%s>" % (
+        job_id, job.user_name, job.project_names[0], status, job.queue, job.command)
+
+    if len(row) > 80:
+        write(row[:80])
+        row = row[80:]
+        if len(row) > 0:
+            if len(row) > 80:
+                write("            %s" % row[:70])
+            else:
+                write("            %s" % row)
+
+    else:
+        write(row)
+    # The submission host name is part of the job data, no host request is made.
+    write("%s: submitted from host: <%s>, CWD <%s>" % (job.submit_time_datetime, job.submission_host.name, job.cwd))
+    if job.status.name == "JOB_STAT_PEND":
+        write("PENDING REASONS:")
+        write("%s" % job.pending_reasons)
+
+    write()
+
+
+def print_header():
+    write("%-7.7s %-7.7s %-5.5s %-10.10s %-11.11s %-11.11s %-10.10s %12.12s" % (
         "JOBID",
         "USER",
         "STAT",
@@ -108,38 +107,63 @@ def print_wide():
         "EXEC_HOST",
         "JOB_NAME",
         "SUBMIT_TIME",
-    )
-
-    for job in jobs:
-        status = job.status.name
-        if status == "JOB_STAT_RUN":
-            status = "RUN"
-        elif status == "JOB_STAT_PEND":
-            status = "PEND"
-        elif status == "JOB_STAT_DONE":
-            status = "DONE"
-        elif status == "JOB_STAT_EXIT":
-            status = "EXIT"
-        elif status == "JOB_STAT_USUSP":
-            status = "USUSP"
-        elif status == "JOB_STAT_SSUSP":
-            status = "SSUSP"
-        else:
-            status = "UNKNOWN"
-
-        job_id = job.job_id
-        if job.array_index != 0:
-            job_id = "%s[%s]" % (job.job_id, job.array_index)
-
-        print "{0:<7s} {1:<7s} {2:<5s} {3:<10s} {4:<11s} {5:<11s} {6:<11s} {7:<12s}".format(
-            job_id,
-            job.user_name,
-            status,
-            job.queue,
-            job.submission_host.name,
-            " ".join([x.name for x in job.execution_hosts]),
-            job.name,
-            job.submit_time_datetime, )
+    ))
+
+
+def print_short(job):
+    job_id = job.job_id
+    if job.array_index != 0:
+        job_id = "%s[%s]" % (job.job_id, job.array_index)
+
+    write("%-7.7s %-7.7s %-5.5s %-10.10s %-11.11s %-11.11s %-11.11s %-12s" % (
+        job_id,
+        job.user_name,
+        short_status(job),
+        job.queue,
+        job.submission_host.name,
+        " ".join([x.name for x in job.execution_hosts]),
+        job.name,
+        job.submit_time_datetime,
+    ))
+
+
+def print_wide(job):
+    job_id = "%s" % job.job_id
+    if job.array_index != 0:
+        job_id = "%s[%s]" % (job.job_id, job.array_index)
+
+    write("{0:<7s} {1:<7s} {2:<5s} {3:<10s} {4:<11s} {5:<11s} {6:<11s} {7:<12s}".format(
+        job_id,
+        job.user_name,
+        short_status(job),
+        job.queue,
+        job.submission_host.name,
+        " ".join([x.name for x in job.execution_hosts]),
+        job.name,
+        "%s" % job.submit_time_datetime, ))
+
+
+def print_summary():
+    group_by = args.group_by.split(",")
+    summary = Job.summarize(connection,
+                            group_by=group_by,
+                            user_name=args.user_name,
+                            job_state=args.job_state,
+                            host_name=args.host_name,
+                            queue_name=args.queue_name,
+                            job_name=args.job_name,
+                            where=args.where,
+                            )
+    print " ".join(["%-16.16s" % f.upper() for f in group_by]), "%8s %8s" % ("NJOBS", "SLOTS")
+    for key in sorted(summary):
+        values = []
+        for value in key:
+            if value is None:
+                value = "-"
+            elif isinstance(value, basestring) and value.startswith("JOB_STAT_"):
+                value = value[len("JOB_STAT_"):]
+            values.append("%-16.16s" % value)
+        print " ".join(values), "%8d %8d" % (summary[key]['count'], summary[key]['slots'])
 
 
 parser = argparse.ArgumentParser(description='Displays information about hosts')
@@ -166,6 +190,16 @@ parser.add_argument("-l", action='store_true', dest="long",
 parser.add_argument("-u", dest="user_name", default=getpass.getuser(),
                     help="Only displays jobs that have been submitted by the specified users. The keyword all \
                     specifies all users")
+parser.add_argument("--where", dest="where", default=None,
+                    help="Only displays jobs that match a filter expression, for example \
+                    \"status in (PEND,RUN) and requested_slots > 16 and submit_time < now-1d\".")
+parser.add_argument("-sum", action='store_true', dest="summary",
+                    help="Displays the number of jobs and slots for each status, or for each combination of the \
+                    fields given with --group-by, instead of listing the jobs.")
+parser.add_argument("--group-by", dest="group_by", default="status",
+                    help="Comma separated fields to group jobs by with -sum, for example user_name,status.")
+parser.add_argument("--snapshot", dest="snapshot", default=None,
+                    help="Reads jobs from a snapshot file written by olwsnapshot.py instead of the server.")
 parser.add_argument("job_ids", nargs='*', type=str, default=None,
                     help="Displays information about the specified jobs or job arrays")
 parser.add_argument("-m", dest="host_name", default=None,
@@ -176,38 +210,80 @@ parser.add_argument("-J", dest="job_name", default=None,
                     help="Displays information about the specified jobs or job arrays.")
 
 args = parser.parse_args()
+# Exit quietly when the reader goes away, for example bjobs -u all | head, which also ends the request.
+signal.signal(signal.SIGPIPE, signal.SIG_DFL)
+if args.where:
+    try:
+        args.where = JobFilter(args.where)
+    except ValueError, e:
+        print "Invalid filter: %s" % e
+        sys.exit(1)
+
+connection = olwagent.connect(args)
+snapshot = Snapshot(args.snapshot) if args.snapshot else None
 
-connection = OpenLavaConnection(args)
-
-if len(args.job_ids) > 0:
-    jobs = []
-    for jid in args.job_ids:
-        try:
-            jid = int(jid)
-            aid = 0
-        except ValueError:
-            jid = jid.rstrip("]")
-            jid, br, aid = jid.partition("[")
-            if not jid and aid:
-                print "Invalid job id: %s" % jid
-                sys.exit(1)
-
-        jobs.append(Job(connection, job_id=jid, array_index=aid))
+if args.summary:
+    if snapshot:
+        print "-sum can not be used with --snapshot"
+        sys.exit(1)
+    try:
+        print_summary()
+    except RemoteServerError, e:
+        print "Unable to display job summary: %s" % e.message
+        sys.exit(1)
+    sys.exit(0)
+
+if args.long:
+    print_job = print_long
+elif args.wide:
+    print_job = print_wide
 else:
-    jobs = Job.get_job_list(connection,
+    print_job = print_short
+
+jobs = []
+for jid in args.job_ids:
+    try:
+        jid = int(jid)
+        aid = 0
+    except ValueError:
+        jid = jid.rstrip("]")
+        jid, br, aid = jid.partition("[")
+        if not jid and aid:
+            print "Invalid job id: %s" % jid
+            sys.exit(1)
+    jobs.append((jid, aid))
+
+try:
+    if not args.long:
+        print_header()
+    if jobs:
+        for jid, aid in jobs:
+            if snapshot:
+                print_job(snapshot.get_job(connection, jid, aid or 0))
+            else:
+                print_job(Job(connection, job_id=jid, array_index=aid))
+    elif snapshot:
+        for job in snapshot.get_job_list(connection,
+                                         user_name=args.user_name,
+                                         job_state=args.job_state,
+                                         host_name=args.host_name,
+                                         queue_name=args.queue_name,
+                                         job_name=args.job_name,
+                                         where=args.where,
+                                         ):
+            print_job(job)
+    else:
+        # Each job is printed as it is received, instead of after the whole list has been read.
+        Job.stream_job_list(connection, print_job,
                             user_name=args.user_name,
                             job_state=args.job_state,
                             host_name=args.host_name,
                             queue_name=args.queue_name,
                             job_name=args.job_name,
+                            where=args.where,
                             )
-try:
-    if args.long:
-        print_long()
-    elif args.wide:
-        print_wide()
-    else:
-        print_short()
 except RemoteServerError, e:
+    flush()
     print "Unable to display job information: %s" % e.message
     sys.exit(1)
+flush()
@@ -15,6 +15,11 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with olwclients. If not, see <http://www.gnu.org/licenses/>.
+import olwagent
+
+# Runs the command in the agent if one is running, before the slower imports below.
+olwagent.forward()
+
 import argparse
 from olwclient import *
 import getpass
@@ -47,7 +52,7 @@ parser.add_argument("-s", dest="signal", default="kill", choices=["kill", "suspe
 
 args = parser.parse_args()
 
-connection = OpenLavaConnection(args)
+connection = olwagent.connect(args)
 
 if 0 in args.job_ids or "0" in args.job_ids:
     jobs = Job.get_job_list(connection,
@@ -15,13 +15,18 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with olwclients. If not, see <http://www.gnu.org/licenses/>.
+import olwagent
+
+# Runs the command in the agent if one is running, before the slower imports below.
+olwagent.forward()
+
 import argparse
 from olwclient import *
 import sys
 
 
 def print_long():
-    for queue in Queue.get_queues_by_names(connection, args.queue_names):
+    for queue in source.get_queues_by_names(connection, args.queue_names):
         if args.user and args.user == "all" and queue.allowed_users:
             continue  # allowed users only True if restricted
         if args.user and queue.allowed_users and args.user not in args.allowed_users:
@@ -59,7 +64,7 @@ def print_long():
 
 def print_short():
     print "QUEUE_NAME      PRIO STATUS          MAX JL/U JL/P JL/H #NJOBS  PEND   RUN  SUSP"
-    for queue in Queue.get_queues_by_names(connection, args.queue_names):
+    for queue in source.get_queues_by_names(connection, args.queue_names):
         if args.user and args.user == "all" and queue.allowed_users:
             continue  # allowed users only True if restricted
         if args.user and queue.allowed_users and args.user not in args.allowed_users:
@@ -85,7 +90,7 @@ def print_short():
 
 def print_wide():
     print "QUEUE_NAME      PRIO STATUS          MAX JL/U JL/P JL/H #NJOBS  PEND   RUN  SUSP"
-    for queue in Queue.get_queues_by_names(connection, args.queue_names):
+    for queue in source.get_queues_by_names(connection, args.queue_names):
         if args.user and args.user == "all" and queue.allowed_users:
             continue  # allowed users only True if restricted
         if args.user and queue.allowed_users and args.user not in args.allowed_users:
@@ -117,6 +122,8 @@ parser.add_argument("-w", action='store_true', dest="wide",
                     help="Displays queue information in wide format. Fields are displayed without truncation.")
 parser.add_argument("-l", action='store_true', dest="long",
                     help="Displays queue information in a (long) multi-line format. ")
+parser.add_argument("--snapshot", dest="snapshot", default=None,
+                    help="Reads queues from a snapshot file written by olwsnapshot.py instead of the server.")
 parser.add_argument("queue_names", default=None, nargs="*",
                     help="Only displays information about the specified queue or queueus")
 parser.add_argument("-u", default=None, dest="user", type=str,
@@ -130,7 +137,8 @@ args = parser.parse_args()
 if len(args.queue_names) == 0:
     args.queue_names = ["all"]
 
-connection = OpenLavaConnection(args)
+connection = olwagent.connect(args)
+source = Snapshot(args.snapshot) if args.snapshot else Queue
 
 try:
     if args.long:
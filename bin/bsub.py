@@ -15,6 +15,11 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with olwclients. If not, see <http://www.gnu.org/licenses/>.
+import olwagent
+
+# Runs the command in the agent if one is running, before the slower imports below.
+olwagent.forward()
+
 import argparse
 from olwclient import *
 import sys
@@ -55,7 +60,7 @@ parser.add_argument("commands", nargs='+', type=str, default=None,
 
 args = parser.parse_args()
 
-connection = OpenLavaConnection(args)
+connection = olwagent.connect(args)
 
 command = " ".join(args.commands)
 min_processors, sep, max_processors = args.procs.partition(",")
@@ -88,8 +93,6 @@ if args.queue_name:
 if args.job_name:
     payload['job_name'] = args.job_name
 
-connection.login()
-
 try:
     jobs = Job.submit(connection, **payload)
     for j in jobs:
@@ -0,0 +1,360 @@
+#!/usr/bin/env python
+# Copyright 2014 David Irvine
+#
+# This file is part of olwclients
+#
+# olwclients is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or (at
+# your option) any later version.
+#
+# olwclients is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with olwclients. If not, see <http://www.gnu.org/licenses/>.
+"""
+Per user agent that keeps an authenticated connection to the server and runs the bjobs, bhosts, bqueues,
+bkill, bsub and badmin commands for them, so that each command does not have to start Python, import
+olwclient, and log in again.
+
+Start the agent with the same connection arguments as the commands::
+
+    olwagent.py http://example.com/ --username me --password secret
+
+While it is running, the commands send their arguments, working directory and environment to the agent over a
+unix domain socket, and the agent runs the command in a forked process that already holds the connection and
+caches, sending its output back as it is written.  Commands run without the agent when it is not running,
+when OLWAGENT_SOCKET is set to an empty string, or when the agent does not run that command.  Commands given
+different connection arguments are run by the agent with a new connection.
+
+The socket is OLWAGENT_SOCKET, or $TMPDIR/olwagent-<uid>/agent.sock, in a directory only the user can use.
+
+This module is imported by the commands before anything else, so it only imports modules that are quick to
+load, and imports olwclient when the agent is started.
+
+"""
+import marshal
+import os
+import signal
+import socket
+import struct
+import sys
+
+#: Commands the agent runs
+commands = ("bjobs", "bhosts", "bqueues", "bkill", "bsub", "badmin")
+
+#: Connection arguments that must be the same for a command to use the connection of the agent
+connection_arguments = ("url", "username", "password", "unix_socket", "host_cache_ttl", "json_codec")
+
+#: Seconds a command waits for the agent to start running it, before running it without the agent
+accept_timeout = 2.0
+
+_frame = struct.Struct("<cI")
+
+# Set in the processes that run commands for the agent.
+_agent_args = None
+_agent_connection = None
+
+
+def socket_path():
+    """
+    Returns the path of the agent socket for this user, None when the agent is disabled.
+
+    """
+    path = os.environ.get("OLWAGENT_SOCKET")
+    if path is not None:
+        return path or None
+    return os.path.join(os.environ.get("TMPDIR", "/tmp"), "olwagent-%d" % os.getuid(), "agent.sock")
+
+
+def _read_exactly(f, size):
+    data = f.read(size)
+    if len(data) != size:
+        raise EOFError("Agent closed the connection")
+    return data
+
+
+def forward(command=None):
+    """
+    Runs the command in the agent when it is running, and exits with the exit status of the command.  Returns
+    when the command should be run in this process instead, including when the agent does not start running it
+    within :py:data:`accept_timeout` seconds.
+
+    :param str command: Name of the command, taken from sys.argv[0] if None
+
+    """
+    if _agent_args is not None:
+        return
+    path = socket_path()
+    if path is None or not os.path.exists(path):
+        return
+    if command is None:
+        command = os.path.splitext(os.path.basename(sys.argv[0]))[0]
+    if command not in commands:
+        return
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+        sock.sendall(marshal.dumps((command, sys.argv[1:], os.getcwd(), dict(os.environ))))
+        sock.shutdown(socket.SHUT_WR)
+        # The agent sends a frame as soon as it has started a process for the command.
+        sock.settimeout(accept_timeout)
+        response = sock.makefile("rb", 0)
+        kind, size = _frame.unpack(_read_exactly(response, _frame.size))
+        sock.settimeout(None)
+    except (socket.error, EOFError):
+        sock.close()
+        return
+    if kind != "a":
+        sock.close()
+        return
+    # Exit quietly when the reader goes away, as the commands do when run on their own.
+    signal.signal(signal.SIGPIPE, signal.SIG_DFL)
+    outputs = {"o": sys.stdout, "e": sys.stderr}
+    try:
+        while True:
+            kind, size = _frame.unpack(_read_exactly(response, _frame.size))
+            if kind == "x":
+                sys.exit(size)
+            elif kind == "d":
+                # The agent does not run this command, run it here.
+                return
+            output = outputs[kind]
+            output.write(_read_exactly(response, size))
+            output.flush()
+    except EOFError:
+        sys.stderr.write("The agent stopped before the command finished\n")
+        sys.exit(1)
+    finally:
+        sock.close()
+
+
+def connect(args):
+    """
+    Returns the connection of the agent when the command is run by the agent with the same connection
+    arguments, otherwise a new connection.
+
+    :param argparse.Namespace args: Parsed arguments of the command
+    :rtype: olwclient.OpenLavaConnection
+
+    """
+    if _agent_args is not None:
+        if all(getattr(args, a, None) == getattr(_agent_args, a, None) for a in connection_arguments):
+            return _agent_connection
+    from olwclient import OpenLavaConnection
+    return OpenLavaConnection(args)
+
+
+class _FrameWriter(object):
+    """
+    File like object that sends what is written to the client as frames of one kind.
+
+    """
+
+    def __init__(self, sock, kind):
+        self._sock = sock
+        self._kind = kind
+        self.softspace = 0
+
+    def write(self, data):
+        if isinstance(data, unicode):
+            data = data.encode("utf-8")
+        if data:
+            self._sock.sendall(_frame.pack(self._kind, len(data)) + data)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return False
+
+
+def _run(sock, listener, bin_dir):
+    """
+    Runs one command for a client, in the process forked for it.
+
+    """
+    import runpy
+    import traceback
+
+    listener.close()
+    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    status = 1
+    try:
+        sock.sendall(_frame.pack("a", 0))
+        request = sock.makefile("rb").read()
+        command, argv, cwd, env = marshal.loads(request)
+        if command not in commands:
+            sock.sendall(_frame.pack("d", 0))
+            return
+        devnull = os.open(os.devnull, os.O_RDONLY)
+        os.dup2(devnull, 0)
+        os.close(devnull)
+        os.chdir(cwd)
+        os.environ.clear()
+        os.environ.update(env)
+        sys.stdout = _FrameWriter(sock, "o")
+        sys.stderr = _FrameWriter(sock, "e")
+        sys.argv = [os.path.join(bin_dir, command + ".py")] + argv
+        try:
+            runpy.run_path(sys.argv[0], run_name="__main__")
+            status = 0
+        except SystemExit as e:
+            if e.code is None:
+                status = 0
+            elif isinstance(e.code, int):
+                status = e.code
+            else:
+                sys.stderr.write("%s\n" % e.code)
+        except Exception:
+            traceback.print_exc()
+        sys.stdout = sys.__stdout__
+        sys.stderr = sys.__stderr__
+        sock.sendall(_frame.pack("x", status & 0xff))
+    finally:
+        # The client may have gone away, there is nobody left to tell.
+        try:
+            sock.close()
+        finally:
+            os._exit(status)
+
+
+def _listen(path):
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory, 0700)
+    info = os.stat(directory)
+    if info.st_uid != os.getuid() or info.st_mode & 0077:
+        raise RuntimeError("Socket directory: %s must be owned by and only usable by this user" % directory)
+    if os.path.exists(path):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+        except socket.error:
+            os.unlink(path)
+        else:
+            raise RuntimeError("An agent is already listening on: %s" % path)
+        finally:
+            probe.close()
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(path)
+    os.chmod(path, 0600)
+    listener.listen(64)
+    return listener
+
+
+def _peer_uid(sock):
+    peercred = getattr(socket, "SO_PEERCRED", 17 if sys.platform.startswith("linux") else None)
+    if peercred is None:
+        return os.getuid()
+    pid, uid, gid = struct.unpack("3i", sock.getsockopt(socket.SOL_SOCKET, peercred, struct.calcsize("3i")))
+    return uid
+
+
+def serve(args):
+    """
+    Logs in, then runs commands for clients until the agent is stopped.  Hosts are loaded into the host
+    cache of the connection when the agent starts, and again each time hosts expire from the cache, whether or
+    not commands are arriving.  This keeps the session of the agent alive, and logs in again when it has
+    expired, so that commands do not each have to log in for themselves.
+
+    :param argparse.Namespace args: Parsed arguments of the agent
+
+    """
+    global _agent_args, _agent_connection
+    import errno
+    import httplib
+    import logging
+    import time
+    from olwclient import OpenLavaConnection, Host, RemoteServerError
+
+    path = args.socket or socket_path()
+    if path is None:
+        raise RuntimeError("The agent is disabled, OLWAGENT_SOCKET is empty")
+    connection = OpenLavaConnection(args)
+    connection.login()
+
+    def refresh_hosts():
+        try:
+            Host.get_host_list(connection)
+        except (RemoteServerError, IOError, httplib.HTTPException, ValueError), e:
+            logging.warning("Unable to load hosts: %s", e)
+
+    refresh_hosts()
+    listener = _listen(path)
+    if not args.foreground:
+        if os.fork():
+            os._exit(0)
+        os.setsid()
+        devnull = os.open(os.devnull, os.O_RDWR)
+        for fd in (0, 1, 2):
+            os.dup2(devnull, fd)
+        os.close(devnull)
+
+    _agent_args = args
+    _agent_connection = connection
+    bin_dir = os.path.dirname(os.path.abspath(__file__))
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    interval = max(connection.host_cache.ttl, 10)
+    refreshed = time.time()
+    try:
+        while True:
+            wait = refreshed + interval - time.time()
+            if wait <= 0:
+                refresh_hosts()
+                refreshed = time.time()
+                continue
+            listener.settimeout(wait)
+            try:
+                sock, address = listener.accept()
+            except socket.timeout:
+                continue
+            except socket.error as e:
+                if e.errno == errno.EINTR:
+                    continue
+                raise
+            sock.settimeout(None)
+            if _peer_uid(sock) != os.getuid():
+                sock.close()
+                continue
+            if os.fork() == 0:
+                _run(sock, listener, bin_dir)
+            sock.close()
+    finally:
+        if os.path.exists(path):
+            os.unlink(path)
+
+
+def main():
+    import argparse
+    from olwclient import OpenLavaConnection
+
+    parser = argparse.ArgumentParser(description='Runs bjobs, bhosts, bqueues, bkill, bsub and badmin for this \
+    user using a connection that stays logged in.')
+    OpenLavaConnection.configure_argument_list(parser)
+    parser.add_argument("--socket", dest="socket", default=None,
+                        help="Unix domain socket to listen on, default is $OLWAGENT_SOCKET or \
+                        $TMPDIR/olwagent-<uid>/agent.sock")
+    parser.add_argument("--foreground", action='store_true', dest="foreground",
+                        help="Stays in the foreground instead of running in the background.")
+    args = parser.parse_args()
+    try:
+        serve(args)
+    except RuntimeError, e:
+        print "Unable to start agent: %s" % e
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    # Run from the module object so that commands run by the agent see the state set by serve.
+    import olwagent
+    olwagent.main()
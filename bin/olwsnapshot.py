@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+# Copyright 2014 David Irvine
+#
+# This file is part of olwclients
+#
+# olwclients is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or (at
+# your option) any later version.
+#
+# olwclients is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with olwclients. If not, see <http://www.gnu.org/licenses/>.
+import argparse
+from olwclient import *
+import sys
+
+parser = argparse.ArgumentParser(description='Writes a snapshot of the jobs, hosts and queues on the cluster that \
+bjobs, bhosts and bqueues can read with --snapshot.  The snapshot is replaced atomically, so this can be run \
+periodically from cron.')
+OpenLavaConnection.configure_argument_list(parser)
+parser.add_argument("path", help="Path of the snapshot file")
+
+args = parser.parse_args()
+
+connection = OpenLavaConnection(args)
+try:
+    Snapshot.create(connection, args.path)
+except RemoteServerError, e:
+    print "Unable to write snapshot: %s" % e.message
+    sys.exit(1)
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# Copyright 2014 David Irvine
+#
+# This file is part of olwclients
+#
+# olwclients is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or (at
+# your option) any later version.
+#
+# olwclients is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with olwclients. If not, see <http://www.gnu.org/licenses/>.
+"""
+Checks that Job.count_jobs agrees with the length of Job.get_job_list, against a server that provides /jobs/count,
+one that only provides /jobs/summary, and one that provides neither, and shows the requests made and the time
+taken by each.
+
+    python examples/count_jobs_check.py [--jobs 5000]
+
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from olwclient import *
+from fakeserver import FakeServer, ConnectionArgs
+
+parser = argparse.ArgumentParser(description='Checks Job.count_jobs against the length of the job list')
+parser.add_argument("--jobs", type=int, default=5000, help="Number of jobs on the server")
+args = parser.parse_args()
+
+# Filters, and whether the server can count the jobs that match them.
+filters = [
+    ({}, True),
+    ({"job_state": "ALL"}, True),
+    ({"user_name": "user7", "job_state": "ALL"}, True),
+    ({"queue_name": "gpu"}, True),
+    ({"host_name": "comp042", "job_state": "ALL"}, True),
+    ({"where": "queue = normal and user_name = user7", "job_state": "ALL"}, True),
+    ({"where": "status = JOB_STAT_RUN", "job_state": "ALL"}, False),
+    ({"where": "submit_time > 1400000100", "job_state": "ALL"}, False),
+]
+
+for name, removed, path in [("count", [], "/jobs/count"),
+                            ("summary only", ["/jobs/count"], "/jobs/summary"),
+                            ("listing only", ["/jobs/count", "/jobs/summary"], "/jobs")]:
+    server = FakeServer(jobs=args.jobs)
+    for route in removed:
+        del server.routes[route]
+    connection = OpenLavaConnection(ConnectionArgs(server.start()))
+    connection.login()
+    try:
+        print "Server with %s:" % name
+        for kwargs, sent in filters:
+            start = time.time()
+            expected = len(Job.get_job_list(connection, **kwargs))
+            listed = time.time() - start
+            del server.requests[:]
+            start = time.time()
+            count = Job.count_jobs(connection, **kwargs)
+            counted = time.time() - start
+            assert count == expected, (kwargs, count, expected)
+            paths = [p.split("?")[0] for p in server.requests]
+            # The first request to a server without /jobs/count or /jobs/summary is tried and not found.
+            assert paths[-1] == (path if sent else "/jobs"), (kwargs, paths)
+            print "  %-70s %5d jobs, count %7.2f ms, list %7.2f ms, requests: %s" % (
+                kwargs, count, counted * 1000, listed * 1000, " ".join(paths))
+    finally:
+        server.stop()
+print "ok"
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# Copyright 2014 David Irvine
+#
+# This file is part of olwclients
+#
+# olwclients is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or (at
+# your option) any later version.
+#
+# olwclients is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with olwclients. If not, see <http://www.gnu.org/licenses/>.
+"""
+Checks EventStream against a stand-in server: events are delivered from the /events stream as they are sent,
+missed events are resent after the stream is interrupted, and a server without /events is polled for job
+changes without downloading the job list on each poll.
+
+    python examples/event_stream_check.py [--jobs 2000]
+
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from olwclient import *
+from fakeserver import FakeServer, ConnectionArgs
+
+parser = argparse.ArgumentParser(description='Checks EventStream against a stand-in server')
+parser.add_argument("--jobs", type=int, default=2000, help="Number of jobs on the server")
+args = parser.parse_args()
+
+
+class Received(object):
+    """
+    Collects the events passed to a callback, and waits for them to arrive.
+
+    """
+
+    def __init__(self):
+        self.events = []
+        self._condition = threading.Condition()
+
+    def __call__(self, event):
+        with self._condition:
+            self.events.append(event)
+            self._condition.notify_all()
+
+    def wait(self, count, timeout=10.0):
+        deadline = time.time() + timeout
+        with self._condition:
+            while len(self.events) < count and time.time() < deadline:
+                self._condition.wait(deadline - time.time())
+        assert len(self.events) >= count, "Received %d of %d events" % (len(self.events), count)
+        return self.events[:count]
+
+
+def wait_for(condition, timeout=10.0):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, "Timed out"
+        time.sleep(0.01)
+
+
+def job_events(events):
+    return [(e.data['job_id'], e.data['previous_status'], e.data['status']) for e in events]
+
+
+def status_changes(server):
+    # Moves the first jobs on to the next status, so that each one changes.
+    order = ["JOB_STAT_PEND", "JOB_STAT_RUN", "JOB_STAT_DONE", "JOB_STAT_PEND"]
+    return [(r['job_id'], order[order.index(r['status']['name']) + 1]) for r in server.records[:4]]
+
+
+# Events from the stream, with one interruption.
+server = FakeServer(jobs=args.jobs)
+changes = status_changes(server)
+connection = OpenLavaConnection(ConnectionArgs(server.start()))
+stream = EventStream(connection, event_types=["job"])
+received = Received()
+stream.add_callback(received)
+stream.start()
+try:
+    wait_for(lambda: server.events.last_event_ids)
+    expected = []
+    start = time.time()
+    for job_id, status in changes[:2]:
+        server.set_status(job_id, status)
+    expected.extend(server.events.events[-2:])
+    events = received.wait(2)
+    print "stream: %d events in %.1f ms" % (len(events), (time.time() - start) * 1000)
+
+    server.events.close_streams()
+    for job_id, status in changes[2:]:
+        server.set_status(job_id, status)
+    expected.extend(server.events.events[-2:])
+    events = received.wait(4)
+    assert server.events.last_event_ids == [None, "2"], server.events.last_event_ids
+    assert [int(e.id) for e in events] == [e[0] for e in expected]
+    assert job_events(events) == [(d['job_id'], d['previous_status'], d['status']) for i, t, d in expected]
+    assert not stream.polling
+    print "stream: missed events resent after reconnecting with Last-Event-ID: %s" % stream.last_event_id
+finally:
+    stream.stop()
+    server.stop()
+
+# Polling a server without /events.
+server = FakeServer(jobs=args.jobs)
+changes = status_changes(server)
+del server.routes["/events"]
+connection = OpenLavaConnection(ConnectionArgs(server.start()))
+stream = EventStream(connection, event_types=["job"], poll_interval=0.1)
+received = Received()
+stream.add_callback(received)
+stream.start()
+try:
+    wait_for(lambda: stream.polling and any(r.startswith("/jobs/changes") for r in server.requests))
+    time.sleep(0.3)
+    for job_id, status in changes:
+        server.set_status(job_id, status)
+    events = received.wait(len(changes))
+    assert sorted(job_events(events)) == sorted(job_events(Event(*e) for e in server.events.events))
+    polls = [r for r in server.requests if r.startswith("/jobs")]
+    assert all(r.startswith("/jobs/changes?") for r in polls), polls
+    assert len([r for r in polls if "since=" not in r]) == 1, polls
+    print "polling: %d events from %d polls, only the first downloaded every job" % (len(events), len(polls))
+finally:
+    stream.stop()
+    server.stop()
+print "ok"
@@ -0,0 +1,394 @@
+#!/usr/bin/env python
+# Copyright 2014 David Irvine
+#
+# This file is part of olwclients
+#
+# olwclients is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or (at
+# your option) any later version.
+#
+# olwclients is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with olwclients. If not, see <http://www.gnu.org/licenses/>.
+"""
+Minimal stand-in for an olweb server, used by the scripts in this directory to exercise the client without a
+cluster.  It serves a fixed set of generated jobs, with records shaped like those of a real server, over TCP or
+a unix domain socket.
+
+Example::
+
+    >>> server = FakeServer(jobs=1000)
+    >>> url = server.start()
+    >>> c = OpenLavaConnection(ConnectionArgs(url))
+    >>> len(Job.get_job_list(c, user_name="all", job_state="ALL"))
+    1000
+    >>> server.stop()
+
+"""
+import BaseHTTPServer
+import itertools
+import json
+import os
+import random
+import SocketServer
+import threading
+import urlparse
+
+STATUSES = [
+    dict(type="Status", name="JOB_STAT_RUN", friendly="Running", description="The job is running", status=4),
+    dict(type="Status", name="JOB_STAT_PEND", friendly="Pending", description="The job is pending", status=1),
+    dict(type="Status", name="JOB_STAT_DONE", friendly="Done", description="The job completed normally", status=64),
+]
+
+OPTIONS = [
+    dict(type="JobOption", name="SUB_QUEUE", friendly="SUB_QUEUE", description="", status=0x2),
+    dict(type="JobOption", name="SUB_OUT_FILE", friendly="SUB_OUT_FILE", description="", status=0x10),
+    dict(type="JobOption", name="SUB_PROJECT_NAME", friendly="SUB_PROJECT_NAME", description="", status=0x2000000),
+]
+
+QUEUES = ["normal", "short", "long", "gpu"]
+
+
+def job_record(i, rng=random):
+    """
+    Returns a job record shaped like one returned by /jobs on a real server.
+
+    :param int i: Index of the job, used for its id and name
+    :param random.Random rng: Random number generator used to pick the user, host, queue and status
+
+    """
+    user = "user%d" % rng.randint(0, 200)
+    host = "comp%03d" % rng.randint(0, 500)
+    queue = rng.choice(QUEUES)
+    status = rng.choice(STATUSES)
+    running = status['name'] == "JOB_STAT_RUN"
+    return dict(
+        type="Job", cluster_type="openlava", job_id=1000 + i, array_index=0, user_name=user, name="job%d" % i,
+        command="/home/%s/run.sh %d" % (user, i), cwd="/home/%s/work" % user,
+        queue=dict(type="Queue", name=queue, url="/queues/%s" % queue),
+        submission_host=dict(type="Host", name="login1", url="/hosts/login1"), status=status,
+        options=OPTIONS[:rng.randint(1, len(OPTIONS))], project_names=["default"], submit_time=1400000000 + i,
+        start_time=0, end_time=0, cpu_time=0.0, requested_slots=1, max_requested_slots=1, priority=0,
+        execution_hosts=[dict(type="ExecutionHost", name=host, url="/hosts/%s" % host, num_slots=1)] if running else [],
+        consumed_resources=[], processes=[], runtime_limits=[], pending_reasons="", requested_resources="",
+        output_file_name="/dev/null", error_file_name="/dev/null", input_file_name="/dev/null",
+        is_running=running, is_pending=status['name'] == "JOB_STAT_PEND", is_completed=not running,
+        is_failed=False, is_suspended=False, was_killed=False, email_user="", dependency_condition="", login_shell="",
+        checkpoint_period=0, checkpoint_directory="", termination_signal=0, user_priority=0, service_port=0,
+        process_id=0, parent_group="/", execution_user_name=user, execution_home_directory="/home/%s" % user,
+        execution_cwd="/home/%s/work" % user, execution_user_id=1000, submit_home_directory="/home/%s" % user,
+        host_specification="", pre_execution_command="", resource_usage_last_update_time=0, reservation_time=0,
+        predicted_start_time=0, begin_time=0, termination_time=0, admins=[user], cpu_factor=1.0,
+        url="/job/%d/0" % (1000 + i), requested_hosts=[])
+
+
+class ConnectionArgs(object):
+    """
+    Connection arguments for a :py:class:`FakeServer`, in place of parsed command line arguments.
+
+    """
+
+    def __init__(self, url, unix_socket=None):
+        self.url = url
+        self.unix_socket = unix_socket
+        self.username = "user"
+        self.password = "password"
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def send_envelope(self, data, status="OK", message=""):
+        body = json.dumps({"status": status, "message": message, "data": data})
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path.startswith("/accounts/ajax_login"):
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Set-Cookie", "sessionid=fake; Path=/")
+            self.end_headers()
+            self.wfile.write(json.dumps({"status": "OK", "message": "", "data": {}}))
+        else:
+            self.send_error(404)
+
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        url = urlparse.urlparse(self.path)
+        params = dict(urlparse.parse_qsl(url.query))
+        handler = self.server.routes.get(url.path)
+        if handler is None:
+            self.send_error(404)
+            return
+        handler(self, params)
+
+
+def _jobs(handler, params):
+    handler.send_envelope(handler.server.select(params))
+
+
+def _job_count(handler, params):
+    handler.send_envelope(len(handler.server.select(params)))
+
+
+_summary_fields = {
+    "status": lambda r: [r['status']['name']],
+    "queue": lambda r: [r['queue']['name']],
+    "host_name": lambda r: [h['name'] for h in r['execution_hosts']] or [None],
+}
+
+
+def _job_summary(handler, params):
+    group_by = [f for f in params.get("group_by", "").split(",") if f]
+    metrics = [m for m in params.get("metrics", "count").split(",") if m]
+    groups = {}
+    for record in handler.server.select(params):
+        values = [_summary_fields.get(f, lambda r, f=f: [r.get(f)])(record) for f in group_by]
+        for key in itertools.product(*values):
+            row = groups.setdefault(key, dict.fromkeys(metrics, 0))
+            for metric in metrics:
+                if metric == "count":
+                    row[metric] += 1
+                elif metric == "slots":
+                    row[metric] += record['requested_slots']
+                else:
+                    row[metric] += record.get(metric) or 0
+    handler.send_envelope([{"group": list(k), "metrics": v} for k, v in groups.items()])
+
+
+def _job_changes(handler, params):
+    handler.send_envelope(handler.server.changes(params))
+
+
+def _events(handler, params):
+    # Sends events as a Server-Sent Events stream until the client goes away or the streams are closed.
+    log = handler.server.events
+    types = params.get("types", "").split(",")
+    handler.send_response(200)
+    handler.send_header("Content-Type", "text/event-stream")
+    handler.send_header("Cache-Control", "no-cache")
+    handler.end_headers()
+    handler.wfile.write("retry: %d\n\n" % (log.retry * 1000))
+    handler.wfile.flush()
+    position, generation = log.position(handler.headers.get("Last-Event-ID"))
+    try:
+        while True:
+            events = log.wait(position, generation)
+            if events is None:
+                return
+            for event_id, event_type, data in events:
+                position += 1
+                if event_type in types:
+                    handler.wfile.write("id: %d\nevent: %s\ndata: %s\n\n" % (event_id, event_type, json.dumps(data)))
+            if not events:
+                handler.wfile.write(": keep alive\n\n")
+            handler.wfile.flush()
+    except IOError:
+        pass
+
+
+class EventLog(object):
+    """
+    Events sent on the /events stream of a :py:class:`FakeServer`, kept so that a client that reconnects with
+    Last-Event-ID is sent the events it missed.
+
+    """
+
+    def __init__(self, retry=0.1):
+        #: Seconds the client is told to wait before reconnecting
+        self.retry = retry
+        #: List of (id, type, data) tuples of the events that have been sent
+        self.events = []
+        #: Values of the Last-Event-ID header of each stream that has been opened
+        self.last_event_ids = []
+        self._generation = 0
+        self._condition = threading.Condition()
+
+    def send(self, event_type, data):
+        """
+        Sends an event to every open stream.
+
+        """
+        with self._condition:
+            self.events.append((len(self.events) + 1, event_type, data))
+            self._condition.notify_all()
+
+    def close_streams(self):
+        """
+        Closes every open stream, as a restarting server would.  Events sent afterwards are kept for clients
+        that reconnect.
+
+        """
+        with self._condition:
+            self._generation += 1
+            self._condition.notify_all()
+
+    def position(self, last_event_id):
+        with self._condition:
+            self.last_event_ids.append(last_event_id)
+            position = len(self.events) if last_event_id is None else int(last_event_id)
+            return position, self._generation
+
+    def wait(self, position, generation, timeout=1.0):
+        # Returns the events after position, an empty list on timeout, or None once the streams are closed.
+        with self._condition:
+            if position >= len(self.events) and generation == self._generation:
+                self._condition.wait(timeout)
+            if generation != self._generation:
+                return None
+            return self.events[position:]
+
+
+class FakeServer(object):
+    """
+    Serves generated jobs in a background thread.  Only login, the job listing, /jobs/count, /jobs/summary,
+    /jobs/changes and /events are provided, others can be added to :py:attr:`routes`, and these removed to stand
+    in for an older server.  Jobs are changed with :py:meth:`set_status`, which also sends a job event.
+
+    """
+
+    def __init__(self, jobs=300, seed=1):
+        """
+        :param int jobs: Number of jobs to serve
+        :param int seed: Seed used to generate the jobs, the same seed gives the same jobs
+
+        """
+        rng = random.Random(seed)
+        #: Records of the jobs that are served
+        self.records = [job_record(i, rng) for i in range(jobs)]
+        #: Paths of the GET requests that have been received
+        self.requests = []
+        #: Functions called with the request handler and query parameters, by path
+        self.routes = {"/jobs": _jobs, "/jobs/count": _job_count, "/jobs/summary": _job_summary,
+                       "/jobs/changes": _job_changes, "/events": _events}
+        #: Events sent on /events
+        self.events = EventLog()
+        # Version of the listing when each job last changed, for /jobs/changes.
+        self._version = 0
+        self._changed = dict(((r['job_id'], r['array_index']), 0) for r in self.records)
+        self._server = None
+        self._thread = None
+
+    def select(self, params):
+        """
+        Returns the records that match the user_name, queue_name, host_name, job_name and job_state filters of
+        a job listing.
+
+        """
+        records = self.records
+        if params.get("user_name"):
+            records = [r for r in records if r['user_name'] == params['user_name']]
+        if params.get("queue_name"):
+            records = [r for r in records if r['queue']['name'] == params['queue_name']]
+        if params.get("host_name"):
+            records = [r for r in records if params['host_name'] in [h['name'] for h in r['execution_hosts']]]
+        if params.get("job_name"):
+            records = [r for r in records if r['name'] == params['job_name']]
+        state = params.get("job_state")
+        if state and state != "ALL":
+            states = {"ACT": ("JOB_STAT_RUN", "JOB_STAT_PEND"), "EXIT": ("JOB_STAT_DONE",)}.get(
+                state, ("JOB_STAT_" + state,))
+            records = [r for r in records if r['status']['name'] in states]
+        return records
+
+    def set_status(self, job_id, status_name, array_index=0):
+        """
+        Changes the status of a job and sends a job event.
+
+        :param int job_id: Numeric job id
+        :param str status_name: Name of the new status, for example JOB_STAT_DONE
+        :param int array_index: Array index of the job
+
+        """
+        record = [r for r in self.records if r['job_id'] == job_id and r['array_index'] == array_index][0]
+        previous = record['status']['name']
+        record['status'] = [s for s in STATUSES if s['name'] == status_name][0]
+        record['is_running'] = status_name == "JOB_STAT_RUN"
+        record['is_pending'] = status_name == "JOB_STAT_PEND"
+        record['is_completed'] = status_name == "JOB_STAT_DONE"
+        self._version += 1
+        self._changed[(job_id, array_index)] = self._version
+        self.events.send("job", {"job_id": job_id, "array_index": array_index, "status": status_name,
+                                 "previous_status": previous})
+
+    def changes(self, params):
+        """
+        Returns the /jobs/changes response for the filters and since watermark in params.  Jobs do not leave
+        the listing, so none are removed.
+
+        """
+        records = self.select(params)
+        since = params.get("since")
+        if since is None:
+            added, updated = records, []
+        else:
+            added, updated = [], [r for r in records if self._changed[(r['job_id'], r['array_index'])] > int(since)]
+        return {"added": added, "updated": updated, "removed": [], "watermark": str(self._version),
+                "reset": since is None}
+
+    def start(self, unix_socket=None):
+        """
+        Starts serving on a free TCP port of the loopback interface, or on a unix domain socket.
+
+        :param str unix_socket: Path of the socket, None to use TCP
+        :returns: URL of the server, for a unix domain socket a unix:// URL
+
+        """
+        if unix_socket:
+            if os.path.exists(unix_socket):
+                os.unlink(unix_socket)
+            server = _UnixHTTPServer(unix_socket, _Handler)
+            url = "unix://" + unix_socket
+        else:
+            server = _TCPHTTPServer(("127.0.0.1", 0), _Handler)
+            url = "http://127.0.0.1:%d" % server.server_address[1]
+        server.routes = self.routes
+        server.requests = self.requests
+        server.select = self.select
+        server.changes = self.changes
+        server.events = self.events
+        self._server = server
+        self._thread = threading.Thread(target=server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return url
+
+    def stop(self):
+        """
+        Stops serving.
+
+        """
+        self.events.close_streams()
+        self._server.shutdown()
+        self._server.server_close()
+        if isinstance(self._server, _UnixHTTPServer) and os.path.exists(self._server.server_address):
+            os.unlink(self._server.server_address)
+
+
+class _TCPHTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients such as bjobs | head close the connection before the response has been sent.
+        pass
+
+
+class _UnixHTTPServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    daemon_threads = True
+    handle_error = _TCPHTTPServer.handle_error.im_func
+
+    def get_request(self):
+        sock, address = SocketServer.UnixStreamServer.get_request(self)
+        # BaseHTTPRequestHandler expects a (host, port) address.
+        return sock, ("local", 0)
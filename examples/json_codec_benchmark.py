@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# Copyright 2014 David Irvine
+#
+# This file is part of olwclients
+#
+# olwclients is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or (at
+# your option) any later version.
+#
+# olwclients is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with olwclients. If not, see <http://www.gnu.org/licenses/>.
+"""
+Compares the JSON libraries that JsonCodec can use on a job listing shaped like one from a real server: decoding
+the response with and without an object_hook, encoding it, and a whole Job.get_job_list from a stand-in server.
+Libraries that are not installed are skipped.
+
+    python examples/json_codec_benchmark.py [--jobs 5000] [--repeat 5]
+
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from olwclient import *
+from fakeserver import FakeServer, ConnectionArgs, job_record
+
+parser = argparse.ArgumentParser(description='Compares the JSON libraries used by JsonCodec')
+parser.add_argument("--jobs", type=int, default=5000, help="Number of jobs in the listing")
+parser.add_argument("--repeat", type=int, default=5, help="Number of times each operation is timed, the best is shown")
+args = parser.parse_args()
+
+
+def best(fn):
+    times = []
+    for i in range(args.repeat):
+        start = time.time()
+        fn()
+        times.append(time.time() - start)
+    return min(times)
+
+
+rng = random.Random(1)
+records = [job_record(i, rng) for i in range(args.jobs)]
+body = json.dumps({"status": "OK", "message": "", "data": records})
+hook = lambda obj: obj
+print "%d jobs, %.1f MB" % (args.jobs, len(body) / 1e6)
+
+server = FakeServer(jobs=args.jobs)
+url = server.start()
+try:
+    print "%-12s %12s %12s %12s %12s" % ("library", "decode MB/s", "hook MB/s", "encode MB/s", "list ms")
+    expected = None
+    for name in JsonCodec.libraries:
+        try:
+            codec = JsonCodec(name)
+        except ValueError:
+            print "%-12s not installed" % name
+            continue
+        decoded = codec.loads(body)
+        assert decoded == codec.loads(body, object_hook=hook)
+        if expected is None:
+            expected = decoded
+        assert decoded == expected, name
+        decode = best(lambda: codec.loads(body))
+        hooked = best(lambda: codec.loads(body, object_hook=hook))
+        encode = best(lambda: codec.dumps(expected))
+
+        connection_args = ConnectionArgs(url)
+        connection_args.json_codec = name
+        connection = OpenLavaConnection(connection_args)
+        connection.login()
+        assert len(Job.get_job_list(connection, user_name="all", job_state="ALL")) == args.jobs
+        listing = best(lambda: Job.get_job_list(connection, user_name="all", job_state="ALL"))
+
+        mb = len(body) / 1e6
+        print "%-12s %12.1f %12.1f %12.1f %12.1f %s" % (name, mb / decode, mb / hooked, mb / encode, listing * 1000,
+                                                         codec)
+finally:
+    server.stop()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# Copyright 2014 David Irvine
+#
+# This file is part of olwclients
+#
+# olwclients is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or (at
+# your option) any later version.
+#
+# olwclients is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with olwclients. If not, see <http://www.gnu.org/licenses/>.
+"""
+Checks that http, https and unix:// URLs are sent over a unix domain socket when one is given, then compares
+the time taken by job listings over the socket and over loopback TCP.
+
+    python examples/unix_socket_benchmark.py [--jobs 100] [--requests 200]
+
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from olwclient import *
+from fakeserver import FakeServer, ConnectionArgs
+
+parser = argparse.ArgumentParser(description='Compares job listings over a unix domain socket and loopback TCP')
+parser.add_argument("--jobs", type=int, default=100, help="Number of jobs in each listing")
+parser.add_argument("--requests", type=int, default=200, help="Number of listings to time")
+args = parser.parse_args()
+
+directory = tempfile.mkdtemp()
+path = os.path.join(directory, "olweb.sock")
+unix_server = FakeServer(jobs=args.jobs)
+unix_server.start(unix_socket=path)
+tcp_server = FakeServer(jobs=args.jobs)
+tcp_url = tcp_server.start()
+
+try:
+    # The host names do not resolve, any request that is not sent over the socket fails.
+    for url, unix_socket in [("unix://" + path, None),
+                             ("http://olweb.invalid", path),
+                             ("https://olweb.invalid", path)]:
+        connection = OpenLavaConnection(ConnectionArgs(url, unix_socket))
+        jobs = Job.get_job_list(connection, user_name="all", job_state="ALL")
+        assert len(jobs) == args.jobs, url
+        print "%-24s %d jobs over the socket" % (url, len(jobs))
+
+    for name, connection in [("unix socket", OpenLavaConnection(ConnectionArgs("unix://" + path))),
+                             ("loopback tcp", OpenLavaConnection(ConnectionArgs(tcp_url)))]:
+        connection.login()
+        start = time.time()
+        for i in range(args.requests):
+            Job.get_job_data(connection, user_name="all", job_state="ALL")
+        elapsed = time.time() - start
+        print "%-24s %.2f ms per listing of %d jobs" % (name, elapsed * 1000 / args.requests, args.jobs)
+finally:
+    unix_server.stop()
+    tcp_server.stop()
+    shutil.rmtree(directory)
@@ -18,11 +18,52 @@
 import socket
 import json
 import urllib2
+import httplib
 import cookielib
 import urllib
 import datetime
 import logging
 import tempfile
+import time
+import hmac
+import hashlib
+import urlparse
+import weakref
+import threading
+import bisect
+import functools
+import gc
+import multiprocessing
+import marshal
+import itertools
+import operator
+import re
+import mmap
+import os
+import struct
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    import sqlite3
+except ImportError:
+    sqlite3 = None
+
+try:
+    import simplejson
+except ImportError:
+    simplejson = None
+
+try:
+    import ujson
+    # Earlier versions lose precision when decoding floats.
+    if int(ujson.__version__.split(".")[0]) < 2:
+        ujson = None
+except (ImportError, AttributeError, ValueError):
+    ujson = None
 
 
 class RemoteServerError(Exception):
@@ -41,6 +82,15 @@ class AuthenticationError(RemoteServerError):
     pass
 
 
+class SessionExpiredError(AuthenticationError):
+    """
+    Raised when the server rejects a request made with a session that is no longer valid.  Handled
+    internally by :py:meth:`OpenLavaConnection.open`, which logs in again and retries the request.
+
+    """
+    pass
+
+
 class NoSuchHostError(RemoteServerError):
     """
     Raised when the requested host does not exist in the job scheduling environment, or it is not visible/accessible
@@ -101,6 +151,203 @@ class JobSubmitError(RemoteServerError):
     pass
 
 
+class NotFoundError(RemoteServerError):
+    """
+    Raised when the server has nothing at the requested URL, for example when the URL is wrong or the server
+    is an older version that does not provide the requested API.
+    """
+    pass
+
+
+class WaitTimeoutError(Exception):
+    """
+    Raised when waiting for a job times out.
+    """
+    pass
+
+
+class UnixSocketHTTPConnection(httplib.HTTPConnection):
+    """
+    HTTP connection that talks to a server listening on a unix domain socket.  The host part of the URL is
+    only used for the Host header.
+
+    """
+
+    def __init__(self, host, socket_path=None, **kwargs):
+        httplib.HTTPConnection.__init__(self, host, **kwargs)
+        self.socket_path = socket_path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not socket._GLOBAL_DEFAULT_TIMEOUT:
+            sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        self.sock = sock
+
+
+class UnixSocketHandler(urllib2.HTTPHandler):
+    """
+    urllib2 handler that sends http and https requests over a unix domain socket.  The socket is local
+    so no TLS is used for https URLs.
+
+    """
+    # build_opener always adds the default HTTPSHandler, which would send https requests over TCP.  Handlers with
+    # a lower order are tried first.
+    handler_order = urllib2.HTTPHandler.handler_order - 100
+
+    def __init__(self, socket_path, debuglevel=0):
+        urllib2.HTTPHandler.__init__(self, debuglevel=debuglevel)
+        self.socket_path = socket_path
+
+    def http_open(self, req):
+        return self.do_open(UnixSocketHTTPConnection, req, socket_path=self.socket_path)
+
+    https_open = http_open
+    https_request = urllib2.HTTPHandler.http_request
+
+
+def _interning_object_hook(max_length=64):
+    """
+    Returns a json object_hook that makes repeated string values share one string object, for example the
+    user, queue and host names that are repeated in every record of a job listing.  Strings in lists of
+    strings are shared too, as are the str values simplejson returns for ASCII strings.  Longer strings, such
+    as commands, are rarely repeated and are left alone.  Keys are already shared by the json decoder.
+
+    A new hook is used for each response, so strings are not kept once the response is no longer used.
+
+    :param int max_length: Length of the longest string to share
+    :returns: object_hook function
+
+    """
+    strings = {}
+
+    def hook(obj):
+        for k, v in obj.iteritems():
+            t = type(v)
+            if t is unicode or t is str:
+                if len(v) <= max_length:
+                    obj[k] = strings.setdefault(v, v)
+            elif t is list:
+                for i, item in enumerate(v):
+                    t = type(item)
+                    if (t is unicode or t is str) and len(item) <= max_length:
+                        v[i] = strings.setdefault(item, item)
+        return obj
+    return hook
+
+
+class JsonCodec(object):
+    """
+    Encodes request bodies and decodes responses with the fastest JSON library that is installed.  ujson and
+    simplejson are used when they are available, otherwise the json module from the standard library.
+
+    Responses are normally decoded with an object_hook, which ujson does not support, so they are decoded with
+    simplejson or json.  ujson is used to decode without a hook, and to encode.  Request bodies are encoded
+    without whitespace.
+
+    Each connection has a codec, see :py:attr:`OpenLavaConnection.codec`, created from the name given by
+    --json-codec, that uses only that library.
+
+    Example::
+
+        >>> c.codec = JsonCodec("json")
+        >>> c.codec.dumps({'command': 'sleep 100'})
+        '{"command":"sleep 100"}'
+
+    """
+    #: Names of the libraries that can be used, in order of preference
+    libraries = ("ujson", "simplejson", "json")
+
+    def __init__(self, name=None):
+        """
+        :param str name: Name of the library to use, one of :py:attr:`libraries`, None to use the fastest
+            installed library for each operation.  A library that does not support object_hook is not used to
+            decode with a hook, json is used instead.
+        :raises: ValueError if the library is unknown or not installed
+
+        """
+        modules = {"ujson": ujson, "simplejson": simplejson, "json": json}
+        if name is None:
+            names = self.libraries
+        elif name in modules:
+            if modules[name] is None:
+                raise ValueError("JSON library: %s is not installed" % name)
+            names = (name, "json")
+        else:
+            raise ValueError("Unknown JSON library: %s, expected one of: %s" % (name, ", ".join(self.libraries)))
+        names = [n for n in names if modules[n] is not None]
+        #: Name of the library used to decode without object_hook
+        self.decoder = names[0]
+        #: Name of the library used to decode with object_hook
+        self.hook_decoder = [n for n in names if n != "ujson"][0]
+        #: Name of the library used to encode
+        self.encoder = names[0]
+        self._loads = modules[self.decoder].loads
+        self._hook_loads = modules[self.hook_decoder].loads
+        if self.encoder == "ujson":
+            self._dumps = ujson.dumps
+        else:
+            self._dumps = functools.partial(modules[self.encoder].dumps, separators=(',', ':'))
+
+    def __repr__(self):
+        return "JsonCodec(decoder=%r, hook_decoder=%r, encoder=%r)" % (self.decoder, self.hook_decoder,
+                                                                       self.encoder)
+
+    def loads(self, data, object_hook=None):
+        """
+        Decodes a JSON document.
+
+        :param str data: JSON document
+        :param object_hook: json object_hook called with each decoded object
+        :returns: Decoded document
+        :raises: ValueError if the document is not valid JSON
+
+        """
+        if object_hook is None:
+            return self._loads(data)
+        return self._hook_loads(data, object_hook=object_hook)
+
+    def load(self, fp, object_hook=None):
+        """
+        Decodes a JSON document read from a file like object, such as a response.
+
+        :param fp: File like object to read the document from
+        :param object_hook: json object_hook called with each decoded object
+        :returns: Decoded document
+        :raises: ValueError if the document is not valid JSON
+
+        """
+        return self.loads(fp.read(), object_hook)
+
+    def raw_decoder(self, object_hook=None):
+        """
+        Returns a function that decodes the JSON value that starts at an index of a string, and returns the
+        value and the index after it, as json.JSONDecoder.raw_decode.  Uses the library that decodes with
+        object_hook.
+
+        :param object_hook: json object_hook called with each decoded object
+        :returns: raw_decode function
+
+        """
+        module = simplejson if self.hook_decoder == "simplejson" else json
+        return module.JSONDecoder(object_hook=object_hook).raw_decode
+
+    def dumps(self, obj):
+        """
+        Encodes an object as compact JSON.
+
+        :param obj: Object to encode
+        :returns: JSON document
+        :rtype: str
+
+        """
+        return self._dumps(obj)
+
+
+#: Codec used when no other codec is given, such as by objects that are not attached to a connection
+_default_json_codec = JsonCodec()
+
+
 class OpenLavaConnection(object):
     """
     Connection and authentication handler for dealing with the server.  Subclass this when you
@@ -117,30 +364,64 @@ class OpenLavaConnection(object):
 
         """
 
-        parser.add_argument("url", help="URL of server")
+        parser.add_argument("url", help="URL of server, or unix:///path/to/socket for a local server")
         parser.add_argument("--username", help="Username to use when authenticating")
         parser.add_argument("--password", help="Password to use when authenticating")
+        parser.add_argument("--unix-socket", dest="unix_socket", default=None,
+                            help="Connect to the server through this unix domain socket instead of the network")
+        parser.add_argument("--host-cache-ttl", dest="host_cache_ttl", default=60, type=int,
+                            help="Seconds to keep host information before requesting it again")
+        parser.add_argument("--json-codec", dest="json_codec", default=None, choices=JsonCodec.libraries,
+                            help="JSON library to use, default is the fastest one installed")
 
     def __init__(self, args):
         """Creates a new instance of the connection.
 
+        When args.url is of the form unix:///path/to/socket, or args.unix_socket is set, requests are sent over
+        the unix domain socket.  A unix:// URL assumes the server is at the root of the site, use unix_socket with
+        a normal URL when it is not.
+
+        Hosts loaded through the connection are kept in :py:attr:`host_cache` for args.host_cache_ttl seconds,
+        60 if not set.
+
+        When args.identity_map is True, hosts, queues and users are resolved through an :py:class:`IdentityMap`
+        so that each one is a single object, see :py:attr:`identity_map`.
+
+        Requests and responses are encoded with the JSON library named by args.json_codec, or the fastest one
+        installed, see :py:attr:`codec`.
+
         :param argparse.Namespace args: Arguments required to initialize the connection
         :returns: None
         :rtype:None
 
         """
-        self.username = args.username
-        self.password = args.password
+        self.username = getattr(args, "username", None)
+        self.password = getattr(args, "password", None)
         self.url = args.url
+        self.unix_socket = getattr(args, "unix_socket", None)
+        if self.url.startswith("unix://"):
+            self.unix_socket = self.url[len("unix://"):]
+            self.url = "http://localhost"
         self.url = self.url.rstrip("/")
+        self.host_cache = HostCache(self, ttl=getattr(args, "host_cache_ttl", 60))
+        self.identity_map = IdentityMap() if getattr(args, "identity_map", False) else None
+        self.supports_job_changes = None
+        self.supports_job_summary = None
+        self.supports_job_count = None
+        json_codec = getattr(args, "json_codec", None)
+        #: :py:class:`JsonCodec` used to encode requests and decode responses, may be replaced at any time
+        self.codec = JsonCodec(json_codec) if json_codec else _default_json_codec
         self._csrf_token = None
         self._referer = None
         self._cookies = cookielib.LWPCookieJar()
-        handlers = [
-            urllib2.HTTPHandler(),
-            urllib2.HTTPSHandler(),
-            urllib2.HTTPCookieProcessor(self._cookies)
-        ]
+        if self.unix_socket:
+            handlers = [UnixSocketHandler(self.unix_socket)]
+        else:
+            handlers = [
+                urllib2.HTTPHandler(),
+                urllib2.HTTPSHandler(),
+            ]
+        handlers.append(urllib2.HTTPCookieProcessor(self._cookies))
         self._opener = urllib2.build_opener(*handlers)
         self._opener.addheaders = [('HTTP_X_REQUESTED_WITH', 'XMLHttpRequest'), ('X-Requested-With', 'XMLHttpRequest')]
 
@@ -153,6 +434,7 @@ class OpenLavaConnection(object):
         :rtype: Boolean
 
         """
+        self._cookies.clear_expired_cookies()
         for c in self._cookies:
             if c.name == 'sessionid':
                 return True
@@ -160,38 +442,75 @@ class OpenLavaConnection(object):
 
     def login(self):
         """
-        Logs the user into the server.
+        Logs the user into the server.  Does nothing if the connection is already authenticated, so it is safe
+        to call before every request.
+
+        The CSRF token is not requested here, it is fetched by :py:meth:`open` the first time a request that
+        sends data to the server is made.
 
         :raise: AuthenticationError if the user cannot be authenticated
         """
+        if self.authenticated:
+            return
+
         data = {
             'username': self.username,
             'password': self.password,
         }
-        data = json.dumps(data, sort_keys=True, indent=4)
+        data = self.codec.dumps(data)
         url = self.url + "/accounts/ajax_login"
         req = urllib2.Request(url, data, {'Content-Type': 'application/json'})
-        self._open(req)
+        data = self._open(req)
 
         if not self.authenticated:
-            raise AuthenticationError(data['description'])
+            try:
+                raise AuthenticationError(data['description'])
+            except (KeyError, TypeError):
+                raise AuthenticationError("Unable to authenticate user: %s" % self.username)
+
+    def _get_csrf_token(self):
+        """
+        Requests a CSRF token from the server and adds it to the headers sent with each request.  Only
+        required for requests that send data.
 
+        """
         url = self.url + "/get_token"
         req = urllib2.Request(url, None, {'Content-Type': 'application/json'})
         data = self._open(req)
         self._csrf_token = data['cookie']
-        found = False
-        for h in self._opener.addheaders:
-            if h[0] == 'X-CSRFToken':
-                found = True
-        if not found:
-            self._opener.addheaders.append(('X-CSRFToken', self._csrf_token))
+        headers = [h for h in self._opener.addheaders if h[0] != 'X-CSRFToken']
+        headers.append(('X-CSRFToken', self._csrf_token))
+        self._opener.addheaders = headers
 
-    def _open(self, request):
+    def _reset_session(self):
+        """
+        Forgets the current session and CSRF token so that the next request will log in again.
+
+        """
+        self._cookies.clear()
+        self._csrf_token = None
+        self._opener.addheaders = [h for h in self._opener.addheaders if h[0] != 'X-CSRFToken']
+
+    @staticmethod
+    def _clear_session_headers(request):
+        # urllib2 stores the cookie, CSRF token and referer on the request when it is first sent, and does not
+        # replace headers the request already has, so they are removed before the request is sent again.
+        for name in ('Cookie', 'X-csrftoken', 'Referer'):
+            request.unredirected_hdrs.pop(name, None)
+
+    def _open(self, request, detect_stale_session=False, object_hook=None, decoder=None):
         """
         Open a connection to the server, get and parse the response.
 
         :param request: urllib request object
+        :param bool detect_stale_session:
+
+            When True, a 401 or 403 response received while holding a session raises
+            :py:exc:`SessionExpiredError` instead of the error reported by the server.
+
+        :param object_hook: json object_hook used to decode the response instead of the default string interning
+        :param decoder: :py:class:`DecoderPool` or :py:class:`StreamDecoder` used to decode the response
+
         :return: deserialized response from server.
         :raises: RemoteServerError
         :raises: AuthenticationError
@@ -218,7 +537,10 @@ class OpenLavaConnection(object):
                     raise RemoteServerError(
                         "Expected a content_type of application/json however the header was: %s" % header)
 
-            data = json.load(response)
+            if decoder is not None:
+                data = decoder.load(response, object_hook, codec=self.codec)
+            else:
+                data = self.codec.load(response, object_hook=object_hook or _interning_object_hook())
 
             # Close connection, no longer required.
             response.close()
@@ -242,164 +564,871 @@ class OpenLavaConnection(object):
 
         except urllib2.HTTPError as e:
             if e.code in [400, 401, 403, 404, 500]:
+                body = e.read()
                 # noinspection PyBroadException
                 try:
-                    exception_data = json.load(e)
-                    exception_data = exception_data['data']
-                    for sc in RemoteServerError.__subclasses__():
-                        if sc.__name__ == exception_data['exception_class']:
-                            raise sc(exception_data['message'])
-                    raise RemoteServerError("The operation failed: %s" % exception_data['message'])
+                    exception_data = self.codec.loads(body)['data']
+                    exception_class = exception_data['exception_class']
+                    message = exception_data['message']
                 except Exception:
-                    if e.code == 403 and self.authenticated:
-                        raise PermissionDeniedError("Unknown authentication/authorization failure, check server logs")
-                    elif e.code == 500:
-                        f = tempfile.NamedTemporaryFile(delete=False)
-                        f.write(e.read())
-                        f.close()
-                        raise RemoteServerError("Server returned error 500, output stored in: %s" % f.name)
-                    else:
-                        raise RemoteServerError("Invalid server URL, or misconfigured web server")
+                    exception_class = None
+                    message = None
+
+                if detect_stale_session and e.code in [401, 403] and self.authenticated and \
+                        exception_class in [None, "AuthenticationError"]:
+                    raise SessionExpiredError("Session is no longer valid on the server")
+
+                if exception_class is not None:
+                    for sc in RemoteServerError.__subclasses__():
+                        if sc.__name__ == exception_class:
+                            raise sc(message)
+                    raise RemoteServerError("The operation failed: %s" % message)
+
+                if e.code == 403 and self.authenticated:
+                    raise PermissionDeniedError("Unknown authentication/authorization failure, check server logs")
+                elif e.code == 500:
+                    f = tempfile.NamedTemporaryFile(delete=False)
+                    f.write(body)
+                    f.close()
+                    raise RemoteServerError("Server returned error 500, output stored in: %s" % f.name)
+                elif e.code == 404:
+                    raise NotFoundError("Invalid server URL, or misconfigured web server")
+                else:
+                    raise RemoteServerError("Invalid server URL, or misconfigured web server")
             raise
 
-    def open(self, request):
+    def open(self, request, object_hook=None, decoder=None):
         """
         Authenticates if required using login, then calls _open to make the connection and get the data.
+        Requests that send data to the server also get a CSRF token the first time one is needed.
+
+        If the server rejects the request because the session has expired, the connection logs in again and
+        retries the request once.
 
         :param urllib2.Request request: Request object with appropriate URL configured
+        :param object_hook: json object_hook used to decode the response, for example to process records as
+            they are decoded
+        :param decoder: Decoder used instead of the codec, a :py:class:`DecoderPool` to decode the response in
+            parallel, or a :py:class:`StreamDecoder` to process records as they are received
         :returns: deserialized data returned from server
         :rtype: object
 
         """
-
-        if not self.authenticated:
+        self.login()
+        if request.has_data() and self._csrf_token is None:
+            self._get_csrf_token()
+        try:
+            return self._open(request, detect_stale_session=True, object_hook=object_hook, decoder=decoder)
+        except SessionExpiredError:
+            logging.debug("Session expired, logging in again")
+            self._reset_session()
+            self._clear_session_headers(request)
             self.login()
-        return self._open(request)
+            if request.has_data():
+                self._get_csrf_token()
+            return self._open(request, object_hook=object_hook, decoder=decoder)
 
+    def open_stream(self, request, timeout=None):
+        """
+        Authenticates if required using login, then opens a request whose response is read as it arrives,
+        such as an event stream.  The response is returned unread.
 
-class StatusType(object):
-    def __unicode__(self):
-        return u'%s' % self.friendly
+        As with :py:meth:`open`, if the server rejects the request because the session has expired, the
+        connection logs in again and retries the request once.
 
-    def __repr__(self):
-        return u'%s' % self.name
+        :param urllib2.Request request: Request object with appropriate URL configured
+        :param float timeout: Socket timeout in seconds for reading the response
+        :returns: File like response object
+        :raises: NotFoundError when the server does not provide the URL
+        :raises: RemoteServerError
 
-    def __str__(self):
-        return '%s' % self.friendly
+        """
+        self.login()
+        try:
+            return self._open_stream(request, timeout, detect_stale_session=True)
+        except SessionExpiredError:
+            logging.debug("Session expired, logging in again")
+            self._reset_session()
+            self._clear_session_headers(request)
+            self.login()
+            return self._open_stream(request, timeout)
 
+    def _open_stream(self, request, timeout, detect_stale_session=False):
+        try:
+            if timeout is None:
+                return self._opener.open(request)
+            return self._opener.open(request, timeout=timeout)
+        except urllib2.HTTPError as e:
+            if e.code == 404:
+                raise NotFoundError("Server does not provide: %s" % request.get_full_url())
+            if detect_stale_session and e.code in [401, 403] and self.authenticated:
+                raise SessionExpiredError("Session is no longer valid on the server")
+            if e.code in [401, 403]:
+                raise PermissionDeniedError("Server refused: %s" % request.get_full_url())
+            raise RemoteServerError("Server returned error %s for: %s" % (e.code, request.get_full_url()))
 
-class OpenLavaObject(object):
+
+class TokenOpenLavaConnection(OpenLavaConnection):
     """
-    Base class for OpenLava objects, automatically populates attributes based on values returned from
-    the server.
+    Connection that authenticates every request with an API token instead of a session cookie.  No login or
+    CSRF requests are made, and as no session state is held, any number of processes can share the same
+    token.
+
+    When only a token is given it is sent as a bearer token::
+
+        Authorization: Bearer <token>
+
+    When a token secret is also given, the token is sent as a key id and each request is signed with
+    HMAC-SHA256 over the method, path, timestamp and a hash of the body::
+
+        Authorization: OLWEB-HMAC-SHA256 token=<token>, timestamp=<time>, signature=<hex digest>
+
+    Servers can check signed requests using :py:meth:`verify_signature`.
 
     """
 
-    def __init__(self, connection, data=None):
+    signature_scheme = "OLWEB-HMAC-SHA256"
+
+    @classmethod
+    def configure_argument_list(cls, parser):
+        """Configures an argument parser with the arguments that are required to connect to the server and authenticate.
+
+        :param argparse.ArgumentParser parser: Argument parser that will be used to parse command line arguments
+        :returns: None
+        :rtype: None
+
         """
-        Create a new instance.
+        parser.add_argument("url", help="URL of server, or unix:///path/to/socket for a local server")
+        parser.add_argument("--unix-socket", dest="unix_socket", default=None,
+                            help="Connect to the server through this unix domain socket instead of the network")
+        parser.add_argument("--host-cache-ttl", dest="host_cache_ttl", default=60, type=int,
+                            help="Seconds to keep host information before requesting it again")
+        parser.add_argument("--json-codec", dest="json_codec", default=None, choices=JsonCodec.libraries,
+                            help="JSON library to use, default is the fastest one installed")
+        parser.add_argument("--token", help="API token to use when authenticating")
+        parser.add_argument("--token-secret", dest="token_secret",
+                            help="Secret used to sign requests, when not set the token is sent as a bearer token")
 
-        :param OpenLavaConnection connection:
+    def __init__(self, args):
+        """Creates a new instance of the connection.
 
-            Connection object that will be used to connect to the server and retrieve data.
+        :param argparse.Namespace args: Arguments required to initialize the connection, must have url and token,
+            and may have token_secret.
+        :returns: None
+        :rtype:None
 
-        :param dict data:
+        """
+        OpenLavaConnection.__init__(self, args)
+        self.token = args.token
+        self.token_secret = getattr(args, "token_secret", None)
 
-            Optional dictionary containing pre-retrieved data from the server, this will be populated into
-            the objects data structure
+    @property
+    def authenticated(self):
+        """
+        Always True, each request carries its own credentials.
+
+        :returns: True
+        :rtype: Boolean
 
         """
-        self._connection = connection
-        if data is not None:
-            if not isinstance(data, dict):
-                raise ValueError("Must be a dict")
-            for k, v in data.iteritems():
-                setattr(self, k, v)
+        return True
 
-    def _exec_remote(self, url):
+    def login(self):
         """
-        Open a url on the server, and get the result
+        Does nothing, token connections do not need to log in.
 
-        :param url: URL to open
-        :return: Deserialized JSON response from server as object
         """
-        url = self._connection.url + url
-        req = urllib2.Request(url, None, {'Content-Type': 'application/json'})
-        return self._connection.open(req)
+        pass
 
+    @classmethod
+    def _string_to_sign(cls, method, path, timestamp, body):
+        return "\n".join([method.upper(), path, str(timestamp), hashlib.sha256(body or "").hexdigest()])
 
-class Host(OpenLavaObject):
-    """
-    Retrieve Host information and perform administrative actions on hosts on the cluster.  Hosts are any kind
-    of host associated with the cluster, they may be submit hosts, execution hosts, clients, etc.
+    @classmethod
+    def sign(cls, secret, method, path, timestamp, body=None):
+        """
+        Returns the HMAC-SHA256 signature of a request.
+
+        :param str secret: Token secret
+        :param str method: HTTP method, for example GET
+        :param str path: Path and query string of the request
+        :param int timestamp: Time of the request in seconds since the epoch
+        :param str body: Request body, if any
+        :returns: Hex digest of the signature
+        :rtype: str
 
-    .. py:attribute:: cluster_type
+        """
+        return hmac.new(secret, cls._string_to_sign(method, path, timestamp, body), hashlib.sha256).hexdigest()
 
-        The type of cluster this host object is associated with.
+    @classmethod
+    def verify_signature(cls, header, secret, method, path, body=None, max_skew=300):
+        """
+        Checks the Authorization header of a signed request.
+
+        :param str header: Value of the Authorization header
+        :param str secret: Token secret
+        :param str method: HTTP method of the request
+        :param str path: Path and query string of the request
+        :param str body: Request body, if any
+        :param int max_skew: Maximum age of the request in seconds
+        :returns: The token if the signature is valid, otherwise None
+        :rtype: str
 
-        Example::
+        """
+        scheme, sep, params = header.partition(" ")
+        if scheme != cls.signature_scheme:
+            return None
+        try:
+            params = dict(p.strip().split("=", 1) for p in params.split(","))
+            timestamp = int(params['timestamp'])
+            token = params['token']
+            signature = params['signature']
+        except (KeyError, ValueError):
+            return None
+        if abs(time.time() - timestamp) > max_skew:
+            return None
+        if not hmac.compare_digest(cls.sign(secret, method, path, timestamp, body), signature):
+            return None
+        return token
+
+    def open(self, request, object_hook=None, decoder=None):
+        """
+        Adds the token to the request, then calls _open to make the connection and get the data.
 
-            >>> from olwclient import OpenLavaConnection, Host
-            >>> class ConnectionArgs:
-            ...  username="testuser"
-            ...  password="password"
-            ...  url="http://example.com/olweb/"
-            ...
-            >>> c=OpenLavaConnection(ConnectionArgs)
-            >>> host=Host.get_host_list(c)[0]
-            >>> host.cluster_type
-            u'openlava'
+        :param urllib2.Request request: Request object with appropriate URL configured
+        :param object_hook: json object_hook used to decode the response, see :py:meth:`OpenLavaConnection.open`
+        :param decoder: Decoder used instead of the codec, see :py:meth:`OpenLavaConnection.open`
+        :returns: deserialized data returned from server
+        :rtype: object
 
-    .. py:attribute:: name
+        """
+        self._authorize(request)
+        return self._open(request, object_hook=object_hook, decoder=decoder)
 
-        The host name of the host.
+    def open_stream(self, request, timeout=None):
+        """
+        Adds the token to the request, then opens it and returns the unread response.  See
+        :py:meth:`OpenLavaConnection.open_stream`.
 
-        Example::
+        """
+        self._authorize(request)
+        return self._open_stream(request, timeout)
+
+    def _authorize(self, request):
+        if self.token_secret:
+            url = urlparse.urlparse(request.get_full_url())
+            path = url.path
+            if url.query:
+                path += "?" + url.query
+            timestamp = int(time.time())
+            signature = self.sign(self.token_secret, request.get_method(), path, timestamp, request.get_data())
+            request.add_header("Authorization", "%s token=%s, timestamp=%d, signature=%s" % (
+                self.signature_scheme, self.token, timestamp, signature))
+        else:
+            request.add_header("Authorization", "Bearer %s" % self.token)
 
-            >>> from olwclient import OpenLavaConnection, Host
-            >>> class ConnectionArgs:
-            ...  username="testuser"
-            ...  password="password"
-            ...  url="http://example.com/olweb/"
-            ...
-            >>> c=OpenLavaConnection(ConnectionArgs)
-            >>> host=Host.get_host_list(c)[0]
-            >>> host.name
-            u'...'
 
-        :return: hostname
-        :rtype: str
+class StatusType(object):
+    """
+    Base class for status like objects, such as :py:class:`Status` and :py:class:`JobOption`, where the same
+    few values are repeated across many objects.  Use :py:meth:`get_shared` to get one shared instance for
+    each name on each server instead of creating a new object each time.  Shared instances cannot be modified.
 
-    .. py:attribute:: host_name
+    """
+    __slots__ = ()
 
-        The host name of the host.
+    @classmethod
+    def get_shared(cls, connection, data):
+        """
+        Returns the shared instance with the name given in data for the server of the connection, creating it
+        from data if there is none.
 
-        Example::
+        :param OpenLavaConnection connection: The connection instance to use
+        :param dict data: Data returned from the server
+        :returns: Shared instance
+        :rtype: StatusType
 
-            >>> from olwclient import OpenLavaConnection, Host
-            >>> class ConnectionArgs:
-            ...  username="testuser"
-            ...  password="password"
-            ...  url="http://example.com/olweb/"
-            ...
-            >>> c=OpenLavaConnection(ConnectionArgs)
-            >>> host=Host.get_host_list(c)[0]
-            >>> host.name
-            u'...'
+        """
+        # Servers may describe the same name differently, so instances are only shared between connections to
+        # the same server.
+        key = (getattr(connection, 'url', None), data.get('name'))
+        obj = cls._shared_instances.get(key)
+        if obj is None:
+            obj = cls(connection, data=data)
+            obj._frozen = True
+            cls._shared_instances[key] = obj
+        return obj
+
+    def __setattr__(self, name, value):
+        if getattr(self, '_frozen', False):
+            raise AttributeError("'%s' objects are shared and cannot be modified" % self.__class__.__name__)
+        object.__setattr__(self, name, value)
 
-        :return: hostname
-        :rtype: str
+    def __unicode__(self):
+        return u'%s' % self.friendly
 
-    .. py:attribute:: description
+    def __repr__(self):
+        return u'%s' % self.name
 
-        The description given to the host by the cluster administrators.
+    def __str__(self):
+        return '%s' % self.friendly
 
-        Example::
 
-            >>> from olwclient import OpenLavaConnection, Host
-            >>> class ConnectionArgs:
-            ...  username="testuser"
-            ...  password="password"
+class LazyObjectList(object):
+    """
+    Descriptor for a field holding a list of sub-objects, such as the processes of a job.  The list of
+    dictionaries returned by the server is kept as is, and the sub-objects are only built the first
+    time the field is read.
+
+    :param factory: Callable taking the connection and one dictionary, returning the sub-object.
+
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+        self.name = None
+        self.built = None
+        self.raw = None
+
+    def bind(self, name):
+        """
+        Sets the name of the field, called by the metaclass when the class is created.
+
+        :param str name: Name of the field
+        :returns: Names of the slots used to store the built and raw values
+        :rtype: tuple
+
+        """
+        self.name = name
+        self.built = "_" + name
+        self.raw = "_raw_" + name
+        return self.built, self.raw
+
+    def set_raw(self, instance, value):
+        """
+        Stores the data returned by the server, discarding any sub-objects already built.
+
+        """
+        setattr(instance, self.raw, value)
+        try:
+            delattr(instance, self.built)
+        except AttributeError:
+            pass
+
+    def update(self, instance, value):
+        """
+        Updates the field with new data returned by the server.  Sub-objects that have already been built are
+        kept and updated in place when the number of items is unchanged.
+
+        :returns: True if the field changed
+        :rtype: bool
+
+        """
+        try:
+            built = getattr(instance, self.built)
+        except AttributeError:
+            if getattr(instance, self.raw, None) == value:
+                return False
+            self.set_raw(instance, value)
+            return True
+        if len(built) != len(value):
+            self.set_raw(instance, value)
+            return True
+        changed = False
+        for i, d in enumerate(value):
+            obj = built[i]
+            if isinstance(obj, StatusType) and getattr(obj, '_frozen', False):
+                new = self.factory(instance._connection, d)
+                if new is not obj:
+                    built[i] = new
+                    changed = True
+            elif obj._update(d):
+                changed = True
+        return changed
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        try:
+            return getattr(instance, self.built)
+        except AttributeError:
+            pass
+        raw = getattr(instance, self.raw)
+        connection = instance._connection
+        value = [self.factory(connection, d) for d in raw]
+        setattr(instance, self.built, value)
+        delattr(instance, self.raw)
+        return value
+
+    def __set__(self, instance, value):
+        setattr(instance, self.built, value)
+        try:
+            delattr(instance, self.raw)
+        except AttributeError:
+            pass
+
+
+class IdentityMap(object):
+    """
+    Map of the objects loaded through a connection, keyed on class and name, so that each host, queue or
+    user is represented by one object.  Objects are held by weak reference and are dropped once nothing
+    else refers to them.
+
+    When a connection has an identity map, creating a :py:class:`Host`, :py:class:`Queue` or :py:class:`User`
+    that is already in the map returns the existing object, updated in place with the new data.
+
+    Example::
+
+        >>> c=OpenLavaConnection(ConnectionArgs)
+        >>> c.identity_map = IdentityMap()
+        >>> Host(c, host_name="master") is Host.get_host_list(c)[0]
+        True
+
+    """
+
+    def __init__(self):
+        self._objects = weakref.WeakValueDictionary()
+
+    def get(self, cls, name):
+        """
+        Returns the object of class cls with the given name, or None if there is none.
+
+        :param type cls: Class of the object
+        :param str name: Name of the object
+        :rtype: OpenLavaObject
+
+        """
+        return self._objects.get((cls, name))
+
+    def add(self, obj):
+        """
+        Stores an object, replacing any other object of the same class and name.
+
+        :param OpenLavaObject obj: Object to store
+
+        """
+        self._objects[(obj.__class__, obj.name)] = obj
+
+    def clear(self):
+        """
+        Removes every object from the map.
+
+        """
+        self._objects.clear()
+
+    def __len__(self):
+        return len(self._objects)
+
+
+class _SchemaType(type):
+    """
+    Metaclass for :py:class:`OpenLavaObject`.  Classes that declare a _fields tuple get a __slots__ entry
+    for each field that is not already stored by a base class, so instances carry no per-instance
+    __dict__.  Fields that are :py:class:`LazyObjectList` descriptors are stored in two private slots
+    instead.  Classes that do not declare _fields keep a normal __dict__.  A __weakref__ slot is added
+    when no base class has one, so objects can be held in an :py:class:`IdentityMap`.
+
+    _field_map maps each field to None, or to the descriptor that stores it.  _record_fields lists the same
+    pairs for the fields that are returned by the server, used by :py:meth:`OpenLavaObject.to_record`.
+
+    """
+
+    def __new__(mcs, name, bases, attrs):
+        fields = attrs.get('_fields')
+        if fields is not None and '__slots__' not in attrs:
+            field_map = {}
+            for base in bases:
+                field_map.update(getattr(base, '_field_map', None) or {})
+            slots = []
+            for field in fields:
+                if field in field_map:
+                    continue
+                descriptor = attrs.get(field)
+                if isinstance(descriptor, LazyObjectList):
+                    field_map[field] = descriptor
+                    slots.extend(descriptor.bind(field))
+                else:
+                    field_map[field] = None
+                    slots.append(field)
+            if not any(hasattr(base, '__weakref__') for base in bases):
+                slots.append('__weakref__')
+            attrs['__slots__'] = tuple(slots)
+            attrs['_field_map'] = field_map
+            attrs['_record_fields'] = tuple((f, d) for f, d in field_map.iteritems() if not f.startswith('_'))
+        elif '__slots__' not in attrs:
+            attrs['_field_map'] = None
+        return type.__new__(mcs, name, bases, attrs)
+
+
+_missing = object()
+
+
+def refresh_all(objects):
+    """
+    Refreshes many :py:class:`Job`, :py:class:`Host` or :py:class:`Queue` objects, updating them in place like
+    their refresh methods.  Where possible objects of the same class are fetched with one request, for example
+    all hosts are updated from a single host list.
+
+    Example::
+
+        >>> changes = refresh_all(jobs + hosts)
+        >>> [job for job in jobs if 'status' in changes[job]]
+        [9790]
+
+    :param list objects: Objects to refresh
+    :returns: Dictionary mapping each object to the set of names of the fields that changed
+    :rtype: dict
+
+    """
+    groups = {}
+    for obj in objects:
+        groups.setdefault((obj._connection, obj.__class__), []).append(obj)
+    changes = {}
+    for (connection, cls), group in groups.iteritems():
+        changes.update(cls._refresh_many(connection, group))
+    return changes
+
+
+class OpenLavaObject(object):
+    """
+    Base class for OpenLava objects, automatically populates attributes based on values returned from
+    the server.
+
+    Subclasses declare the fields returned by the server in _fields, these are stored in slots.  Any
+    other values returned by the server are kept in an overflow dictionary and are still available as
+    attributes.
+
+    Subclasses that set _identity_argument to the name of the constructor argument holding the object name
+    are resolved through the identity map of the connection, when it has one.
+
+    """
+    __metaclass__ = _SchemaType
+    _fields = ('_connection', '_extra', 'type', 'url')
+    _identity_argument = None
+
+    def __new__(cls, connection, *args, **kwargs):
+        # When the object is already in the identity map, return it and let __init__ update it in place.
+        identity_map = getattr(connection, 'identity_map', None)
+        if identity_map is not None and cls._identity_argument is not None:
+            name = kwargs.get(cls._identity_argument, args[0] if len(args) > 0 else None)
+            if not name:
+                data = kwargs.get('data', args[1] if len(args) > 1 else None)
+                if isinstance(data, dict):
+                    name = data.get('name')
+            if name:
+                obj = identity_map.get(cls, name)
+                if obj is not None:
+                    return obj
+        return object.__new__(cls)
+
+    def __init__(self, connection, data=None):
+        """
+        Create a new instance.
+
+        :param OpenLavaConnection connection:
+
+            Connection object that will be used to connect to the server and retrieve data.
+
+        :param dict data:
+
+            Optional dictionary containing pre-retrieved data from the server, this will be populated into
+            the objects data structure
+
+        """
+        self._connection = connection
+        self._extra = None
+        if data is not None:
+            if not isinstance(data, dict):
+                raise ValueError("Must be a dict")
+            field_map = self._field_map
+            for k, v in data.iteritems():
+                if field_map is None:
+                    setattr(self, k, v)
+                elif k in field_map:
+                    descriptor = field_map[k]
+                    if descriptor is None:
+                        setattr(self, k, v)
+                    else:
+                        descriptor.set_raw(self, v)
+                else:
+                    if self._extra is None:
+                        self._extra = {}
+                    self._extra[k] = v
+        identity_map = getattr(connection, 'identity_map', None)
+        if identity_map is not None and self._identity_argument is not None:
+            identity_map.add(self)
+
+    def __getattr__(self, name):
+        # Only called when the attribute is not a slot, or the slot is not set.
+        if name != '_extra':
+            extra = self._extra
+            if extra and name in extra:
+                return extra[name]
+        raise AttributeError("'%s' object has no attribute '%s'" % (self.__class__.__name__, name))
+
+    def _update(self, data):
+        """
+        Updates the object in place from data returned by the server, only setting the fields that changed.
+
+        :param dict data: Data returned from the server
+        :returns: Names of the fields that changed
+        :rtype: set
+
+        """
+        changed = set()
+        field_map = self._field_map
+        for k, v in data.iteritems():
+            if field_map is None or (k in field_map and field_map[k] is None):
+                if getattr(self, k, _missing) != v:
+                    setattr(self, k, v)
+                    changed.add(k)
+            elif k in field_map:
+                if field_map[k].update(self, v):
+                    changed.add(k)
+            elif self._extra is None or self._extra.get(k, _missing) != v:
+                if self._extra is None:
+                    self._extra = {}
+                self._extra[k] = v
+                changed.add(k)
+        return changed
+
+    def to_record(self):
+        """
+        Returns the data of the object as a dictionary in the form returned by the server, holding only plain
+        values and no connection, so that it can be pickled, marshalled or sent to another process.  Sub-objects
+        are converted to dictionaries too.  Use :py:meth:`from_record` to create the object again.
+
+        Example::
+
+            >>> record = job.to_record()
+            >>> Job.from_record(c, record).status
+            Running
+
+        :returns: Data of the object
+        :rtype: dict
+
+        """
+        if self._field_map is None:
+            return dict((k, _plain_value(v)) for k, v in self.__dict__.iteritems() if not k.startswith('_'))
+        record = dict(self._extra) if self._extra else {}
+        for field, descriptor in self._record_fields:
+            if descriptor is None:
+                value = getattr(self, field, _missing)
+            else:
+                value = getattr(self, descriptor.raw, _missing)
+                if value is _missing:
+                    value = getattr(self, descriptor.built, _missing)
+            if value is _missing:
+                continue
+            if isinstance(value, (OpenLavaObject, list)):
+                value = _plain_value(value)
+            record[field] = value
+        return record
+
+    @classmethod
+    def from_record(cls, connection, record):
+        """
+        Creates an object from a dictionary returned by :py:meth:`to_record`, attached to a connection.
+
+        :param OpenLavaConnection connection: The connection instance to use, or None to attach one later using
+            :py:meth:`attach`
+        :param dict record: Data returned by :py:meth:`to_record`
+        :rtype: OpenLavaObject
+
+        """
+        return cls(connection, data=dict(record))
+
+    def attach(self, connection):
+        """
+        Attaches the object, and the sub-objects it has built, to a connection, for example after it was
+        unpickled or received from another process.
+
+        :param OpenLavaConnection connection: The connection instance to use
+
+        """
+        self._connection = connection
+        for descriptor in (self._field_map or {}).itervalues():
+            if descriptor is not None:
+                for obj in getattr(self, descriptor.built, None) or []:
+                    if not getattr(obj, '_frozen', False):
+                        obj.attach(connection)
+
+    def __reduce__(self):
+        # Objects are pickled as their record, the connection is not pickled.
+        return _object_from_record, (self.__class__, self.to_record())
+
+    @classmethod
+    def _refresh_many(cls, connection, objects):
+        """
+        Refreshes objects of this class that share a connection, used by :py:func:`refresh_all`.  Subclasses
+        override this to fetch many objects with one request.
+
+        :returns: Dictionary mapping each object to the names of the fields that changed
+        :rtype: dict
+
+        """
+        return dict((obj, obj.refresh()) for obj in objects)
+
+    def _exec_remote(self, url):
+        """
+        Open a url on the server, and get the result
+
+        :param url: URL to open
+        :return: Deserialized JSON response from server as object
+        """
+        url = self._connection.url + url
+        req = urllib2.Request(url, None, {'Content-Type': 'application/json'})
+        return self._connection.open(req)
+
+
+def _plain_value(value):
+    if isinstance(value, OpenLavaObject):
+        return value.to_record()
+    if type(value) is list and value and isinstance(value[0], OpenLavaObject):
+        return [v.to_record() for v in value]
+    return value
+
+
+def _object_from_record(cls, record):
+    return cls.from_record(None, record)
+
+
+_batch_format = "olwclient-objects-1"
+
+
+def dump_objects(objects):
+    """
+    Encodes a list of objects, such as jobs, hosts and queues, into a compact string without their connection,
+    to be sent to another process or cached.  Objects are stored as their :py:meth:`OpenLavaObject.to_record`
+    data, with the field names of records of the same class and fields stored once, using marshal.  The
+    string can only be read by the same version of Python.
+
+    Example::
+
+        >>> data = dump_objects(Job.get_job_list(c, user_name="all"))
+        >>> load_objects(data, c)
+        [9790, 9791]
+
+    :param list objects: Objects to encode
+    :returns: Encoded objects
+    :rtype: str
+
+    """
+    shapes = {}
+    rows = []
+    for obj in objects:
+        record = obj.to_record()
+        key = (obj.__class__.__name__, tuple(record))
+        index = shapes.get(key)
+        if index is None:
+            index = shapes[key] = len(shapes)
+        rows.append((index,) + tuple(record.itervalues()))
+    return marshal.dumps((_batch_format, sorted(shapes, key=shapes.get), rows), 2)
+
+
+def load_objects(data, connection=None):
+    """
+    Decodes objects encoded by :py:func:`dump_objects`, attaching them to a connection.
+
+    :param str data: Encoded objects
+    :param OpenLavaConnection connection: The connection instance to attach the objects to, or None to attach
+        them later using :py:meth:`OpenLavaObject.attach`
+    :returns: Objects in the order they were encoded
+    :rtype: list
+    :raises: ValueError if the data was not encoded by :py:func:`dump_objects`
+
+    """
+    try:
+        batch_format, shapes, rows = marshal.loads(data)
+    except (EOFError, ValueError, TypeError):
+        raise ValueError("Data was not encoded by dump_objects")
+    if batch_format != _batch_format:
+        raise ValueError("Data was not encoded by dump_objects")
+    classes = []
+    for name, keys in shapes:
+        cls = globals().get(name)
+        if not isinstance(cls, type) or not issubclass(cls, OpenLavaObject):
+            raise ValueError("Unknown object class: %s" % name)
+        classes.append((cls, keys))
+    objects = []
+    for row in rows:
+        cls, keys = classes[row[0]]
+        objects.append(cls.from_record(connection, dict(zip(keys, row[1:]))))
+    return objects
+
+
+class Host(OpenLavaObject):
+    """
+    Retrieve Host information and perform administrative actions on hosts on the cluster.  Hosts are any kind
+    of host associated with the cluster, they may be submit hosts, execution hosts, clients, etc.
+
+    .. py:attribute:: cluster_type
+
+        The type of cluster this host object is associated with.
+
+        Example::
+
+            >>> from olwclient import OpenLavaConnection, Host
+            >>> class ConnectionArgs:
+            ...  username="testuser"
+            ...  password="password"
+            ...  url="http://example.com/olweb/"
+            ...
+            >>> c=OpenLavaConnection(ConnectionArgs)
+            >>> host=Host.get_host_list(c)[0]
+            >>> host.cluster_type
+            u'openlava'
+
+    .. py:attribute:: name
+
+        The host name of the host.
+
+        Example::
+
+            >>> from olwclient import OpenLavaConnection, Host
+            >>> class ConnectionArgs:
+            ...  username="testuser"
+            ...  password="password"
+            ...  url="http://example.com/olweb/"
+            ...
+            >>> c=OpenLavaConnection(ConnectionArgs)
+            >>> host=Host.get_host_list(c)[0]
+            >>> host.name
+            u'...'
+
+        :return: hostname
+        :rtype: str
+
+    .. py:attribute:: host_name
+
+        The host name of the host.
+
+        Example::
+
+            >>> from olwclient import OpenLavaConnection, Host
+            >>> class ConnectionArgs:
+            ...  username="testuser"
+            ...  password="password"
+            ...  url="http://example.com/olweb/"
+            ...
+            >>> c=OpenLavaConnection(ConnectionArgs)
+            >>> host=Host.get_host_list(c)[0]
+            >>> host.name
+            u'...'
+
+        :return: hostname
+        :rtype: str
+
+    .. py:attribute:: description
+
+        The description given to the host by the cluster administrators.
+
+        Example::
+
+            >>> from olwclient import OpenLavaConnection, Host
+            >>> class ConnectionArgs:
+            ...  username="testuser"
+            ...  password="password"
             ...  url="http://example.com/olweb/"
             ...
             >>> c=OpenLavaConnection(ConnectionArgs)
@@ -1142,6 +2171,17 @@ class Host(OpenLavaObject):
         :rtype: int
 
 """
+    _fields = (
+        'cluster_type', 'name', 'host_name', 'description', 'load_information', 'admins', 'is_busy', 'is_down',
+        'is_closed', 'has_checkpoint_support', 'host_model', 'host_type', 'resources', 'max_jobs', 'max_processors',
+        'max_ram', 'max_slots', 'max_swap', 'max_tmp', 'num_reserved_slots', 'num_running_jobs', 'num_running_slots',
+        'num_suspended_jobs', 'num_suspended_slots', 'run_windows', 'statuses', 'total_jobs', 'total_slots',
+        'cpu_factor', 'is_server', 'num_disks', 'num_user_suspended_jobs', 'num_user_suspended_slots',
+        'num_system_suspended_jobs', 'num_system_suspended_slots', 'has_kernel_checkpoint_copy', 'max_slots_per_user',
+    )
+    resources = LazyObjectList(lambda connection, d: Resource(connection, data=d))
+    statuses = LazyObjectList(lambda connection, d: Status.get_shared(connection, d))
+    _identity_argument = 'host_name'
 
     def __str__(self):
         return self.host_name
@@ -1171,7 +2211,7 @@ class Host(OpenLavaObject):
         return hosts
 
     @classmethod
-    def get_host_list(cls, connection):
+    def get_host_list(cls, connection, processes=None):
         """
         Get all hosts that are part of the cluster.
 
@@ -1182,17 +2222,25 @@ class Host(OpenLavaObject):
             >>> Host.get_host_list()
             [master, comp00, comp01, comp02, comp03, comp04]
 
+        The hosts are added to the host cache of the connection.
+
+        :param processes: Decode the response using a shared :py:class:`DecoderPool` with this many processes,
+            True for one per core.
         :return: List of :py:class:`cluster.openlavacluster.Host` Objects, one for each host on the cluster.
         :rtype: list
 
         """
         url = connection.url + "/hosts"
         request = urllib2.Request(url, None, {'Content-Type': 'application/json'})
-        try:
+        if processes:
+            data = connection.open(request, decoder=DecoderPool.shared(None if processes is True else processes))
+        else:
             data = connection.open(request)
-            return [Host(connection, data=i) for i in data]
-        except:
-            raise
+        hosts = [Host(connection, data=i) for i in data]
+        now = time.time()
+        for host in hosts:
+            connection.host_cache.add(host, now)
+        return hosts
 
     def __init__(self, connection, host_name=None, data=None):
         """
@@ -1219,8 +2267,35 @@ class Host(OpenLavaObject):
             del(data['jobs'])  # jobs is a method, not a property.
 
         OpenLavaObject.__init__(self, connection, data=data)
-        self.resources = [Resource(self._connection, data=res) for res in self.resources]
-        self.statuses = [Status(self._connection, data=status) for status in self.statuses]
+
+    def _update(self, data):
+        data.pop('jobs', None)
+        return OpenLavaObject._update(self, data)
+
+    def refresh(self):
+        """
+        Gets the current state of the host from the server and updates this object in place.  Sub-objects,
+        such as resources, are kept where possible.
+
+        :returns: Names of the fields that changed
+        :rtype: set
+        :raises: NoSuchHostError when the host no longer exists
+
+        """
+        return self._update(self._exec_remote("/hosts/%s?json=1" % self.host_name))
+
+    @classmethod
+    def _refresh_many(cls, connection, objects):
+        if len(objects) == 1:
+            return OpenLavaObject._refresh_many(connection, objects)
+        url = connection.url + "/hosts"
+        data = connection.open(urllib2.Request(url, None, {'Content-Type': 'application/json'}))
+        by_name = dict((d['name'], d) for d in data)
+        changes = {}
+        for obj in objects:
+            d = by_name.get(obj.host_name)
+            changes[obj] = obj.refresh() if d is None else obj._update(d)
+        return changes
 
     def jobs(self, **kwargs):
         """
@@ -1249,15 +2324,31 @@ class Host(OpenLavaObject):
 
         return Job.get_job_list(self._connection, host_name=self.name, **kwargs)
 
-    def close(self):
+    def count_jobs(self, **kwargs):
         """
-        Closes the host, when a host is closed, it will no longer accept new jobs.
+        Returns the number of matching jobs on the host, without fetching the jobs when the server can count
+        them.  Takes the same arguments as :py:meth:`jobs`, see :py:meth:`Job.count_jobs`.
 
         Example::
 
-            >>> from openlavacluster import Host
-            >>> host=Host.get_host_list()[0]
-            >>> host.close()
+            >>> [host for host in Host.get_host_list(c) if host.count_jobs() == 0]
+            [comp00, comp02]
+
+        :return: Number of jobs
+        :rtype: int
+
+        """
+        return Job.count_jobs(self._connection, host_name=self.name, **kwargs)
+
+    def close(self):
+        """
+        Closes the host, when a host is closed, it will no longer accept new jobs.
+
+        Example::
+
+            >>> from openlavacluster import Host
+            >>> host=Host.get_host_list()[0]
+            >>> host.close()
             Traceback (most recent call last):
               ...
             cluster.PermissionDeniedError: Unable to close host: master: User permission denied
@@ -1308,6 +2399,10 @@ class Status(OpenLavaObject, StatusType):
         Numeric code of the status
 
     """
+    _fields = (
+        'cluster_type', 'name', 'friendly', 'description', 'status', '_frozen',
+    )
+    _shared_instances = {}
 
 
 class User(OpenLavaObject):
@@ -1315,6 +2410,13 @@ class User(OpenLavaObject):
 
 
     """
+    _fields = (
+        'cluster_type', 'name', 'max_jobs', 'max_jobs_per_processor', 'max_slots', 'total_jobs', 'total_slots',
+        'num_pending_jobs', 'num_pending_slots', 'num_running_jobs', 'num_running_slots', 'num_suspended_jobs',
+        'num_suspended_slots', 'num_user_suspended_jobs', 'num_user_suspended_slots', 'num_system_suspended_jobs',
+        'num_system_suspended_slots', 'num_reserved_slots',
+    )
+    _identity_argument = 'user_name'
 
     @classmethod
     def get_user_list(cls, connection):
@@ -1353,7 +2455,7 @@ class User(OpenLavaObject):
         if data['type'] != "User":
             raise ValueError("data is not of type User")
 
-        del data['jobs']  # Handled by method, not returned data.
+        data.pop('jobs', None)  # Handled by method, not returned data.
         OpenLavaObject.__init__(self, connection, data=data)
 
     def __str__(self):
@@ -1384,7 +2486,18 @@ class User(OpenLavaObject):
         :return: List of :py:class:`.Job` objects
 
         """
-        return Job.get_job_list(user_name=self.name, **kwargs)
+        return Job.get_job_list(self._connection, user_name=self.name, **kwargs)
+
+    def count_jobs(self, **kwargs):
+        """
+        Returns the number of matching jobs for this user, without fetching the jobs when the server can count
+        them.  Takes the same arguments as :py:meth:`jobs`, see :py:meth:`Job.count_jobs`.
+
+        :return: Number of jobs
+        :rtype: int
+
+        """
+        return Job.count_jobs(self._connection, user_name=self.name, **kwargs)
 
 
 class Queue(OpenLavaObject):
@@ -1392,6 +2505,21 @@ class Queue(OpenLavaObject):
 
 
     """
+    _fields = (
+        'cluster_type', 'name', 'description', 'admins', 'allowed_users', 'allowed_hosts', 'attributes', 'statuses',
+        'runtime_limits', 'priority', 'nice', 'accept_interval', 'dispatch_windows', 'run_windows',
+        'host_specification', 'max_jobs', 'max_slots', 'max_slots_per_user', 'max_slots_per_host',
+        'max_slots_per_processor', 'total_jobs', 'total_slots', 'num_pending_jobs', 'num_pending_slots',
+        'num_running_jobs', 'num_running_slots', 'num_suspended_jobs', 'num_suspended_slots',
+        'num_user_suspended_jobs', 'num_user_suspended_slots', 'num_system_suspended_jobs',
+        'num_system_suspended_slots', 'num_reserved_slots', 'checkpoint_directory', 'checkpoint_period',
+        'pre_execution_command', 'post_execution_command', 'requeue_exit_values', 'resource_requirements',
+        'scheduling_delay',
+    )
+    attributes = LazyObjectList(lambda connection, d: Status.get_shared(connection, d))
+    statuses = LazyObjectList(lambda connection, d: Status.get_shared(connection, d))
+    runtime_limits = LazyObjectList(lambda connection, d: ResourceLimit(connection, data=d))
+    _identity_argument = 'queue_name'
 
     @classmethod
     def get_queues_by_names(cls, connection, queue_names):
@@ -1445,11 +2573,8 @@ class Queue(OpenLavaObject):
         if data['type'] != "Queue":
             raise ValueError("data is not of type Queue")
 
-        del data['jobs']  # Handled by method, not returned data.
+        data.pop('jobs', None)  # Handled by method, not returned data.
         OpenLavaObject.__init__(self, connection, data=data)
-        self.attributes = [Status(self._connection, data=attr) for attr in self.attributes]
-        self.statuses = [Status(self._connection, data=status) for status in self.statuses]
-        self.runtime_limits = [ResourceLimit(self._connection, data=d) for d in self.runtime_limits]
 
     def __str__(self):
         return "%s" % self.name
@@ -1460,6 +2585,35 @@ class Queue(OpenLavaObject):
     def __repr__(self):
         return self.__str__()
 
+    def _update(self, data):
+        data.pop('jobs', None)
+        return OpenLavaObject._update(self, data)
+
+    def refresh(self):
+        """
+        Gets the current state of the queue from the server and updates this object in place.  Sub-objects,
+        such as runtime limits, are kept where possible.
+
+        :returns: Names of the fields that changed
+        :rtype: set
+        :raises: NoSuchQueueError when the queue no longer exists
+
+        """
+        return self._update(self._exec_remote("/queues/%s" % self.name))
+
+    @classmethod
+    def _refresh_many(cls, connection, objects):
+        if len(objects) == 1:
+            return OpenLavaObject._refresh_many(connection, objects)
+        url = connection.url + "/queues/"
+        data = connection.open(urllib2.Request(url, None, {'Content-Type': 'application/json'}))
+        by_name = dict((d['name'], d) for d in data)
+        changes = {}
+        for obj in objects:
+            d = by_name.get(obj.name)
+            changes[obj] = obj.refresh() if d is None else obj._update(d)
+        return changes
+
     def jobs(self, **kwargs):
         """
         Returns matching jobs on the queue.  By default, returns all jobs that are executing on the queue.
@@ -1479,7 +2633,18 @@ class Queue(OpenLavaObject):
         :return: List of :py:class:`cluster.openlavacluster.Job` objects
 
         """
-        return Job.get_job_list(queue_name=self.name, **kwargs)
+        return Job.get_job_list(self._connection, queue_name=self.name, **kwargs)
+
+    def count_jobs(self, **kwargs):
+        """
+        Returns the number of matching jobs on the queue, without fetching the jobs when the server can count
+        them.  Takes the same arguments as :py:meth:`jobs`, see :py:meth:`Job.count_jobs`.
+
+        :return: Number of jobs
+        :rtype: int
+
+        """
+        return Job.count_jobs(self._connection, queue_name=self.name, **kwargs)
 
     def close(self):
         """
@@ -1540,28 +2705,49 @@ class ExecutionHost(Host):
         :rtype: int
 
     """
+    _fields = (
+        'num_slots_for_job', '_loaded_from_server',
+    )
+    _identity_argument = None  # Slots allocated are specific to the job, so each job has its own object.
 
     def __init__(self, connection, host_name=None, num_slots_for_job=None, data=None):
         if host_name and num_slots_for_job:
             Host.__init__(self, connection, host_name=host_name)
+            self._loaded_from_server = True
             self.num_slots_for_job = num_slots_for_job
         else:
             self._connection = connection
-            self._url = data['url']
+            self._extra = None
+            self.url = data['url']
             self._loaded_from_server = False
             self.host_name = data['name']
             self.name = data['name']
             self.num_slots_for_job = data['num_slots']
 
+    def to_record(self):
+        """
+        Returns the job specific data of the execution host, see :py:meth:`OpenLavaObject.to_record`.  The
+        rest of the host is loaded from the host cache when used.
+
+        :rtype: dict
+
+        """
+        return {'type': "ExecutionHost", 'name': self.name, 'url': self.url, 'num_slots': self.num_slots_for_job}
+
+    def _update(self, data):
+        data = dict(data)
+        if 'num_slots' in data:
+            data['num_slots_for_job'] = data.pop('num_slots')
+        if 'name' in data and 'host_name' not in data:
+            data['host_name'] = data['name']
+        return Host._update(self, data)
+
     def __getattr__(self, name):
-        if self._loaded_from_server:
-            raise AttributeError
-        else:
-            Host.__init__(self, self._connection, host_name=self.name)
-            if hasattr(self, name):
-                return getattr(self, name)
-            else:
-                raise AttributeError
+        # Fields not in the job data are read from the host cache of the connection, so the host is loaded at
+        # most once per cache period no matter how many execution hosts refer to it.
+        if name.startswith('_') or self._loaded_from_server:
+            return Host.__getattr__(self, name)
+        return getattr(self._connection.host_cache.get(self.name), name)
 
     def __str__(self):
         return "%s:%s" % (self.host_name, self.num_slots_for_job)
@@ -1573,6 +2759,128 @@ class ExecutionHost(Host):
         return self.__str__()
 
 
+class HostReference(object):
+    """
+    Reference to a host embedded in other data, such as the submission host of a job.  The name of the host
+    is known without making a request, other attributes and methods are those of the :py:class:`Host` in the
+    host cache of the connection, which is loaded the first time one is used.
+
+    .. py:attribute:: name
+
+        The host name of the host.
+
+    """
+    __slots__ = ('_connection', 'name', 'url')
+
+    def __init__(self, connection, data):
+        """
+        :param OpenLavaConnection connection: The connection instance to use
+        :param dict data: Host data embedded in the parent object, must contain name
+
+        """
+        self._connection = connection
+        self.name = data['name']
+        self.url = data.get('url')
+
+    @property
+    def host_name(self):
+        return self.name
+
+    @property
+    def host(self):
+        """
+        The full :py:class:`Host` object, from the host cache of the connection.
+
+        :rtype: Host
+
+        """
+        return self._connection.host_cache.get(self.name)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError("'%s' object has no attribute '%s'" % (self.__class__.__name__, name))
+        return getattr(self.host, name)
+
+    def __str__(self):
+        return "%s" % self.name
+
+    def __unicode__(self):
+        return u"%s" % self.name
+
+    def __repr__(self):
+        return self.__str__()
+
+
+class HostCache(object):
+    """
+    Per connection cache of :py:class:`Host` objects.  A host is requested from the server at most once every
+    ttl seconds, requests made within that time get the same object.  Each connection has one, available as
+    connection.host_cache.
+
+    Example::
+
+        >>> c=OpenLavaConnection(ConnectionArgs)
+        >>> c.host_cache.get("master")
+        master
+
+    """
+
+    def __init__(self, connection, ttl=60):
+        """
+        :param OpenLavaConnection connection: The connection used to load hosts
+        :param int ttl: Number of seconds a host is kept before it is requested again, 0 disables caching
+
+        """
+        self._connection = connection
+        self.ttl = ttl
+        self._hosts = {}
+
+    def get(self, host_name):
+        """
+        Returns the host, requesting it from the server if it is not cached, or was cached more than ttl
+        seconds ago.
+
+        :param str host_name: Name of the host
+        :returns: Host object
+        :rtype: Host
+        :raises: NoSuchHostError when the host does not exist
+
+        """
+        now = time.time()
+        entry = self._hosts.get(host_name)
+        if entry is not None and entry[0] > now:
+            return entry[1]
+        host = Host(self._connection, host_name=host_name)
+        self.add(host, now)
+        return host
+
+    def add(self, host, now=None):
+        """
+        Stores a host that has been loaded from the server.
+
+        :param Host host: Host to store
+        :param float now: Time the host was loaded, defaults to the current time
+
+        """
+        if self.ttl <= 0:
+            return
+        if now is None:
+            now = time.time()
+        self._hosts[host.host_name] = (now + self.ttl, host)
+
+    def invalidate(self, host_name=None):
+        """
+        Removes a host from the cache, or every host when host_name is None.
+
+        :param str host_name: Name of the host to remove
+
+        """
+        if host_name is None:
+            self._hosts.clear()
+        else:
+            self._hosts.pop(host_name, None)
+
+
 class ResourceLimit(OpenLavaObject):
     """
     Resource limits are limits on the amount of resource usage of a Job, Queue, Host or User.  Resource
@@ -1642,6 +2950,9 @@ class ConsumedResource(OpenLavaObject):
         :rtype: str
 
     """
+    _fields = (
+        'name', 'value', 'limit', 'unit',
+    )
 
     def __str__(self):
         s = "%s: %s" % (self.name, self.value)
@@ -1919,6 +3230,10 @@ class JobOption(OpenLavaObject, StatusType):
           -
 
     """
+    _fields = (
+        'cluster_type', 'name', 'friendly', 'description', 'status', '_frozen',
+    )
+    _shared_instances = {}
 
 
 class Process(OpenLavaObject):
@@ -1941,6 +3256,9 @@ class Process(OpenLavaObject):
         A list of extra field names that are available
 
     """
+    _fields = (
+        'hostname', 'process_id', 'extras',
+    )
 
     def __str__(self):
         return "%s:%s" % (self.hostname, self.process_id)
@@ -3227,6 +4545,33 @@ class Job(OpenLavaObject):
         :rtype: int
 
     """
+    _fields = (
+        'cluster_type', 'array_index', 'job_id', 'admins', 'begin_time', 'command', 'consumed_resources', 'cpu_time',
+        'dependency_condition', 'email_user', 'end_time', 'error_file_name', 'execution_hosts', 'input_file_name',
+        'is_completed', 'was_killed', 'is_failed', 'is_pending', 'is_running', 'is_suspended', 'max_requested_slots',
+        'name', 'options', 'output_file_name', 'pending_reasons', 'predicted_start_time', 'priority', 'process_id',
+        'processes', 'project_names', 'requested_resources', 'requested_slots', 'reservation_time', 'runtime_limits',
+        'start_time', 'status', 'submit_time', 'suspension_reasons', 'termination_time', 'user_name', 'user_priority',
+        'requested_hosts', 'checkpoint_directory', 'checkpoint_period', 'cpu_factor', 'cwd', 'execution_cwd',
+        'execution_home_directory', 'execution_user_id', 'execution_user_name', 'host_specification', 'login_shell',
+        'parent_group', 'pre_execution_command', 'resource_usage_last_update_time', 'service_port',
+        'submit_home_directory', 'termination_signal', '_queue', '_submission_host',
+    )
+    #: Number of distinct job ids above which :py:func:`refresh_all` fetches the whole job list.
+    refresh_list_threshold = 50
+    #: Status names of the jobs that match each job_state of :py:meth:`get_job_list`, None matches any status.
+    job_states = {
+        "ALL": None,
+        "ACT": ("JOB_STAT_PEND", "JOB_STAT_PSUSP", "JOB_STAT_RUN", "JOB_STAT_USUSP", "JOB_STAT_SSUSP"),
+        "PEND": ("JOB_STAT_PEND", "JOB_STAT_PSUSP"),
+        "RUN": ("JOB_STAT_RUN",),
+        "SUSP": ("JOB_STAT_PSUSP", "JOB_STAT_USUSP", "JOB_STAT_SSUSP"),
+        "EXIT": ("JOB_STAT_DONE", "JOB_STAT_EXIT"),
+    }
+    consumed_resources = LazyObjectList(lambda connection, d: ConsumedResource(connection, data=d))
+    execution_hosts = LazyObjectList(lambda connection, d: ExecutionHost(connection, data=d))
+    processes = LazyObjectList(lambda connection, d: Process(connection, data=d))
+    runtime_limits = LazyObjectList(lambda connection, d: ResourceLimit(connection, data=d))
 
     def __repr__(self):
         s = "%s" % self.job_id
@@ -3307,11 +4652,14 @@ class Job(OpenLavaObject):
             >>> job.submission_host
             master
 
-        :return: Submit :py:class:`olwclient.Host` object
-        :rtype: :py:class:`cluster.Host`
+        The name of the host is read from the job data, other attributes are loaded through the host cache of the
+        connection the first time they are used.
+
+        :return: Reference to the submit :py:class:`olwclient.Host`
+        :rtype: :py:class:`HostReference`
 
         """
-        return Host(self._connection, host_name=self._submission_host['name'])
+        return HostReference(self._connection, self._submission_host)
 
     def checkpoint_period_timedelta(self):
         """
@@ -3382,13 +4730,89 @@ class Job(OpenLavaObject):
         del (data['submission_host'])
 
         OpenLavaObject.__init__(self, connection, data=data)
+        self.status = Status.get_shared(connection, self.status)
+        # Options are shared instances, a list of them is smaller than the option data it replaces.
+        if 'options' in data:
+            self.options = [JobOption.get_shared(connection, o) for o in data['options']]
+
+    def to_record(self):
+        """
+        Returns the data of the job as a dictionary in the form returned by the server, see
+        :py:meth:`OpenLavaObject.to_record`.
+
+        :rtype: dict
+
+        """
+        record = OpenLavaObject.to_record(self)
+        record['queue'] = self._queue
+        record['submission_host'] = self._submission_host
+        return record
+
+    def _update(self, data):
+        changed = set()
+        if 'queue' in data:
+            queue = data.pop('queue')
+            if queue != self._queue:
+                self._queue = queue
+                changed.add('queue')
+        if 'submission_host' in data:
+            submission_host = data.pop('submission_host')
+            if submission_host != self._submission_host:
+                self._submission_host = submission_host
+                changed.add('submission_host')
+        if 'status' in data:
+            status = Status.get_shared(self._connection, data.pop('status'))
+            if status is not self.status:
+                self.status = status
+                changed.add('status')
+        if 'options' in data:
+            options = [JobOption.get_shared(self._connection, o) for o in data.pop('options')]
+            if options != getattr(self, 'options', None):
+                self.options = options
+                changed.add('options')
+        changed.update(OpenLavaObject._update(self, data))
+        return changed
+
+    def refresh(self):
+        """
+        Gets the current state of the job from the server and updates this object in place, so references to
+        the job held elsewhere stay valid.  Sub-objects, such as execution hosts, are kept where possible.
+
+        Example::
 
-        self.consumed_resources = [ConsumedResource(self._connection, data=d) for d in self.consumed_resources]
-        self.execution_hosts = [ExecutionHost(self._connection, data=d) for d in self.execution_hosts]
-        self.options = [JobOption(self._connection, data=d) for d in self.options]
-        self.processes = [Process(self._connection, data=d) for d in self.processes]
-        self.status = Status(self._connection, data=self.status)
-        self.runtime_limits = [ResourceLimit(self._connection, data=d) for d in self.runtime_limits]
+            >>> job.refresh()
+            set(['status', 'start_time', 'execution_hosts'])
+
+        :returns: Names of the fields that changed
+        :rtype: set
+        :raises: NoSuchJobError when the job no longer exists
+
+        """
+        url = "/job/%s/%s" % (self.job_id, self.array_index)
+        data = self._exec_remote(url)
+        if not isinstance(data, dict):
+            raise RemoteServerError("Expected a dict from: %s but got a: %s" % (url, type(data)))
+        return self._update(data)
+
+    @classmethod
+    def _refresh_many(cls, connection, objects):
+        # Elements of an array job are fetched together, and when there are many jobs, the whole job list
+        # is fetched once instead.
+        if len(objects) == 1:
+            return OpenLavaObject._refresh_many(connection, objects)
+        job_ids = set(obj.job_id for obj in objects)
+        if len(job_ids) > cls.refresh_list_threshold:
+            data = cls.get_job_data(connection, user_name="all", job_state="ALL")
+        else:
+            data = []
+            for job_id in job_ids:
+                data.extend(cls.get_job_data(connection, job_id=job_id, user_name="all", job_state="ALL"))
+        by_id = dict(((d['job_id'], d['array_index']), d) for d in data)
+        changes = {}
+        for obj in objects:
+            d = by_id.get((obj.job_id, obj.array_index))
+            changes[obj] = obj.refresh() if d is None else obj._update(d)
+        return changes
 
     def kill(self):
         """
@@ -3477,7 +4901,6 @@ class Job(OpenLavaObject):
             a single element.
 
         """
-        connection.login()
         allowed_keys = [
             'options',
             'options2',
@@ -3492,7 +4915,7 @@ class Job(OpenLavaObject):
         for k in kwargs.keys():
             if k not in allowed_keys:
                 raise ValueError("Argument: %s is not valid" % k)
-        data = json.dumps(kwargs, sort_keys=True, indent=4)
+        data = connection.codec.dumps(kwargs)
 
         url = connection.url + "/job/submit"
         request = urllib2.Request(url, data, {'Content-Type': 'application/json'})
@@ -3504,7 +4927,7 @@ class Job(OpenLavaObject):
 
     @classmethod
     def get_job_list(cls, connection, job_id=0, array_index=-1, queue_name=None, host_name=None, user_name="all",
-                     job_state="ACT", job_name=None):
+                     job_state="ACT", job_name=None, where=None, processes=None):
         """
         Returns a list of jobs that match the specified criteria.
 
@@ -3534,41 +4957,3081 @@ class Job(OpenLavaObject):
             Only return jobs in this state, state can be "ACT" - all active jobs, "ALL" - All jobs, including finished
             jobs, "EXIT" - Jobs that have exited due to an error or have been killed by the user or an administator,
             "PEND" - Jobs that are in a pending state, "RUN" - Jobs that are currently running, "SUSP" Jobs that are
-            currently suspended.
+            currently suspended.  By default active jobs are returned.  None sends no job_state, so the server
+            default is used unless where selects statuses.
 
         :param job_name:
             Only return jobs that are named job_name.
 
+        :param where:
+            Only return jobs that match a :py:class:`JobFilter` or filter expression, for example
+            "status in (PEND,RUN) and requested_slots > 16".  The parts of the filter the server supports are sent
+            with the request, the rest is checked before a Job is built for each record.  Statuses in the filter
+            narrow job_state to the smallest state that holds them.
+
+        :param processes:
+            Decode the response using a shared :py:class:`DecoderPool` with this many processes, True for one
+            per core.  Only worthwhile for very large listings.
+
         :return: Array of Job objects.
         :rtype: list
 
         """
+        data = cls.get_job_data(connection, job_id=job_id, array_index=array_index, queue_name=queue_name,
+                                host_name=host_name, user_name=user_name, job_state=job_state, job_name=job_name,
+                                where=where, processes=processes)
+        return [cls(connection, data=i) for i in data]
+
+    @classmethod
+    def get_job_data(cls, connection, job_id=0, array_index=-1, queue_name=None, host_name=None, user_name="all",
+                     job_state="ACT", job_name=None, where=None, processes=None):
+        """
+        Returns the decoded job records that match the specified criteria, without building Job objects.  Takes
+        the same arguments as :py:meth:`get_job_list`.
+
+        :return: List of dictionaries, one per job, as returned by the server.
+        :rtype: list
+
+        """
+        request, predicate = cls._list_request(connection, job_id, array_index, queue_name, host_name, user_name,
+                                               job_state, job_name, where)
+        if request is None:
+            return []
+        if processes:
+            data = connection.open(request, decoder=DecoderPool.shared(None if processes is True else processes))
+        else:
+            data = connection.open(request)
+        if not isinstance(data, list):
+            raise RemoteServerError("Expected: %s to return a list of jobs, not: %s" % (request.get_full_url(),
+                                                                                        type(data)))
+        if predicate is not None:
+            data = [record for record in data if predicate(record)]
+        return data
+
+    @classmethod
+    def stream_job_list(cls, connection, function, job_id=0, array_index=-1, queue_name=None, host_name=None,
+                        user_name="all", job_state="ACT", job_name=None, where=None):
+        """
+        Calls a function with each job that matches the specified criteria, as the jobs are received, without
+        keeping them.  Takes the same arguments as :py:meth:`get_job_list`.  The response is read using a
+        :py:class:`StreamDecoder`, so the first jobs of a large listing are passed to the function while the
+        rest are still being sent, and an exception raised by the function stops the request.
+
+        Example::
+
+            >>> def show(job):
+            ...     print job.job_id, job.status
+            >>> Job.stream_job_list(c, show, job_state="RUN")
+            2
+            8202 Running
+            8203 Running
+
+        :param function: Function called with each :py:class:`Job`
+        :return: Number of jobs passed to the function
+        :rtype: int
+
+        """
+        request, predicate = cls._list_request(connection, job_id, array_index, queue_name, host_name, user_name,
+                                               job_state, job_name, where)
+        if request is None:
+            return 0
+        count = [0]
+
+        def record(data):
+            if type(data) is dict and (predicate is None or predicate(data)):
+                count[0] += 1
+                function(cls(connection, data=data))
+            return None
+
+        data = connection.open(request, decoder=StreamDecoder(record))
+        if not isinstance(data, list):
+            raise RemoteServerError("Expected: %s to return a list of jobs, not: %s" % (request.get_full_url(),
+                                                                                        type(data)))
+        return count[0]
 
+    @classmethod
+    def _list_request(cls, connection, job_id, array_index, queue_name, host_name, user_name, job_state, job_name,
+                      where):
+        if where is not None and not isinstance(where, JobFilter):
+            where = JobFilter(where)
+        predicate = None
         if job_id != 0 and array_index == -1:
             logging.debug("Getting info for elements in job.")
             url = connection.url + "/jobs/%d" % job_id
+            if where is not None:
+                predicate = where.matches
         else:
             logging.debug("Getting info for all jobs")
-            if user_name == "all":
-                user_name = None
-            params = {
-                "queue_name": queue_name,
-                "job_name": job_name,
-                "host_name": host_name,
-                "job_state": job_state,
-                "user_name": user_name,
-            }
-            for k, v in params.items():
-                if v is None:
-                    del (params[k])
+            params, predicate = cls._plan_params(queue_name, host_name, user_name, job_state, job_name, where)
+            if params is None:
+                return None, None
             url = connection.url + "/jobs?" + urllib.urlencode(params)
         logging.debug("Sending request")
-        request = urllib2.Request(url, None, {'Content-Type': 'application/json'})
+        return urllib2.Request(url, None, {'Content-Type': 'application/json'}), predicate
 
-        data = connection.open(request)
+    @classmethod
+    def _plan_params(cls, queue_name, host_name, user_name, job_state, job_name, where):
+        if where is None:
+            return cls._list_params(queue_name, host_name, user_name, job_state, job_name), None
+        plan, predicate = where.plan(queue_name, host_name, user_name, job_state, job_name)
+        if plan is None:
+            return None, None
+        return cls._list_params(**plan), predicate
+
+    @classmethod
+    def _list_params(cls, queue_name, host_name, user_name, job_state, job_name):
+        if user_name == "all":
+            user_name = None
+        params = {
+            "queue_name": queue_name,
+            "job_name": job_name,
+            "host_name": host_name,
+            "job_state": job_state,
+            "user_name": user_name,
+        }
+        for k, v in params.items():
+            if v is None:
+                del (params[k])
+        return params
+
+    @classmethod
+    def summarize(cls, connection, group_by=("status",), metrics=("count", "slots"), queue_name=None,
+                  host_name=None, user_name="all", job_state="ACT", job_name=None, where=None):
+        """
+        Counts the jobs and sums their slots for each combination of values of the group_by fields, without
+        building Job objects.  Takes the same filters as :py:meth:`get_job_list`.
+
+        Fields are named as in :py:class:`JobFilter`.  host_name and project can hold several values, a job is
+        counted once for each of them, and when grouping by host_name, slots are the slots used on each host.
+        Jobs with no value for a field, such as pending jobs grouped by host_name, are grouped under None.
+
+        The server is asked for the summary using /jobs/summary, which returns a list of objects holding the
+        group values in group and the metric values in metrics.  When the server does not provide it, or the
+        filter cannot be sent to the server, the job list is fetched and each record is added to the summary
+        as soon as it is decoded, so the records are not kept.
+
+        Example::
+
+            >>> Job.summarize(c, group_by=["user_name", "status"], where="queue = normal")
+            {(u'irvined', u'JOB_STAT_PEND'): {'count': 4, 'slots': 4},
+             (u'irvined', u'JOB_STAT_RUN'): {'count': 12, 'slots': 48}}
+
+        :param list group_by: Names of the fields to group jobs by
+        :param list metrics: "count" for the number of jobs, "slots" for the number of slots, or the name of
+            any other numeric field to sum, such as cpu_time
+        :returns: Dict mapping a tuple of the group values to a dict of metric values
+        :rtype: dict
+
+        """
+        group_by = list(group_by)
+        metrics = list(metrics)
+        if where is not None and not isinstance(where, JobFilter):
+            where = JobFilter(where)
+        params, predicate = cls._plan_params(queue_name, host_name, user_name, job_state, job_name, where)
+        if params is None:
+            return {}
+        if predicate is None and connection.supports_job_summary is not False:
+            query = dict(params, group_by=",".join(group_by), metrics=",".join(metrics))
+            url = connection.url + "/jobs/summary?" + urllib.urlencode(query)
+            request = urllib2.Request(url, None, {'Content-Type': 'application/json'})
+            try:
+                data = connection.open(request)
+            except NotFoundError:
+                logging.debug("Server does not support job summaries, summarizing job list")
+                connection.supports_job_summary = False
+            else:
+                connection.supports_job_summary = True
+                if not isinstance(data, list):
+                    raise RemoteServerError("Expected: %s to return a list, not: %s" % (url, type(data)))
+                return dict((tuple(row['group']), dict((m, row['metrics'][m]) for m in metrics)) for row in data)
+
+        summary = {}
+        getters = [JobFilter.fields.get(f) or (lambda r, f=f: r.get(f)) for f in group_by]
+        host_column = group_by.index("host_name") if "host_name" in group_by else None
+
+        def add(record):
+            values = [g(record) for g in getters]
+            for key in itertools.product(*[(v or [None]) if isinstance(v, list) else [v] for v in values]):
+                row = summary.get(key)
+                if row is None:
+                    row = summary[key] = dict.fromkeys(metrics, 0)
+                for metric in metrics:
+                    if metric == "count":
+                        row[metric] += 1
+                    elif metric == "slots":
+                        if host_column is not None and key[host_column] is not None:
+                            row[metric] += sum(h.get('num_slots', 1) for h in record['execution_hosts']
+                                               if h['name'] == key[host_column])
+                        else:
+                            row[metric] += record.get('requested_slots') or 0
+                    else:
+                        row[metric] += record.get(metric) or 0
+
+        def hook(obj):
+            # Nested objects are decoded first, so a job record is complete when it reaches the hook.
+            if 'job_id' in obj and 'array_index' in obj:
+                if predicate is None or predicate(obj):
+                    add(obj)
+                return None
+            return obj
+
+        url = connection.url + "/jobs?" + urllib.urlencode(params)
+        request = urllib2.Request(url, None, {'Content-Type': 'application/json'})
+        data = connection.open(request, object_hook=hook)
         if not isinstance(data, list):
             raise RemoteServerError("Expected: %s to return a list of jobs, not: %s" % (url, type(data)))
-        return [cls(connection, data=i) for i in data]
+        return summary
+
+    @classmethod
+    def count_jobs(cls, connection, queue_name=None, host_name=None, user_name="all", job_state="ACT",
+                   job_name=None, where=None):
+        """
+        Returns the number of jobs that match the specified criteria, without fetching the jobs when the server
+        can count them.  Takes the same filters as :py:meth:`get_job_list`.
+
+        The server is asked for the count using /jobs/count.  When the server does not provide it, or the
+        filter cannot be sent to the server, the count is taken from :py:meth:`summarize`, which counts the
+        records of the job list as they are decoded if the server cannot summarize them either.  To count the
+        jobs on many hosts, queues or users, use one call to :py:meth:`summarize` grouped by host_name, queue
+        or user_name instead of one call for each.
+
+        Example::
+
+            >>> Job.count_jobs(c, host_name="comp00")
+            3
+
+        :return: Number of jobs
+        :rtype: int
+
+        """
+        if where is not None and not isinstance(where, JobFilter):
+            where = JobFilter(where)
+        params, predicate = cls._plan_params(queue_name, host_name, user_name, job_state, job_name, where)
+        if params is None:
+            return 0
+        if predicate is None and connection.supports_job_count is not False:
+            url = connection.url + "/jobs/count?" + urllib.urlencode(params)
+            request = urllib2.Request(url, None, {'Content-Type': 'application/json'})
+            try:
+                data = connection.open(request)
+            except NotFoundError:
+                logging.debug("Server does not support job counts, summarizing job list")
+                connection.supports_job_count = False
+            else:
+                connection.supports_job_count = True
+                if not isinstance(data, (int, long)):
+                    raise RemoteServerError("Expected: %s to return a number, not: %s" % (url, type(data)))
+                return data
+        summary = cls.summarize(connection, group_by=(), metrics=("count",), queue_name=queue_name,
+                                host_name=host_name, user_name=user_name, job_state=job_state, job_name=job_name,
+                                where=where)
+        return sum(row['count'] for row in summary.values())
+
+    @classmethod
+    def get_changes(cls, connection, since=None, queue_name=None, host_name=None, user_name="all", job_state="ACT",
+                    job_name=None):
+        """
+        Returns the jobs that were added, updated or removed since an earlier call, so that a poller only
+        downloads and builds the jobs that changed.  Takes the same filters as :py:meth:`get_job_list`, which
+        must be the same on each call.
+
+        The server is asked for the changes using /jobs/changes.  When the server does not provide it, the
+        whole job list is fetched and compared with the previous listing using a fingerprint of each job
+        record, so only the changed jobs are built.  Servers that do not provide it are remembered, and are not
+        asked again on the same connection.
+
+        Example::
+
+            >>> changes = Job.get_changes(c, user_name="all")
+            >>> while True:
+            ...     time.sleep(5)
+            ...     changes = Job.get_changes(c, since=changes.watermark, user_name="all")
+            ...     for job in changes.added + changes.updated:
+            ...         print job, job.status
+
+        :param since: Watermark returned by the previous call, None to get every job as added
+        :returns: Changes since the watermark
+        :rtype: JobChanges
+
+        """
+        params = cls._list_params(queue_name, host_name, user_name, job_state, job_name)
+        if connection.supports_job_changes is not False:
+            if since is None or isinstance(since, basestring):
+                query = dict(params)
+                if since is not None:
+                    query['since'] = since
+                url = connection.url + "/jobs/changes?" + urllib.urlencode(query)
+                request = urllib2.Request(url, None, {'Content-Type': 'application/json'})
+                try:
+                    data = connection.open(request)
+                except NotFoundError:
+                    logging.debug("Server does not support job changes, comparing job lists")
+                    connection.supports_job_changes = False
+                else:
+                    connection.supports_job_changes = True
+                    if not isinstance(data, dict):
+                        raise RemoteServerError("Expected: %s to return a dict, not: %s" % (url, type(data)))
+                    return JobChanges(
+                        added=[cls(connection, data=d) for d in data['added']],
+                        updated=[cls(connection, data=d) for d in data['updated']],
+                        removed=[tuple(k) for k in data['removed']],
+                        watermark=data['watermark'],
+                        reset=data.get('reset', since is None),
+                    )
+
+        records = cls.get_job_data(connection, queue_name=queue_name, host_name=host_name, user_name=user_name,
+                                   job_state=job_state, job_name=job_name)
+        if not isinstance(since, ListingWatermark) or since.params != params:
+            since = None
+        watermark = ListingWatermark(params)
+        added, updated, removed = watermark.diff(since, records)
+        return JobChanges(
+            added=[cls(connection, data=d) for d in added],
+            updated=[cls(connection, data=d) for d in updated],
+            removed=removed,
+            watermark=watermark,
+            reset=since is None,
+        )
+
+
+class JobChanges(object):
+    """
+    Jobs that changed since a watermark, as returned by :py:meth:`Job.get_changes`.
+
+    .. py:attribute:: added
+
+        List of :py:class:`Job` objects that are new since the watermark.
+
+    .. py:attribute:: updated
+
+        List of :py:class:`Job` objects that have changed since the watermark.
+
+    .. py:attribute:: removed
+
+        List of (job_id, array_index) tuples of jobs that no longer match since the watermark.
+
+    .. py:attribute:: watermark
+
+        Opaque value to pass as since to the next call.
+
+    .. py:attribute:: reset
+
+        True when the changes are not relative to a watermark, for example on the first call, or when the
+        watermark has expired.  Every job is then in added, and earlier results should be discarded.
+
+    """
+
+    def __init__(self, added, updated, removed, watermark, reset=False):
+        self.added = added
+        self.updated = updated
+        self.removed = removed
+        self.watermark = watermark
+        self.reset = reset
+
+    def __len__(self):
+        return len(self.added) + len(self.updated) + len(self.removed)
+
+
+class ListingWatermark(object):
+    """
+    Watermark used by :py:meth:`Job.get_changes` when the server cannot report changes itself.  Holds a
+    fingerprint of every record in the last listing, keyed on (job_id, array_index) for jobs, or on the
+    value returned by key for other listings.
+
+    Records are encoded without sorting keys, which is several times faster.  The server sends keys in the
+    same order each time, and if it ever does not, jobs are reported as updated, never missed.
+
+    """
+    _encoder = json.JSONEncoder(separators=(',', ':'))
+
+    def __init__(self, params, key=None):
+        """
+        :param dict params: Filters used to get the listing
+        :param key: Callable returning the key of a record, default is (job_id, array_index)
+
+        """
+        self.params = params
+        self.key = key
+        self.fingerprints = {}
+
+    def diff(self, previous, records):
+        """
+        Fingerprints records, and compares them with the previous watermark.  Must be called before the
+        records are used to build :py:class:`Job` objects, which modify them.
+
+        :param ListingWatermark previous: Watermark of the previous listing, or None
+        :param list records: Job records returned by the server
+        :returns: Tuple of added records, updated records and keys of removed records
+        :rtype: tuple
+
+        """
+        old = previous.fingerprints if previous is not None else {}
+        new = self.fingerprints
+        encode = self._encoder.encode
+        get_key = self.key
+        added = []
+        updated = []
+        for record in records:
+            if get_key is None:
+                key = (record['job_id'], record['array_index'])
+            else:
+                key = get_key(record)
+            fingerprint = hash(encode(record))
+            new[key] = fingerprint
+            old_fingerprint = old.get(key)
+            if old_fingerprint is None:
+                added.append(record)
+            elif old_fingerprint != fingerprint:
+                updated.append(record)
+        removed = [key for key in old if key not in new]
+        return added, updated, removed
+
+
+class JobWaiter(object):
+    """
+    Handle for a job watched by a :py:class:`JobWatcher`, similar to a future.  It completes when the job
+    finishes, with the final :py:class:`Job` as its result.
+
+    .. py:attribute:: job_id
+
+        Numeric job id of the watched job.
+
+    .. py:attribute:: array_index
+
+        Array index of the watched job.
+
+    .. py:attribute:: job
+
+        The most recent :py:class:`Job` object, None until the job has been seen.
+
+    """
+
+    def __init__(self, job_id, array_index=0, on_change=None):
+        self.job_id = job_id
+        self.array_index = array_index
+        self.job = None
+        self._on_change = on_change
+        self._callbacks = []
+        self._exception = None
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return "<JobWaiter %s[%s]>" % (self.job_id, self.array_index)
+
+    def done(self):
+        """
+        True once the job has finished, or cannot be watched.
+
+        :rtype: bool
+
+        """
+        return self._event.is_set()
+
+    def result(self, timeout=None):
+        """
+        Waits for the job to finish and returns it.
+
+        :param float timeout: Number of seconds to wait, None to wait forever
+        :returns: The finished job
+        :rtype: Job
+        :raises: NoSuchJobError if the job does not exist, or was purged before it was seen to finish
+        :raises: WaitTimeoutError if the timeout expires
+
+        """
+        if not self._event.wait(timeout):
+            raise WaitTimeoutError("Timed out waiting for job %s[%s]" % (self.job_id, self.array_index))
+        if self._exception is not None:
+            raise self._exception
+        return self.job
+
+    def exception(self, timeout=None):
+        """
+        Waits for the job to finish and returns the exception that it failed with, or None.
+
+        :param float timeout: Number of seconds to wait, None to wait forever
+        :rtype: Exception
+
+        """
+        if not self._event.wait(timeout):
+            raise WaitTimeoutError("Timed out waiting for job %s[%s]" % (self.job_id, self.array_index))
+        return self._exception
+
+    def add_done_callback(self, fn):
+        """
+        Calls fn with this waiter when the job finishes, or immediately if it already has.
+
+        :param fn: Callable taking the waiter
+
+        """
+        with self._lock:
+            # Checked under the lock so that the callback is not added after _finish has called the others.
+            if not self._event.is_set():
+                self._callbacks.append(fn)
+                return
+        fn(self)
+
+    def _set_job(self, job, old_status):
+        if self.job is None:
+            old_status = None
+        self.job = job
+        if old_status is not None and old_status.name == job.status.name:
+            return False
+        if self._on_change is not None:
+            self._on_change(job, old_status)
+        if job.status.name in JobWatcher.finished_statuses:
+            self._finish()
+        return True
+
+    def _finish(self, exception=None):
+        with self._lock:
+            self._exception = exception
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for fn in callbacks:
+            fn(self)
+
+
+class JobWatcher(object):
+    """
+    Watches any number of jobs for state changes using one request per poll while they are active, however
+    many jobs are watched.  Each poll fetches the active jobs in one listing, of the owner of the watched jobs
+    when they all belong to one user, or the elements of the job when only one job id is watched.  A watched
+    job that is not in the listing has finished or been purged, and is fetched to find out which, on its own
+    or, when many jobs finish together, in one listing of every state.  :py:class:`Job` objects are built only
+    for watched jobs whose status changed.
+
+    The poll interval adapts: it halves when a watched job changes state, grows by backoff when nothing
+    changes, and is shortened to the time left before a running job reaches its run limit.  It is kept
+    between min_interval and max_interval.
+
+    Polls can run in the calling thread using :py:meth:`wait`, or in a background thread using
+    :py:meth:`start`.  Callbacks are called from the thread that polls.
+
+    Example::
+
+        >>> watcher = JobWatcher(c)
+        >>> waiters = [watcher.watch(job.job_id, job.array_index) for job in jobs]
+        >>> watcher.wait()
+        >>> [w.result().status for w in waiters]
+        [Done, Exited]
+
+    """
+    finished_statuses = ("JOB_STAT_DONE", "JOB_STAT_EXIT")
+    run_limit_names = ("Run Limit", "RUNLIMIT")
+
+    def __init__(self, connection, min_interval=1.0, max_interval=60.0, backoff=1.5):
+        """
+        :param OpenLavaConnection connection: The connection instance to use
+        :param float min_interval: Shortest time between polls in seconds
+        :param float max_interval: Longest time between polls in seconds
+        :param float backoff: Factor the interval grows by after a poll with no state changes
+
+        """
+        self._connection = connection
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.interval = min_interval
+        self._waiters = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._stopping = False
+
+    def watch(self, job_id, array_index=0, on_change=None, on_done=None):
+        """
+        Starts watching a job.
+
+        :param int job_id: Numeric job id
+        :param int array_index: Array index of the job
+        :param on_change: Callable taking the job and its previous :py:class:`Status`, called when the job is
+            first seen, with None as the previous status, and on each status change.
+        :param on_done: Callable taking the :py:class:`JobWaiter`, called when the job finishes.
+        :returns: Waiter for the job
+        :rtype: JobWaiter
+
+        """
+        waiter = JobWaiter(int(job_id), int(array_index), on_change=on_change)
+        if on_done is not None:
+            waiter.add_done_callback(on_done)
+        with self._lock:
+            self._waiters.setdefault((waiter.job_id, waiter.array_index), []).append(waiter)
+        # Check new jobs soon, rather than after a long backed off interval.
+        self.interval = self.min_interval
+        self._wakeup.set()
+        return waiter
+
+    def unwatch(self, waiter):
+        """
+        Stops watching a job, the waiter will not complete.
+
+        :param JobWaiter waiter: Waiter returned by :py:meth:`watch`
+
+        """
+        with self._lock:
+            waiters = self._waiters.get((waiter.job_id, waiter.array_index), [])
+            if waiter in waiters:
+                waiters.remove(waiter)
+            if not waiters:
+                self._waiters.pop((waiter.job_id, waiter.array_index), None)
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(w) for w in self._waiters.itervalues())
+
+    def poll(self):
+        """
+        Makes one request, updates every waiter and adjusts the interval.  Watched jobs that have left the
+        active listing are fetched with one more request each, or with one listing of every state when there
+        are more than :py:attr:`Job.refresh_list_threshold` of them.
+
+        :returns: Number of watched jobs that changed state
+        :rtype: int
+
+        """
+        with self._lock:
+            watched = dict((k, list(v)) for k, v in self._waiters.iteritems())
+        if not watched:
+            return 0
+        job_ids = set(k[0] for k in watched)
+        if len(job_ids) == 1:
+            records = self._job_records(job_ids.pop())
+        else:
+            users = set(w[0].job.user_name if w[0].job is not None else None for w in watched.itervalues())
+            user_name = users.pop() if len(users) == 1 and None not in users else "all"
+            records = list(Job.get_job_data(self._connection, user_name=user_name, job_state="ACT"))
+            listed = set((r['job_id'], r['array_index']) for r in records)
+            missing = set(k[0] for k in watched if k not in listed)
+            if len(missing) > Job.refresh_list_threshold:
+                records.extend(r for r in Job.get_job_data(self._connection, user_name=user_name, job_state="ALL")
+                               if r['job_id'] in missing)
+            else:
+                for job_id in missing:
+                    records.extend(self._job_records(job_id))
+
+        changed = 0
+        now = time.time()
+        interval = None
+        for record in records:
+            key = (record['job_id'], record['array_index'])
+            waiters = watched.pop(key, None)
+            if waiters is None:
+                continue
+            job = waiters[0].job
+            if job is None:
+                old_status = None
+                job = Job(self._connection, data=record)
+            else:
+                old_status = job.status
+                job._update(record)
+            for waiter in waiters:
+                if waiter._set_job(job, old_status):
+                    changed += 1
+            if job.status.name not in self.finished_statuses:
+                remaining = self._time_to_run_limit(job, now)
+                if remaining is not None:
+                    interval = remaining if interval is None else min(interval, remaining)
+
+        # Watched jobs that were not in the listing no longer exist.
+        for (job_id, array_index), waiters in watched.iteritems():
+            for waiter in waiters:
+                waiter._finish(NoSuchJobError("Job %s[%s] does not exist" % (job_id, array_index)))
+
+        with self._lock:
+            for key, waiters in self._waiters.items():
+                waiters[:] = [w for w in waiters if not w.done()]
+                if not waiters:
+                    del self._waiters[key]
+
+        if changed:
+            self.interval = max(self.min_interval, self.interval / 2.0)
+        else:
+            self.interval = min(self.max_interval, self.interval * self.backoff)
+        if interval is not None:
+            self.interval = max(self.min_interval, min(self.interval, interval))
+        return changed
+
+    def _job_records(self, job_id):
+        # The elements of one job, none when the job does not exist.
+        try:
+            return Job.get_job_data(self._connection, job_id=job_id)
+        except NoSuchJobError:
+            return []
+
+    def _time_to_run_limit(self, job, now):
+        if not job.start_time:
+            return None
+        for limit in job.runtime_limits:
+            if limit.name in self.run_limit_names:
+                for value in (limit.soft_limit, limit.hard_limit):
+                    if value > 0:
+                        return max(0, job.start_time + value - now)
+        return None
+
+    def wait(self, timeout=None):
+        """
+        Polls in the calling thread until every watched job has finished.
+
+        :param float timeout: Number of seconds to wait, None to wait forever
+        :returns: True if every job finished, False if the timeout expired
+        :rtype: bool
+
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while len(self):
+            self.poll()
+            if not len(self):
+                break
+            delay = self.interval
+            if deadline is not None:
+                delay = min(delay, deadline - time.time())
+                if delay <= 0:
+                    return False
+            time.sleep(delay)
+        return True
+
+    def start(self):
+        """
+        Starts polling in a background daemon thread.  Errors from the server or the network are logged and
+        polling continues.
+
+        """
+        if self._thread is not None:
+            return
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="JobWatcher")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops the background thread started by :py:meth:`start`.
+
+        """
+        self._stopping = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stopping:
+            self._wakeup.clear()
+            if len(self):
+                try:
+                    self.poll()
+                except (RemoteServerError, IOError, httplib.HTTPException, ValueError) as e:
+                    logging.warning("Unable to poll job status: %s" % e)
+                self._wakeup.wait(self.interval)
+            else:
+                self._wakeup.wait()
+
+
+class Event(object):
+    """
+    Change on the cluster delivered by an :py:class:`EventStream`.
+
+    .. py:attribute:: id
+
+        Event id given by the server, None for events found by polling.
+
+    .. py:attribute:: type
+
+        Type of event: job, host or queue, or any other type sent by the server.
+
+    .. py:attribute:: data
+
+        Dictionary describing the change.  Job events have job_id, array_index, status and previous_status,
+        host and queue events have name, statuses and previous_statuses.  Statuses are status names, for
+        example JOB_STAT_RUN.
+
+    """
+    __slots__ = ('id', 'type', 'data')
+
+    def __init__(self, event_id, event_type, data):
+        self.id = event_id
+        self.type = event_type
+        self.data = data
+
+    def __repr__(self):
+        return "<Event %s %s: %r>" % (self.type, self.id, self.data)
+
+
+class EventStream(object):
+    """
+    Receives job, host and queue status changes as they happen, using a Server-Sent Events stream from
+    /events on the server.  The stream is read as events arrive, so changes are delivered with little delay
+    and nothing is requested while the cluster is idle.
+
+    When the stream is interrupted it is reopened, sending the id of the last event received in the
+    Last-Event-ID header so the server can resend events that were missed.  When the server does not provide
+    /events, the stream falls back to polling every poll_interval seconds and reports the status changes it
+    finds, trying the stream again every stream_retry_interval seconds.  Jobs are polled with
+    :py:meth:`Job.get_changes`, so only the jobs that changed are downloaded when the server provides
+    /jobs/changes, and host and queue lists are compared with the previous poll.  Errors
+    while reading the stream or polling are logged and the request is tried again.
+
+    Events can be read by iterating over the stream, which blocks, or passed to callbacks from a background
+    thread using :py:meth:`start`.
+
+    Example::
+
+        >>> stream = EventStream(c, event_types=["job"])
+        >>> for event in stream:
+        ...     print event.data['job_id'], event.data['status']
+        9790 JOB_STAT_RUN
+
+    The server sends each event as JSON data::
+
+        id: 1234
+        event: job
+        data: {"job_id": 9790, "array_index": 0, "status": "JOB_STAT_RUN", "previous_status": "JOB_STAT_PEND"}
+
+    """
+    event_types = ("job", "host", "queue")
+
+    def __init__(self, connection, event_types=None, last_event_id=None, poll_interval=5.0, retry=3.0,
+                 read_timeout=60.0, stream_retry_interval=300.0):
+        """
+        :param OpenLavaConnection connection: The connection instance to use
+        :param list event_types: Types of event to receive, default is job, host and queue
+        :param str last_event_id: Id of the last event already received, to resume from
+        :param float poll_interval: Seconds between polls when the server does not provide /events
+        :param float retry: Seconds to wait before reopening an interrupted stream, the server may change this
+        :param float read_timeout: Seconds without data, including keep alive comments, before the stream is
+            treated as interrupted
+        :param float stream_retry_interval: Seconds between attempts to open the stream again while polling
+
+        """
+        self._connection = connection
+        if event_types is not None:
+            self.event_types = tuple(event_types)
+        self.last_event_id = last_event_id
+        self.poll_interval = poll_interval
+        self.retry = retry
+        self.read_timeout = read_timeout
+        self.stream_retry_interval = stream_retry_interval
+        self.polling = False
+        self._polling_since = None
+        self._callbacks = []
+        self._stopping = False
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._response = None
+        self._job_statuses = None
+        self._job_watermark = None
+        self._host_statuses = None
+        self._queue_statuses = None
+
+    def add_callback(self, fn, event_type=None):
+        """
+        Calls fn with each :py:class:`Event` received by the background thread.
+
+        :param fn: Callable taking the event
+        :param str event_type: Only call fn for events of this type
+
+        """
+        self._callbacks.append((fn, event_type))
+
+    def __iter__(self):
+        while not self._stopping:
+            if self.polling and time.time() - self._polling_since >= self.stream_retry_interval:
+                self.polling = False
+            if self.polling:
+                try:
+                    events = self._poll()
+                except (IOError, httplib.HTTPException, RemoteServerError, ValueError) as e:
+                    logging.warning("Unable to poll for changes: %s" % e)
+                    events = []
+                for event in events:
+                    yield event
+                self._wakeup.wait(self.poll_interval)
+                continue
+            try:
+                for event in self._read_stream():
+                    yield event
+            except NotFoundError:
+                logging.info("Server does not provide an event stream, polling instead")
+                self.polling = True
+                self._polling_since = time.time()
+                continue
+            except (IOError, httplib.HTTPException, RemoteServerError) as e:
+                if self._stopping:
+                    break
+                logging.warning("Event stream interrupted: %s" % e)
+            self._wakeup.wait(self.retry)
+
+    def _read_stream(self):
+        url = self._connection.url + "/events?" + urllib.urlencode({'types': ",".join(self.event_types)})
+        request = urllib2.Request(url, None, {'Accept': 'text/event-stream', 'Cache-Control': 'no-cache'})
+        if self.last_event_id is not None:
+            request.add_header('Last-Event-ID', self.last_event_id)
+        self._response = response = self._connection.open_stream(request, timeout=self.read_timeout)
+        readline = self._line_reader(response)
+        try:
+            event_id = None
+            event_type = "message"
+            data = []
+            while not self._stopping:
+                line = readline()
+                if not line:
+                    break
+                line = line.rstrip("\r\n")
+                if not line:
+                    if data:
+                        if event_id is not None:
+                            self.last_event_id = event_id
+                        value = "\n".join(data)
+                        try:
+                            value = json.loads(value)
+                        except ValueError:
+                            pass
+                        yield Event(event_id, event_type, value)
+                    event_id = None
+                    event_type = "message"
+                    data = []
+                    continue
+                if line.startswith(":"):
+                    continue
+                field, sep, value = line.partition(":")
+                if value.startswith(" "):
+                    value = value[1:]
+                if field == "id":
+                    event_id = value
+                elif field == "event":
+                    event_type = value
+                elif field == "data":
+                    data.append(value)
+                elif field == "retry" and value.isdigit():
+                    self.retry = int(value) / 1000.0
+        finally:
+            self._response = None
+            response.close()
+
+    @staticmethod
+    def _line_reader(response):
+        # urllib2 wraps the HTTPResponse in a buffered file object that waits for 8KB before returning a line,
+        # so lines are read from the HTTPResponse itself to see each event as soon as it arrives.
+        raw = getattr(getattr(response, 'fp', None), '_sock', None)
+        if not isinstance(raw, httplib.HTTPResponse):
+            return response.readline
+        if not raw.chunked and raw.length is None:
+            return raw.fp.readline
+
+        def readline():
+            chars = []
+            while True:
+                c = raw.read(1)
+                if not c:
+                    break
+                chars.append(c)
+                if c == "\n":
+                    break
+            return "".join(chars)
+        return readline
+
+    def _poll(self):
+        events = []
+        if "job" in self.event_types:
+            changes = Job.get_changes(self._connection, since=self._job_watermark, user_name="all",
+                                      job_state="ALL")
+            previous_statuses = self._job_statuses
+            statuses = {} if changes.reset or previous_statuses is None else previous_statuses
+            for job in changes.added + changes.updated:
+                status = job.status.name
+                previous = previous_statuses.get((job.job_id, job.array_index)) if previous_statuses else None
+                statuses[(job.job_id, job.array_index)] = status
+                if previous_statuses is not None and previous != status:
+                    events.append(Event(None, "job", {'job_id': job.job_id, 'array_index': job.array_index,
+                                                      'status': status, 'previous_status': previous}))
+            for key in changes.removed:
+                statuses.pop(key, None)
+            self._job_statuses = statuses
+            self._job_watermark = changes.watermark
+        if "host" in self.event_types:
+            self._host_statuses = self._poll_list("host", "/hosts", self._host_statuses, events)
+        if "queue" in self.event_types:
+            self._queue_statuses = self._poll_list("queue", "/queues/", self._queue_statuses, events)
+        return events
+
+    def _poll_list(self, event_type, path, previous, events):
+        request = urllib2.Request(self._connection.url + path, None, {'Content-Type': 'application/json'})
+        statuses = {}
+        for d in self._connection.open(request):
+            statuses[d['name']] = [s['name'] for s in d['statuses']]
+        if previous is not None:
+            for name, status in statuses.iteritems():
+                if previous.get(name) != status:
+                    events.append(Event(None, event_type, {'name': name, 'statuses': status,
+                                                           'previous_statuses': previous.get(name)}))
+        return statuses
+
+    def start(self):
+        """
+        Starts reading events in a background daemon thread, passing each one to the callbacks.
+
+        """
+        if self._thread is not None:
+            return
+        self._stopping = False
+        self._wakeup.clear()
+        self._thread = threading.Thread(target=self._run, name="EventStream")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops reading events.  An iterator in another thread stops after the current event, or when the read
+        timeout expires.
+
+        """
+        self._stopping = True
+        self._wakeup.set()
+        response = self._response
+        if response is not None:
+            try:
+                response.close()
+            except (IOError, AttributeError):
+                pass
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(self.read_timeout)
+            self._thread = None
+
+    def _run(self):
+        for event in self:
+            for fn, event_type in self._callbacks:
+                if event_type is None or event_type == event.type:
+                    try:
+                        fn(event)
+                    except Exception:
+                        logging.exception("Event callback failed")
+
+
+class ClusterMirror(object):
+    """
+    Local replica of the jobs, hosts, queues and users on the cluster, so that lookups are answered without
+    a request to the server.  The replica is synchronised every interval seconds by a background thread
+    started with :py:meth:`start`.  Jobs are synchronised with :py:meth:`Job.get_changes`, and hosts, queues
+    and users are listed and compared with the previous listing, so only changed objects are rebuilt.
+
+    Each lookup takes a max_age in seconds.  When the replica of that type is older, it is synchronised
+    before the lookup is answered, otherwise the local copy is used.  A max_age of None accepts any age.
+
+    Objects in the replica are replaced, not modified, when they change, so an object returned by a lookup
+    is a consistent snapshot that is safe to read while the replica is updated.  The exception is hosts, queues
+    and users when the connection has an :py:attr:`OpenLavaConnection.identity_map`: each of those is a single
+    object shared with the rest of the connection, and is updated in place when it changes.
+
+    Example::
+
+        >>> mirror = ClusterMirror(c, interval=5)
+        >>> mirror.start()
+        >>> mirror.get_job(9790, max_age=10).status
+        Running
+        >>> len(mirror.jobs(status="JOB_STAT_PEND", queue_name="normal"))
+        24
+        >>> mirror.stats()['job']
+        {'count': 311, 'age': 1.2, 'sync_latency': 0.4}
+
+    .. py:attribute:: synced_at
+
+        Dictionary mapping each type to the time its last synchronisation started, None if it has not been
+        synchronised.
+
+    .. py:attribute:: sync_latency
+
+        Dictionary mapping each type to the number of seconds its last synchronisation took.
+
+    """
+    types = ("job", "host", "queue", "user")
+    _list_types = {
+        "host": ("/hosts", Host, NoSuchHostError),
+        "queue": ("/queues/", Queue, NoSuchQueueError),
+        "user": ("/users/", User, NoSuchUserError),
+    }
+
+    def __init__(self, connection, interval=10.0, types=None, job_state="ALL"):
+        """
+        :param OpenLavaConnection connection: The connection instance to use
+        :param float interval: Seconds between synchronisations by the background thread
+        :param list types: Types to replicate, default is job, host, queue and user
+        :param str job_state: State of jobs to replicate, as for :py:meth:`Job.get_job_list`
+
+        """
+        self._connection = connection
+        self.interval = interval
+        if types is not None:
+            self.types = tuple(types)
+        self.job_state = job_state
+        self._objects = dict((t, {}) for t in self.types)
+        self._watermarks = dict((t, None) for t in self.types)
+        self.synced_at = dict((t, None) for t in self.types)
+        self.sync_latency = dict((t, None) for t in self.types)
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._stopping = False
+
+    def sync(self, types=None, max_age=None):
+        """
+        Synchronises the replica with the server.
+
+        :param list types: Types to synchronise, default is every type
+        :param float max_age: Only synchronise types whose replica is older than this
+
+        """
+        for t in types or self.types:
+            with self._sync_lock:
+                # Another thread may have synchronised while this one waited for the lock.
+                age = self.age(t)
+                if max_age is not None and age is not None and age <= max_age:
+                    continue
+                started = time.time()
+                if t == "job":
+                    self._sync_jobs()
+                else:
+                    self._sync_list(t)
+                self.synced_at[t] = started
+                self.sync_latency[t] = time.time() - started
+
+    def _sync_jobs(self):
+        changes = Job.get_changes(self._connection, since=self._watermarks["job"], user_name="all",
+                                  job_state=self.job_state)
+        with self._lock:
+            objects = {} if changes.reset else self._objects["job"]
+            for job in changes.added:
+                objects[(job.job_id, job.array_index)] = job
+            for job in changes.updated:
+                objects[(job.job_id, job.array_index)] = job
+            for key in changes.removed:
+                objects.pop(key, None)
+            self._objects["job"] = objects
+            self._watermarks["job"] = changes.watermark
+
+    def _sync_list(self, t):
+        path, cls, error = self._list_types[t]
+        request = urllib2.Request(self._connection.url + path, None, {'Content-Type': 'application/json'})
+        records = self._connection.open(request)
+        if not isinstance(records, list):
+            raise RemoteServerError("Invalid data returned from server")
+        previous = self._watermarks[t]
+        watermark = ListingWatermark({}, key=lambda r: r['name'])
+        added, updated, removed = watermark.diff(previous, records)
+        with self._lock:
+            objects = {} if previous is None else self._objects[t]
+            for record in added + updated:
+                obj = cls(self._connection, data=record)
+                objects[obj.name] = obj
+            for name in removed:
+                objects.pop(name, None)
+            self._objects[t] = objects
+            self._watermarks[t] = watermark
+
+    def age(self, t=None):
+        """
+        Returns the age of the replica in seconds, the time since the synchronisation of the oldest type started.
+
+        :param str t: Type to check, default is every type
+        :returns: Age in seconds, or None if it has not been synchronised
+        :rtype: float
+
+        """
+        synced = [self.synced_at[t]] if t else self.synced_at.values()
+        if None in synced:
+            return None
+        return time.time() - min(synced)
+
+    def stats(self):
+        """
+        Returns the number of objects, age and last synchronisation time of each type.
+
+        :rtype: dict
+
+        """
+        return dict((t, {
+            'count': len(self._objects[t]),
+            'age': self.age(t),
+            'sync_latency': self.sync_latency[t],
+        }) for t in self.types)
+
+    def _current(self, t, max_age):
+        if self.synced_at[t] is None:
+            self.sync([t])
+        elif max_age is not None:
+            self.sync([t], max_age=max_age)
+        return self._objects[t]
+
+    def get_job(self, job_id, array_index=0, max_age=None):
+        """
+        Returns a job from the replica.
+
+        :param int job_id: Numeric job id
+        :param int array_index: Array index of the job
+        :param float max_age: Largest acceptable age of the replica in seconds
+        :rtype: Job
+        :raises: NoSuchJobError if the job is not in the replica
+
+        """
+        job = self._current("job", max_age).get((int(job_id), int(array_index)))
+        if job is None:
+            raise NoSuchJobError("Job %s[%s] does not exist" % (job_id, array_index))
+        return job
+
+    def _get(self, t, name, max_age):
+        obj = self._current(t, max_age).get(name)
+        if obj is None:
+            raise self._list_types[t][2]("%s %s does not exist" % (t.capitalize(), name))
+        return obj
+
+    def get_host(self, host_name, max_age=None):
+        """
+        Returns a host from the replica.
+
+        :param str host_name: Name of the host
+        :param float max_age: Largest acceptable age of the replica in seconds
+        :rtype: Host
+        :raises: NoSuchHostError if the host is not in the replica
+
+        """
+        return self._get("host", host_name, max_age)
+
+    def get_queue(self, queue_name, max_age=None):
+        """
+        Returns a queue from the replica.
+
+        :param str queue_name: Name of the queue
+        :param float max_age: Largest acceptable age of the replica in seconds
+        :rtype: Queue
+        :raises: NoSuchQueueError if the queue is not in the replica
+
+        """
+        return self._get("queue", queue_name, max_age)
+
+    def get_user(self, user_name, max_age=None):
+        """
+        Returns a user from the replica.
+
+        :param str user_name: Name of the user
+        :param float max_age: Largest acceptable age of the replica in seconds
+        :rtype: User
+        :raises: NoSuchUserError if the user is not in the replica
+
+        """
+        return self._get("user", user_name, max_age)
+
+    def jobs(self, max_age=None, user_name=None, queue_name=None, status=None):
+        """
+        Returns jobs from the replica.
+
+        :param float max_age: Largest acceptable age of the replica in seconds
+        :param str user_name: Only return jobs belonging to this user
+        :param str queue_name: Only return jobs in this queue
+        :param str status: Only return jobs with this status name, for example JOB_STAT_RUN
+        :rtype: list
+
+        """
+        objects = self._current("job", max_age)
+        with self._lock:
+            jobs = objects.values()
+        if user_name is not None:
+            jobs = [j for j in jobs if j.user_name == user_name]
+        if queue_name is not None:
+            jobs = [j for j in jobs if j.queue == queue_name]
+        if status is not None:
+            jobs = [j for j in jobs if j.status.name == status]
+        return jobs
+
+    def hosts(self, max_age=None):
+        """
+        Returns every host in the replica.
+
+        :param float max_age: Largest acceptable age of the replica in seconds
+        :rtype: list
+
+        """
+        return self._current("host", max_age).values()
+
+    def queues(self, max_age=None):
+        """
+        Returns every queue in the replica.
+
+        :param float max_age: Largest acceptable age of the replica in seconds
+        :rtype: list
+
+        """
+        return self._current("queue", max_age).values()
+
+    def users(self, max_age=None):
+        """
+        Returns every user in the replica.
+
+        :param float max_age: Largest acceptable age of the replica in seconds
+        :rtype: list
+
+        """
+        return self._current("user", max_age).values()
+
+    def start(self):
+        """
+        Starts synchronising the replica every interval seconds in a background daemon thread.  Errors from
+        the server or the network are logged, and the replica is left as it was.
+
+        """
+        if self._thread is not None:
+            return
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="ClusterMirror")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops the background thread started by :py:meth:`start`.
+
+        """
+        self._stopping = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stopping:
+            for t in self.types:
+                try:
+                    self.sync([t])
+                except (RemoteServerError, IOError, httplib.HTTPException, ValueError) as e:
+                    logging.warning("Unable to synchronise %s replica: %s" % (t, e))
+            self._wakeup.wait(self.interval)
+
+
+def _execution_host_names(job):
+    # Read the host names from the job data when the ExecutionHost objects have not been built.
+    raw = getattr(job, '_raw_execution_hosts', None)
+    if raw is not None:
+        return [h['name'] for h in raw]
+    return [h.name for h in job.execution_hosts]
+
+
+class JobIndex(object):
+    """
+    Indexed set of :py:class:`Job` objects for answering queries without scanning every job.  Hash indexes
+    are kept on user_name, queue, status, host_name (the execution hosts) and project, and sorted indexes on
+    submit_time and start_time.  Queries intersect the indexes, starting with the smallest.
+
+    The index is updated as jobs are added, changed or removed, and can apply the result of
+    :py:meth:`Job.get_changes` directly.  It is not thread safe.
+
+    Example::
+
+        >>> index = JobIndex(Job.get_job_list(c, user_name="all", job_state="ALL"))
+        >>> index.query(user_name="irvined", host_name="comp00", queue="normal")
+        [9790, 9791]
+        >>> index.count(status=["JOB_STAT_PEND", "JOB_STAT_RUN"], submit_time=(time.time() - 3600, None))
+        12
+
+    .. py:attribute:: hash_fields
+
+        Names of the hash indexed fields, and functions that return the values of the field for a job.
+
+    .. py:attribute:: sorted_fields
+
+        Names of the sorted fields, which are numeric job attributes.
+
+    """
+    hash_fields = (
+        ('user_name', lambda job: (job.user_name,)),
+        ('queue', lambda job: (job.queue,)),
+        ('status', lambda job: (job.status.name,)),
+        ('host_name', _execution_host_names),
+        ('project', lambda job: job.project_names),
+    )
+    sorted_fields = ('submit_time', 'start_time')
+
+    def __init__(self, jobs=()):
+        """
+        :param list jobs: Jobs to index, for example the result of :py:meth:`Job.get_job_list`
+
+        """
+        self._jobs = {}
+        self._values = {}
+        self._hash = dict((name, {}) for name, getter in self.hash_fields)
+        self._sorted = dict((name, []) for name in self.sorted_fields)
+        for job in jobs:
+            self._add(job, sort=False)
+        for entries in self._sorted.itervalues():
+            entries.sort()
+
+    def __len__(self):
+        return len(self._jobs)
+
+    def __contains__(self, job):
+        return self._key(job) in self._jobs
+
+    def __iter__(self):
+        return self._jobs.itervalues()
+
+    @staticmethod
+    def _key(job):
+        if isinstance(job, tuple):
+            return job
+        return job.job_id, job.array_index
+
+    def get(self, job_id, array_index=0):
+        """
+        Returns the job with the given id, or None if it is not in the index.
+
+        :rtype: Job
+
+        """
+        return self._jobs.get((job_id, array_index))
+
+    def add(self, job):
+        """
+        Adds a job, replacing any job with the same job id and array index, for example after it has changed.
+
+        :param Job job: Job to add
+
+        """
+        self._add(job, sort=True)
+
+    def _add(self, job, sort):
+        # When the job is already indexed, only the index entries whose values changed are updated.
+        key = self._key(job)
+        old = self._values.get(key)
+        self._jobs[key] = job
+        values = {}
+        for name, getter in self.hash_fields:
+            values[name] = job_values = tuple(getter(job))
+            old_values = old[name] if old is not None else ()
+            if job_values != old_values:
+                self._unindex(name, old_values, key)
+                index = self._hash[name]
+                for value in job_values:
+                    keys = index.get(value)
+                    if keys is None:
+                        index[value] = keys = set()
+                    keys.add(key)
+        for name in self.sorted_fields:
+            values[name] = value = getattr(job, name)
+            if old is not None:
+                if old[name] == value:
+                    continue
+                self._unsort(name, old[name], key)
+            if sort:
+                bisect.insort(self._sorted[name], (value, key))
+            else:
+                self._sorted[name].append((value, key))
+        self._values[key] = values
+
+    def _unindex(self, name, values, key):
+        index = self._hash[name]
+        # Values can repeat, for example a host listed once for each slot, and are only indexed once.
+        for value in set(values):
+            keys = index.get(value)
+            if keys is None:
+                continue
+            keys.discard(key)
+            if not keys:
+                del index[value]
+
+    def _unsort(self, name, value, key):
+        entries = self._sorted[name]
+        i = bisect.bisect_left(entries, (value, key))
+        if i < len(entries) and entries[i][1] == key:
+            del entries[i]
+
+    def remove(self, job):
+        """
+        Removes a job, does nothing if it is not in the index.
+
+        :param job: Job, or (job_id, array_index) tuple
+
+        """
+        key = self._key(job)
+        if self._jobs.pop(key, None) is None:
+            return
+        values = self._values.pop(key)
+        for name, getter in self.hash_fields:
+            self._unindex(name, values[name], key)
+        for name in self.sorted_fields:
+            self._unsort(name, values[name], key)
+
+    def apply_changes(self, changes):
+        """
+        Updates the index with the result of :py:meth:`Job.get_changes`.
+
+        :param JobChanges changes: Changes to apply
+
+        """
+        if changes.reset:
+            self.__init__(changes.added + changes.updated)
+            return
+        for job in changes.added:
+            self.add(job)
+        for job in changes.updated:
+            self.add(job)
+        for key in changes.removed:
+            self.remove(key)
+
+    def _keys(self, predicates):
+        hash_sets = []
+        ranges = []
+        for name, value in predicates.iteritems():
+            if name in self._hash:
+                index = self._hash[name]
+                if isinstance(value, (list, tuple, set, frozenset)):
+                    keys = set()
+                    for v in value:
+                        keys.update(index.get(v, ()))
+                else:
+                    keys = index.get(value, frozenset())
+                hash_sets.append(keys)
+            elif name in self._sorted:
+                ranges.append((name, value[0], value[1]))
+            else:
+                raise ValueError("Field is not indexed: %s" % name)
+        if not hash_sets and not ranges:
+            return set(self._jobs)
+        if len(hash_sets) == 1 and not ranges:
+            return hash_sets[0]
+
+        if hash_sets:
+            hash_sets.sort(key=len)
+            keys = set(hash_sets[0])
+            for other in hash_sets[1:]:
+                if not keys:
+                    break
+                keys.intersection_update(other)
+        else:
+            # Use the narrowest range to get the candidates.
+            slices = [(self._range(*r), r) for r in ranges]
+            slices.sort(key=lambda s: s[0][1] - s[0][0])
+            (lo, hi), r = slices[0]
+            ranges.remove(r)
+            keys = set(key for value, key in self._sorted[r[0]][lo:hi])
+
+        for name, low, high in ranges:
+            values = self._values
+            keys = set(key for key in keys if (low is None or values[key][name] >= low) and
+                       (high is None or values[key][name] < high))
+        return keys
+
+    def _range(self, name, low, high):
+        entries = self._sorted[name]
+        lo = 0 if low is None else bisect.bisect_left(entries, (low,))
+        hi = len(entries) if high is None else bisect.bisect_left(entries, (high,))
+        return lo, hi
+
+    def query(self, **predicates):
+        """
+        Returns the jobs that match every predicate.  Hash indexed fields take a value, or a list, tuple or
+        set of values to match any of.  Sorted fields take a (low, high) tuple, matching low <= value < high,
+        where either may be None.
+
+        :returns: Matching jobs
+        :rtype: list
+        :raises: ValueError if a field is not indexed
+
+        """
+        jobs = self._jobs
+        return [jobs[key] for key in self._keys(predicates)]
+
+    def count(self, **predicates):
+        """
+        Returns the number of jobs that match every predicate, takes the same arguments as :py:meth:`query`.
+
+        :rtype: int
+
+        """
+        return len(self._keys(predicates))
+
+
+class JobHistory(object):
+    """
+    Local SQLite store of job history, so jobs can still be queried after the server has purged them.
+    :py:meth:`ingest` fetches the job list, including finished jobs, and writes the jobs that are new or
+    have changed since the last ingest.  Finished jobs that ended before the high-water mark, the latest end
+    time already stored by an ingest with the same filters, are skipped without comparison.  Other jobs are
+    compared with a fingerprint of the stored record.  Writes are made in batched transactions, and the database
+    uses WAL mode so readers are not blocked while a job list is ingested.
+
+    Each job is stored as a row of the jobs table, with the full job record as JSON in the data column, and
+    one row per execution host in the job_hosts table.  Both can be queried with SQL using :py:meth:`sql`.
+    Requires the sqlite3 module.
+
+    Example::
+
+        >>> history = JobHistory("/var/tmp/jobs.db")
+        >>> history.ingest(c)
+        1520
+        >>> history.query(user_name="irvined", host_name="comp00", submitted_after=time.time() - 7 * 86400)
+        [9790, 9791]
+        >>> history.sql("SELECT queue, count(*) FROM jobs WHERE status='JOB_STAT_EXIT' GROUP BY queue")
+        [(u'normal', 12)]
+
+    """
+    finished_statuses = ("JOB_STAT_DONE", "JOB_STAT_EXIT")
+    batch_size = 5000
+    _schema = (
+        "CREATE TABLE IF NOT EXISTS jobs ("
+        " job_id INTEGER NOT NULL, array_index INTEGER NOT NULL, name TEXT, user_name TEXT, queue TEXT,"
+        " status TEXT, project TEXT, submission_host TEXT, submit_time INTEGER, start_time INTEGER,"
+        " end_time INTEGER, cpu_time REAL, requested_slots INTEGER, finished INTEGER NOT NULL,"
+        " fingerprint INTEGER NOT NULL, data TEXT NOT NULL, PRIMARY KEY (job_id, array_index))",
+        "CREATE TABLE IF NOT EXISTS job_hosts ("
+        " job_id INTEGER NOT NULL, array_index INTEGER NOT NULL, host_name TEXT NOT NULL, num_slots INTEGER)",
+        "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value)",
+        "CREATE INDEX IF NOT EXISTS jobs_user_name ON jobs (user_name, submit_time)",
+        "CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (queue, submit_time)",
+        "CREATE INDEX IF NOT EXISTS jobs_submit_time ON jobs (submit_time)",
+        "CREATE INDEX IF NOT EXISTS jobs_end_time ON jobs (end_time)",
+        "CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (finished)",
+        "CREATE INDEX IF NOT EXISTS job_hosts_host_name ON job_hosts (host_name)",
+        "CREATE INDEX IF NOT EXISTS job_hosts_job ON job_hosts (job_id, array_index)",
+    )
+    _encoder = json.JSONEncoder(separators=(',', ':'))
+
+    def __init__(self, path):
+        """
+        :param str path: Path of the database file, it is created if it does not exist
+
+        """
+        if sqlite3 is None:
+            raise ImportError("JobHistory requires sqlite3")
+        self.path = path
+        self._db = sqlite3.connect(path)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        with self._db:
+            for statement in self._schema:
+                self._db.execute(statement)
+
+    def close(self):
+        """
+        Closes the database.
+
+        """
+        self._db.close()
+
+    def _get_meta(self, key, default=None):
+        row = self._db.execute("SELECT value FROM meta WHERE key=?", (key,)).fetchone()
+        return default if row is None else row[0]
+
+    @property
+    def high_water_mark(self):
+        """
+        Latest end time of the finished jobs stored by ingests of every job, in seconds since the epoch.
+
+        :rtype: int
+
+        """
+        return self._get_meta("end_time_hwm", 0)
+
+    _unfiltered = {"job_id": 0, "array_index": -1, "queue_name": None, "host_name": None, "user_name": "all",
+                   "job_state": "ALL", "job_name": None, "where": None}
+
+    def _mark_key(self, filters):
+        # A filtered listing says nothing about the jobs it leaves out, so each set of filters has its own mark.
+        filters = sorted((k, getattr(v, "expression", v)) for k, v in (filters or {}).iteritems()
+                         if k != "processes" and (k not in self._unfiltered or self._unfiltered[k] != v))
+        if not filters:
+            return "end_time_hwm"
+        return "end_time_hwm?" + urllib.urlencode([(k, unicode(v).encode("utf-8")) for k, v in filters])
+
+    def ingest(self, connection, **kwargs):
+        """
+        Fetches the job list from the server and stores the jobs that are new or have changed.  Takes the same
+        filters as :py:meth:`Job.get_job_list`, by default every job of every user in any state.
+
+        :param OpenLavaConnection connection: The connection instance to use
+        :returns: Number of jobs written
+        :rtype: int
+
+        """
+        kwargs.setdefault("user_name", "all")
+        kwargs.setdefault("job_state", "ALL")
+        records = Job.get_job_data(connection, **kwargs)
+        return self.ingest_records(records, kwargs)
+
+    def ingest_records(self, records, filters=None):
+        """
+        Stores the jobs in records that are new or have changed.
+
+        :param list records: Job records, as returned by :py:meth:`Job.get_job_data`
+        :param dict filters: Arguments of :py:meth:`Job.get_job_data` the records were fetched with, None if they
+            hold every job.  The high-water mark is kept separately for each set of filters.
+        :returns: Number of jobs written
+        :rtype: int
+
+        """
+        mark_key = self._mark_key(filters)
+        hwm = self._get_meta(mark_key, 0)
+        # Fingerprints of unfinished jobs, and of finished jobs that ended at the high-water mark, as jobs
+        # that end in the same second may be listed in different ingests.
+        known = dict(((row[0], row[1]), row[2]) for row in self._db.execute(
+            "SELECT job_id, array_index, fingerprint FROM jobs WHERE finished=0 OR end_time>=?", (hwm,)))
+        encode = self._encoder.encode
+        finished_statuses = self.finished_statuses
+        rows = []
+        hosts = []
+        new_hwm = hwm
+        written = 0
+        for record in records:
+            key = (record['job_id'], record['array_index'])
+            status = record['status']['name']
+            finished = status in finished_statuses
+            end_time = record.get('end_time') or 0
+            if finished and end_time < hwm and key not in known:
+                continue
+            data = encode(record)
+            # Fingerprints are kept across processes, so use a stable digest rather than hash().
+            fingerprint = int(hashlib.md5(data).hexdigest()[:15], 16)
+            if known.get(key) == fingerprint:
+                continue
+            if finished:
+                new_hwm = max(new_hwm, end_time)
+            project_names = record.get('project_names') or [None]
+            rows.append((
+                key[0], key[1], record.get('name'), record.get('user_name'), record['queue']['name'], status,
+                project_names[0], record['submission_host']['name'], record.get('submit_time'),
+                record.get('start_time'), end_time, record.get('cpu_time'), record.get('requested_slots'),
+                1 if finished else 0, fingerprint, data,
+            ))
+            for host in record.get('execution_hosts') or []:
+                hosts.append((key[0], key[1], host['name'], host.get('num_slots')))
+            if len(rows) >= self.batch_size:
+                written += self._write(rows, hosts)
+                rows = []
+                hosts = []
+        written += self._write(rows, hosts, (mark_key, new_hwm))
+        return written
+
+    def _write(self, rows, hosts, mark=None):
+        with self._db:
+            self._db.executemany("DELETE FROM job_hosts WHERE job_id=? AND array_index=?",
+                                 ((r[0], r[1]) for r in rows))
+            self._db.executemany("INSERT OR REPLACE INTO jobs VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)", rows)
+            self._db.executemany("INSERT INTO job_hosts VALUES (?,?,?,?)", hosts)
+            if mark is not None:
+                self._db.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", mark)
+        return len(rows)
+
+    def sql(self, statement, parameters=()):
+        """
+        Runs an SQL statement against the store and returns the rows.
+
+        :param str statement: SQL statement
+        :param tuple parameters: Values for the placeholders in statement
+        :rtype: list
+
+        """
+        return self._db.execute(statement, parameters).fetchall()
+
+    def _where(self, user_name, queue_name, host_name, status, submitted_after, submitted_before):
+        clauses = []
+        parameters = []
+        for column, value in (("user_name", user_name), ("queue", queue_name), ("status", status)):
+            if value is not None:
+                clauses.append("%s=?" % column)
+                parameters.append(value)
+        if host_name is not None:
+            clauses.append("EXISTS (SELECT 1 FROM job_hosts h WHERE h.job_id=jobs.job_id AND "
+                           "h.array_index=jobs.array_index AND h.host_name=?)")
+            parameters.append(host_name)
+        if submitted_after is not None:
+            clauses.append("submit_time>=?")
+            parameters.append(submitted_after)
+        if submitted_before is not None:
+            clauses.append("submit_time<?")
+            parameters.append(submitted_before)
+        where = " WHERE " + " AND ".join(clauses) if clauses else ""
+        return where, parameters
+
+    def query(self, connection=None, user_name=None, queue_name=None, host_name=None, status=None,
+              submitted_after=None, submitted_before=None, limit=None):
+        """
+        Returns stored jobs that match every given filter, most recently submitted first.
+
+        :param OpenLavaConnection connection: Connection given to the returned jobs, needed only to act on them
+        :param str user_name: Only return jobs of this user
+        :param str queue_name: Only return jobs submitted to this queue
+        :param str host_name: Only return jobs that executed on this host
+        :param str status: Only return jobs with this status name, for example JOB_STAT_EXIT
+        :param int submitted_after: Only return jobs submitted at or after this time
+        :param int submitted_before: Only return jobs submitted before this time
+        :param int limit: Maximum number of jobs to return
+        :returns: List of :py:class:`Job` objects
+        :rtype: list
+
+        """
+        where, parameters = self._where(user_name, queue_name, host_name, status, submitted_after,
+                                        submitted_before)
+        statement = "SELECT data FROM jobs" + where + " ORDER BY submit_time DESC"
+        if limit is not None:
+            statement += " LIMIT %d" % limit
+        return [Job(connection, data=json.loads(row[0])) for row in self._db.execute(statement, parameters)]
+
+    def count(self, user_name=None, queue_name=None, host_name=None, status=None, submitted_after=None,
+              submitted_before=None):
+        """
+        Returns the number of stored jobs that match every given filter, takes the same filters as
+        :py:meth:`query`.
+
+        :rtype: int
+
+        """
+        where, parameters = self._where(user_name, queue_name, host_name, status, submitted_after,
+                                        submitted_before)
+        return self._db.execute("SELECT count(*) FROM jobs" + where, parameters).fetchone()[0]
+
+
+class JobFilter(object):
+    """
+    Filter expression for job records, used as the where argument of :py:meth:`Job.get_job_list`.
+
+    An expression compares fields of a job using =, !=, <, <=, >, >=, ~ (regular expression search), in and
+    not in, combined using and, or, not and parentheses.  Values are numbers, quoted or bare strings,
+    durations such as 90s, 30m, 12h, 1d or 2w which are converted to seconds, and times relative to now such
+    as now-1d.  Statuses may be given without the JOB_STAT\_ prefix.  Fields that hold several values, such as
+    host_name and project, match when any of their values match, != and not in match when none do.
+
+    :py:meth:`plan` splits an expression into the filters the server supports, which are sent in the /jobs
+    query string, and the remaining comparisons, which are checked against each decoded record before a
+    :py:class:`Job` is built for it.
+
+    Example::
+
+        >>> f = JobFilter("status in (PEND,RUN) and requested_slots > 16 and submit_time < now-1d")
+        >>> Job.get_job_list(c, where=f)
+        [9790, 9791]
+        >>> f.matches({"status": {"name": "JOB_STAT_RUN"}, "requested_slots": 32, "submit_time": 0})
+        True
+
+    .. py:attribute:: expression
+
+        The expression the filter was compiled from.
+
+    """
+    _token = re.compile(r"""\s*(?:(?P<number>\d+(?:\.\d*)?(?P<unit>[smhdw])?(?![\w.]))|
+                        (?P<string>'[^']*'|"[^"]*")|
+                        (?P<op>==|!=|<=|>=|=|<|>|~|\(|\)|,|[-+])|
+                        (?P<now>now)(?![\w.*/@:\[\]])|
+                        (?P<word>[\w.*/@:\[\]-]+))""", re.X | re.I)
+    _units = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+    #: Functions returning the value of a field from a job record, other fields are read from the record.
+    fields = {
+        'queue': lambda r: (r.get('queue') or {}).get('name'),
+        'queue_name': lambda r: (r.get('queue') or {}).get('name'),
+        'status': lambda r: (r.get('status') or {}).get('name'),
+        'job_name': lambda r: r.get('name'),
+        'submission_host': lambda r: (r.get('submission_host') or {}).get('name'),
+        'host_name': lambda r: [h['name'] for h in r.get('execution_hosts') or []],
+        'project': lambda r: r.get('project_names') or [],
+    }
+    #: Fields that are sent to the server when compared for equality, and the get_job_list argument for each.
+    pushdown_fields = {
+        'queue': 'queue_name',
+        'queue_name': 'queue_name',
+        'host_name': 'host_name',
+        'user_name': 'user_name',
+        'job_name': 'job_name',
+    }
+
+    def __init__(self, expression, now=None):
+        """
+        :param str expression: The filter expression
+        :param float now: Time used for now in the expression, defaults to the current time
+        :raises: ValueError if the expression is not valid
+
+        """
+        self.expression = expression
+        self._now = time.time() if now is None else now
+        self._tokens = self._tokenize(expression)
+        self._position = 0
+        self._tree = self._parse_or()
+        if self._position != len(self._tokens):
+            raise ValueError("Unexpected '%s' in filter: %s" % (self._tokens[self._position][1], expression))
+        del self._tokens
+        self.matches = self._compile(self._tree)
+
+    def __repr__(self):
+        return "JobFilter(%r)" % self.expression
+
+    def _tokenize(self, expression):
+        tokens = []
+        position = 0
+        expression = expression.rstrip()
+        while position < len(expression):
+            match = self._token.match(expression, position)
+            if not match:
+                raise ValueError("Invalid filter at '%s': %s" % (expression[position:], expression))
+            position = match.end()
+            if match.group('number') is not None:
+                text = match.group('number')
+                unit = match.group('unit')
+                value = float(text[:-1] if unit else text)
+                if unit:
+                    value *= self._units[unit]
+                if value == int(value) and "." not in text:
+                    value = int(value)
+                tokens.append(('value', value))
+            elif match.group('string') is not None:
+                tokens.append(('value', match.group('string')[1:-1]))
+            elif match.group('op') is not None:
+                tokens.append(('op', match.group('op')))
+            elif match.group('now') is not None:
+                tokens.append(('value', self._now))
+            else:
+                word = match.group('word')
+                if word.lower() in ('and', 'or', 'not', 'in'):
+                    tokens.append(('op', word.lower()))
+                else:
+                    tokens.append(('word', word))
+        return tokens
+
+    def _peek(self):
+        if self._position < len(self._tokens):
+            return self._tokens[self._position]
+        return (None, None)
+
+    def _next(self, expected=None):
+        token = self._peek()
+        if token[0] is None or (expected and token != ('op', expected)):
+            raise ValueError("Expected %s in filter: %s" % ("'%s'" % expected if expected else "more",
+                                                            self.expression))
+        self._position += 1
+        return token
+
+    def _parse_or(self):
+        terms = [self._parse_and()]
+        while self._peek() == ('op', 'or'):
+            self._next()
+            terms.append(self._parse_and())
+        return terms[0] if len(terms) == 1 else ('or', terms)
+
+    def _parse_and(self):
+        terms = [self._parse_not()]
+        while self._peek() == ('op', 'and'):
+            self._next()
+            terms.append(self._parse_not())
+        return terms[0] if len(terms) == 1 else ('and', terms)
+
+    def _parse_not(self):
+        if self._peek() == ('op', 'not'):
+            self._next()
+            return ('not', self._parse_not())
+        if self._peek() == ('op', '('):
+            self._next()
+            tree = self._parse_or()
+            self._next(')')
+            return tree
+        return self._parse_comparison()
+
+    def _parse_comparison(self):
+        kind, field = self._next()
+        if kind != 'word':
+            raise ValueError("Expected a field name, not '%s' in filter: %s" % (field, self.expression))
+        kind, op = self._next()
+        if op == 'not':
+            self._next('in')
+            op = 'not in'
+        if kind != 'op' or op not in ('=', '==', '!=', '<', '<=', '>', '>=', '~', 'in', 'not in'):
+            raise ValueError("Expected a comparison after '%s' in filter: %s" % (field, self.expression))
+        if op == '==':
+            op = '='
+        if op in ('in', 'not in'):
+            self._next('(')
+            values = [self._parse_value(field)]
+            while self._peek() == ('op', ','):
+                self._next()
+                values.append(self._parse_value(field))
+            self._next(')')
+            return ('cmp', field, op, values)
+        return ('cmp', field, op, self._parse_value(field))
+
+    def _parse_value(self, field):
+        kind, value = self._next()
+        if (kind, value) == ('op', '-') and self._peek()[0] == 'value':
+            kind, value = self._next()
+            if not isinstance(value, (int, float)):
+                raise ValueError("Expected a number after '-' in filter: %s" % self.expression)
+            value = -value
+        if kind == 'op':
+            raise ValueError("Expected a value, not '%s' in filter: %s" % (value, self.expression))
+        while self._peek() in (('op', '-'), ('op', '+')):
+            sign = self._next()[1]
+            offset = self._next()[1]
+            if not isinstance(value, (int, float)) or not isinstance(offset, (int, float)):
+                raise ValueError("Only numbers, durations and times can be added in filter: %s" % self.expression)
+            value = value + offset if sign == '+' else value - offset
+        if field == 'status' and isinstance(value, basestring) and not value.startswith("JOB_STAT_"):
+            value = "JOB_STAT_" + value.upper()
+        return value
+
+    def _compile(self, tree):
+        if tree[0] == 'and':
+            terms = [self._compile(t) for t in tree[1]]
+            return lambda r: all(t(r) for t in terms)
+        if tree[0] == 'or':
+            terms = [self._compile(t) for t in tree[1]]
+            return lambda r: any(t(r) for t in terms)
+        if tree[0] == 'not':
+            term = self._compile(tree[1])
+            return lambda r: not term(r)
+        field, op, value = tree[1:]
+        getter = self.fields.get(field) or (lambda r: r.get(field))
+        if op == '=':
+            test = lambda v: v == value
+        elif op == '!=':
+            test = lambda v: v != value
+        elif op == 'in':
+            values = set(value)
+            test = lambda v: v in values
+        elif op == 'not in':
+            values = set(value)
+            test = lambda v: v not in values
+        elif op == '~':
+            try:
+                pattern = re.compile(str(value))
+            except re.error as e:
+                raise ValueError("Invalid regular expression: %s for %s: %s" % (value, field, e))
+            test = lambda v: v is not None and pattern.search(unicode(v)) is not None
+        else:
+            compare = {'<': operator.lt, '<=': operator.le, '>': operator.gt, '>=': operator.ge}[op]
+            test = lambda v: v is not None and compare(v, value)
+        if op in ('!=', 'not in'):
+            # Multi valued fields match when none of their values equal the value.
+            return lambda r: (lambda v: all(test(i) for i in v) if isinstance(v, list) else test(v))(getter(r))
+        return lambda r: (lambda v: any(test(i) for i in v) if isinstance(v, list) else test(v))(getter(r))
+
+    def plan(self, queue_name=None, host_name=None, user_name="all", job_state="ACT", job_name=None):
+        """
+        Splits the filter into arguments for the /jobs query and a predicate for the rest.  Equality on
+        queue, host_name, user_name and job_name is sent to the server when the argument is not already
+        given, and comparisons on status narrow job_state to the smallest state that holds every status that
+        can match.
+
+        :param job_state: job_state requested by the caller, None to use the server default unless the filter
+            selects statuses
+        :return: Tuple of a dict of get_job_list arguments, or None if no job can match, and a function that
+            returns True for records that match the rest of the filter, or None if nothing is left to check.
+        :rtype: tuple
+
+        """
+        params = {"queue_name": queue_name, "host_name": host_name, "user_name": user_name, "job_name": job_name}
+        terms = self._tree[1] if self._tree[0] == 'and' else [self._tree]
+        residual = []
+        statuses = None
+        for term in terms:
+            if term[0] == 'cmp' and term[2] in ('=', 'in'):
+                field, op, value = term[1:]
+                values = value if op == 'in' else [value]
+                argument = self.pushdown_fields.get(field)
+                if argument and len(values) == 1 and isinstance(values[0], basestring):
+                    current = params[argument]
+                    if current is None or (argument == "user_name" and current == "all"):
+                        params[argument] = values[0]
+                        continue
+                if field == 'status':
+                    statuses = set(values) if statuses is None else statuses & set(values)
+            residual.append(term)
+
+        allowed = Job.job_states.get(job_state or "ALL")
+        if statuses is not None:
+            if allowed is not None:
+                statuses &= set(allowed)
+            if not statuses:
+                return None, None
+            candidates = [(len(s), k) for k, s in Job.job_states.items()
+                          if s is not None and statuses <= set(s) and (allowed is None or set(s) <= set(allowed))]
+            job_state = min(candidates)[1] if candidates else (job_state or "ALL")
+        params["job_state"] = job_state
+
+        if not residual:
+            return params, None
+        return params, self._compile(residual[0] if len(residual) == 1 else ('and', residual))
+
+
+def _decode_chunk(chunk):
+    """
+    Decodes a chunk of the elements of a JSON list in a :py:class:`DecoderPool` worker, and returns them
+    marshalled with the keys of objects of the same shape stored once, which is faster to send back and load
+    than the decoded objects.  Returns None if the chunk is not a sequence of complete elements.
+
+    """
+    try:
+        elements = _default_json_codec.loads("[" + chunk + "]", object_hook=_interning_object_hook())
+    except ValueError:
+        return None
+    shapes = {}
+    rows = []
+    for element in elements:
+        if type(element) is dict:
+            key = tuple(element)
+            index = shapes.get(key)
+            if index is None:
+                index = shapes[key] = len(shapes)
+            rows.append((index,) + tuple(element.itervalues()))
+        else:
+            rows.append((-1, element))
+    return marshal.dumps((sorted(shapes, key=shapes.get), rows), 2)
+
+
+class DecoderPool(object):
+    """
+    Pool of processes that decode large responses in parallel, used by :py:meth:`Job.get_job_list` and
+    :py:meth:`Host.get_host_list` when they are given processes.
+
+    The list of records in the response is split into chunks at the boundaries between records, each chunk is
+    decoded by a worker, and the records are merged back in order.  Boundaries are found by searching for the
+    first key of the first record after each chunk sized offset, without parsing the rest of the body.  Objects
+    nested in records can start with the same key, so the object found is decoded, and only taken as the next
+    record when it has the same keys as the first record.  A boundary that still turns out to be inside a
+    record makes its chunk fail to decode, and the response is then decoded in this process instead.
+    Responses smaller than min_size are always decoded in this process.
+
+    The records still have to be sent back, and objects built, in this process, so it is most useful for
+    listings of hundreds of thousands of jobs.  Pools are created on first use and kept, use :py:meth:`shared`
+    to reuse one pool across calls.
+
+    Example::
+
+        >>> jobs = Job.get_job_list(c, user_name="all", job_state="ALL", processes=16)
+
+    """
+    _data_key = re.compile(r'"data"\s*:\s*\[')
+    _first_key = re.compile(r'\s*\{\s*("(?:[^"\\]|\\.)*")\s*:')
+    _shared = {}
+
+    @classmethod
+    def shared(cls, processes=None):
+        """
+        Returns the pool with the given number of processes, shared by every caller in this process.
+
+        :param int processes: Number of worker processes, None for one per core
+        :rtype: DecoderPool
+
+        """
+        pool = cls._shared.get(processes)
+        if pool is None:
+            pool = cls._shared[processes] = cls(processes)
+        return pool
+
+    def __init__(self, processes=None, min_size=4 * 1024 * 1024, min_chunk_size=1024 * 1024):
+        """
+        :param int processes: Number of worker processes, None for one per core
+        :param int min_size: Size in bytes of the smallest response that is decoded by the pool
+        :param int min_chunk_size: Size in bytes of the smallest chunk sent to a worker
+
+        """
+        self.processes = processes or multiprocessing.cpu_count()
+        self.min_size = min_size
+        self.min_chunk_size = min_chunk_size
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def close(self):
+        """
+        Stops the worker processes.  They are started again if the pool is used.
+
+        """
+        with self._lock:
+            if self._pool is not None:
+                self._pool.terminate()
+                self._pool.join()
+                self._pool = None
+
+    def load(self, fp, object_hook=None, codec=None):
+        """
+        Reads and decodes a response, see :py:meth:`decode`.
+
+        :param fp: File like response object
+
+        """
+        return self.decode(fp.read(), object_hook, codec)
+
+    def decode(self, body, object_hook=None, codec=None):
+        """
+        Decodes a JSON response, decoding the elements of its data list in parallel.  Workers decode with the
+        default :py:class:`JsonCodec`.
+
+        :param str body: Body of the response
+        :param object_hook: json object_hook, responses decoded with a hook are decoded in this process
+        :param JsonCodec codec: Codec used to decode in this process, the default codec if None
+        :returns: Decoded response
+        :raises: ValueError if the body is not valid JSON
+
+        """
+        if object_hook is None and len(body) >= self.min_size:
+            data = self._decode_parallel(body)
+            if data is not None:
+                return data
+        return (codec or _default_json_codec).loads(body, object_hook=object_hook or _interning_object_hook())
+
+    def _split(self, body):
+        match = self._data_key.search(body)
+        if match is None:
+            return None
+        start = match.end()
+        end = len(body)
+        # The list usually ends at the last bracket, the rest of the response is checked by decoding it.
+        for attempt in range(3):
+            end = body.rfind("]", start, end)
+            if end < 0:
+                return None
+            try:
+                envelope = json.loads(body[:start - 1] + "null" + body[end + 1:])
+            except ValueError:
+                continue
+            if isinstance(envelope, dict) and 'data' in envelope and envelope['data'] is None:
+                break
+        else:
+            return None
+        match = self._first_key.match(body, start, end)
+        if match is None:
+            return None
+        raw_decode = _default_json_codec.raw_decoder()
+        try:
+            keys = set(raw_decode(body, body.index("{", start))[0])
+        except ValueError:
+            return None
+        boundary = re.compile(r'\}\s*,\s*\{\s*' + re.escape(match.group(1)) + r'\s*:')
+        chunk_size = max(self.min_chunk_size, (end - start) // (self.processes * 4))
+        chunks = []
+        position = start
+        offset = position + chunk_size
+        while position < end:
+            match = boundary.search(body, offset, end)
+            if match is None:
+                chunks.append(body[position:end])
+                break
+            comma = body.index(",", match.start())
+            try:
+                record = raw_decode(body, body.index("{", comma))[0]
+            except ValueError:
+                record = None
+            if not isinstance(record, dict) or set(record) != keys:
+                # An object nested in a record, look for the next one.
+                offset = match.start() + 1
+                continue
+            chunks.append(body[position:comma])
+            position = comma + 1
+            offset = position + chunk_size
+        return envelope, chunks
+
+    def _decode_parallel(self, body):
+        split = self._split(body)
+        if split is None:
+            return None
+        envelope, chunks = split
+        with self._lock:
+            if self._pool is None:
+                self._pool = multiprocessing.Pool(self.processes)
+            pool = self._pool
+        results = pool.map(_decode_chunk, chunks, 1)
+        if None in results:
+            logging.debug("Response was not split at record boundaries, decoding it in one process")
+            return None
+        data = []
+        # Collection would walk the growing list of records many times while they are built.
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            for result in results:
+                shapes, rows = marshal.loads(result)
+                for row in rows:
+                    if row[0] < 0:
+                        data.append(row[1])
+                    else:
+                        data.append(dict(zip(shapes[row[0]], row[1:])))
+        finally:
+            if gc_enabled:
+                gc.enable()
+        envelope['data'] = data
+        return envelope
+
+
+class StreamDecoder(object):
+    """
+    Decodes the data list of a response as it is received, and passes each element to a function as soon as it
+    has been decoded, so that the first records of a large listing can be used before the rest have arrived.
+    Used by :py:meth:`Job.stream_job_list`.
+
+    The function is called with each decoded element, the elements it returns, if not None, make up the data
+    of the response.  Exceptions raised by the function stop reading the response and are raised by
+    :py:meth:`OpenLavaConnection.open`.
+
+    Example::
+
+        >>> request = urllib2.Request(c.url + "/jobs", None, {'Content-Type': 'application/json'})
+        >>> c.open(request, decoder=StreamDecoder(lambda record: sys.stdout.write("%(job_id)s\\n" % record)))
+        []
+
+    """
+    _data_key = re.compile(r'"data"\s*:\s*\[')
+    _whitespace = re.compile(r'\s*')
+
+    def __init__(self, function, read_size=16 * 1024):
+        """
+        :param function: Function called with each element of the data list
+        :param int read_size: Number of bytes read from the response at a time
+
+        """
+        self.function = function
+        self.read_size = read_size
+
+    def load(self, fp, object_hook=None, codec=None):
+        """
+        Reads and decodes a response, passing each element of its data list to the function.  Responses with
+        no data list, such as errors, are decoded whole.
+
+        :param fp: File like response object
+        :param object_hook: json object_hook called with each decoded object
+        :param JsonCodec codec: Codec used to decode, the default codec if None
+        :returns: Decoded response
+        :raises: ValueError if the response is not valid JSON
+
+        """
+        codec = codec or _default_json_codec
+        object_hook = object_hook or _interning_object_hook()
+        body = ""
+        while True:
+            chunk = fp.read(self.read_size)
+            if not chunk:
+                return codec.loads(body, object_hook)
+            body += chunk
+            match = self._data_key.search(body)
+            if match is not None:
+                break
+        # Only a data list at the top level of the response is streamed.
+        prefix = body[:match.end() - 1]
+        try:
+            envelope = codec.loads(prefix + "null}")
+        except ValueError:
+            envelope = None
+        if not isinstance(envelope, dict) or envelope.get('data', True) is not None:
+            return codec.loads(body + fp.read(), object_hook)
+
+        raw_decode = codec.raw_decoder(object_hook)
+        skip = self._whitespace.match
+        function = self.function
+        data = []
+        buf = body[match.end():]
+        position = 0
+        expect_value = None
+        while True:
+            position = skip(buf, position).end()
+            if position < len(buf):
+                c = buf[position]
+                if expect_value is not True and c == "]":
+                    break
+                if expect_value is False:
+                    if c != ",":
+                        raise ValueError("Expected , or ] after element of data list, found: %r" % c)
+                    expect_value = True
+                    position += 1
+                    continue
+                try:
+                    element, end = raw_decode(buf, position)
+                except ValueError:
+                    end = None
+                # A value that reaches the end of what has been read, such as a number, may not be complete.
+                if end is not None and end < len(buf):
+                    position = end
+                    expect_value = False
+                    element = function(element)
+                    if element is not None:
+                        data.append(element)
+                    continue
+            chunk = fp.read(self.read_size)
+            if not chunk:
+                raise ValueError("Response ended inside the data list")
+            buf = buf[position:] + chunk
+            position = 0
+        envelope = codec.loads(prefix + "null" + buf[position + 1:] + fp.read(), object_hook)
+        envelope['data'] = data
+        return envelope
+
+
+class _SnapshotTable(object):
+    """
+    Table in a :py:class:`Snapshot`, read from the memory mapped file as values are needed.
+
+    """
+    _formats = {0: ('<q', 8), 1: ('<d', 8), 2: ('<I', 4)}
+
+    def __init__(self, snapshot, offset):
+        self._snapshot = snapshot
+        mm = snapshot._mmap
+        self.rows, count = struct.unpack_from("<II", mm, offset)
+        offset += 8
+        self._columns = {}
+        for i in range(count):
+            name, kind, column_offset = struct.unpack_from("<16sBQ", mm, offset)
+            self._columns[name.rstrip("\0")] = (kind, column_offset)
+            offset += 25
+        self._records = self._columns.pop("_records")[1]
+        self._cache = {}
+
+    def column(self, name):
+        """
+        Returns every value of a column as a tuple.  String columns hold string ids, see
+        :py:meth:`Snapshot.string`.
+
+        """
+        values = self._cache.get(name)
+        if values is None:
+            kind, offset = self._columns[name]
+            values = struct.unpack_from("<%d%s" % (self.rows, self._formats[kind][0][1]), self._snapshot._mmap,
+                                        offset)
+            self._cache[name] = values
+        return values
+
+    def value(self, name, row):
+        kind, offset = self._columns[name]
+        fmt, size = self._formats[kind]
+        return struct.unpack_from(fmt, self._snapshot._mmap, offset + row * size)[0]
+
+    def record(self, row):
+        """
+        Returns the record stored for a row, as returned by the server.
+
+        :rtype: dict
+
+        """
+        start, end = struct.unpack_from("<QQ", self._snapshot._mmap, self._records + row * 8)
+        return json.loads(self._snapshot._mmap[start:end])
+
+
+class Snapshot(object):
+    """
+    Compact binary snapshot of the jobs, hosts and queues on the cluster, written by :py:meth:`create` and
+    read through mmap.  Readers only decode the values and records they use, and processes reading the same
+    file share its pages.  A new snapshot is written to a temporary file and renamed over the old one, so
+    readers always see a complete file, and readers that have it open keep the version they opened.
+
+    The file holds a header, a sorted table of every distinct string, and one table each for jobs, hosts
+    and queues.  A table has fixed width numeric columns, string columns holding ids into the string table,
+    and an offset index of the JSON records returned by the server.  Job rows are sorted by job id and array
+    index, and host and queue rows by name, so single records are found by binary search.
+
+    Example::
+
+        >>> Snapshot.create(c, "/var/tmp/cluster.snap")
+        >>> snapshot = Snapshot("/var/tmp/cluster.snap")
+        >>> snapshot.get_job_list(c, user_name="irvined", job_state="PEND")
+        [9790]
+        >>> snapshot.get_host(c, "comp00").statuses
+        [Ok]
+
+    .. py:attribute:: created
+
+        Time the snapshot was created, in seconds since the epoch.
+
+    """
+    magic = "OLWSNAP1"
+    version = 1
+    _header = "<8sIdIQ"
+    _tables = (
+        ("jobs", (
+            ("job_id", 0, lambda r: r['job_id']),
+            ("array_index", 0, lambda r: r['array_index']),
+            ("submit_time", 0, lambda r: r.get('submit_time') or 0),
+            ("start_time", 0, lambda r: r.get('start_time') or 0),
+            ("end_time", 0, lambda r: r.get('end_time') or 0),
+            ("requested_slots", 0, lambda r: r.get('requested_slots') or 0),
+            ("cpu_time", 1, lambda r: r.get('cpu_time') or 0.0),
+            ("user_name", 2, lambda r: r.get('user_name')),
+            ("queue", 2, lambda r: r['queue']['name']),
+            ("status", 2, lambda r: r['status']['name']),
+            ("execution_hosts", 2, lambda r: " ".join(h['name'] for h in r.get('execution_hosts') or [])),
+        ), lambda r: (r['job_id'], r['array_index'])),
+        ("hosts", (
+            ("name", 2, lambda r: r['name']),
+        ), lambda r: r['name']),
+        ("queues", (
+            ("name", 2, lambda r: r['name']),
+        ), lambda r: r['name']),
+    )
+    _no_string = 0xFFFFFFFF
+
+    @classmethod
+    def create(cls, connection, path):
+        """
+        Fetches every job, host and queue from the server and writes them to a snapshot.
+
+        :param OpenLavaConnection connection: The connection instance to use
+        :param str path: Path of the snapshot file, replaced atomically if it exists
+
+        """
+        jobs = Job.get_job_data(connection, user_name="all", job_state="ALL")
+        hosts = connection.open(urllib2.Request(connection.url + "/hosts", None,
+                                                {'Content-Type': 'application/json'}))
+        queues = connection.open(urllib2.Request(connection.url + "/queues/", None,
+                                                 {'Content-Type': 'application/json'}))
+        cls.write(path, jobs, hosts, queues)
+
+    @classmethod
+    def write(cls, path, jobs, hosts, queues, created=None):
+        """
+        Writes job, host and queue records to a snapshot.
+
+        :param str path: Path of the snapshot file, replaced atomically if it exists
+        :param list jobs: Job records, as returned by :py:meth:`Job.get_job_data`
+        :param list hosts: Host records
+        :param list queues: Queue records
+        :param float created: Creation time to record, defaults to the current time
+
+        """
+        encode = json.JSONEncoder(separators=(',', ':')).encode
+        tables = []
+        strings = set()
+        for (name, columns, key), records in zip(cls._tables, (jobs, hosts, queues)):
+            records = sorted(records, key=key)
+            values = []
+            for column, kind, getter in columns:
+                column_values = [getter(r) for r in records]
+                if kind == 2:
+                    column_values = [v.encode("utf-8") if isinstance(v, unicode) else v for v in column_values]
+                    strings.update(v for v in column_values if v is not None)
+                values.append(column_values)
+            blobs = [encode(r) for r in records]
+            blobs = [b.encode("utf-8") if isinstance(b, unicode) else b for b in blobs]
+            tables.append((name, columns, values, blobs))
+        strings = sorted(strings)
+        string_ids = dict((s, i) for i, s in enumerate(strings))
+
+        directory = struct.calcsize(cls._header)
+        offset = directory + len(tables) * 16
+        strings_offset = offset
+        offset += 4 + (len(strings) + 1) * 8 + sum(len(s) for s in strings)
+        table_offsets = []
+        for name, columns, values, blobs in tables:
+            table_offsets.append(offset)
+            offset += 8 + (len(columns) + 1) * 25
+
+        out = tempfile.NamedTemporaryFile(dir=os.path.dirname(os.path.abspath(path)), prefix=".snapshot-",
+                                          delete=False)
+        try:
+            out.write(struct.pack(cls._header, cls.magic, cls.version, created or time.time(), len(tables),
+                                  strings_offset))
+            for (name, columns, values, blobs), table_offset in zip(tables, table_offsets):
+                out.write(struct.pack("<8sQ", name, table_offset))
+
+            out.write(struct.pack("<I", len(strings)))
+            position = strings_offset + 4 + (len(strings) + 1) * 8
+            for s in strings:
+                out.write(struct.pack("<Q", position))
+                position += len(s)
+            out.write(struct.pack("<Q", position))
+            for s in strings:
+                out.write(s)
+
+            # Column directories come first, followed by the data of every table.
+            data_offset = offset
+            data = []
+            for name, columns, values, blobs in tables:
+                rows = len(blobs)
+                out.write(struct.pack("<II", rows, len(columns) + 1))
+                for (column, kind, getter), column_values in zip(columns, values):
+                    out.write(struct.pack("<16sBQ", column, kind, data_offset))
+                    fmt = _SnapshotTable._formats[kind][0][1]
+                    if kind == 2:
+                        column_values = [cls._no_string if v is None else string_ids[v] for v in column_values]
+                    packed = struct.pack("<%d%s" % (rows, fmt), *column_values)
+                    data.append(packed)
+                    data_offset += len(packed)
+                out.write(struct.pack("<16sBQ", "_records", 3, data_offset))
+                index_size = (rows + 1) * 8
+                position = data_offset + index_size
+                index = []
+                for blob in blobs:
+                    index.append(position)
+                    position += len(blob)
+                index.append(position)
+                data.append(struct.pack("<%dQ" % (rows + 1), *index))
+                data.extend(blobs)
+                data_offset = position
+            for chunk in data:
+                out.write(chunk)
+            out.flush()
+            os.fsync(out.fileno())
+            # Temporary files are only readable by their owner, snapshots are read by every user of bjobs.
+            umask = os.umask(0)
+            os.umask(umask)
+            os.fchmod(out.fileno(), 0666 & ~umask)
+            out.close()
+            os.rename(out.name, path)
+        except:
+            out.close()
+            os.unlink(out.name)
+            raise
+
+    def __init__(self, path):
+        """
+        Opens a snapshot.
+
+        :param str path: Path of the snapshot file
+        :raises: ValueError if the file is not a snapshot
+
+        """
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.created, count, self._strings = struct.unpack_from(self._header, self._mmap, 0)
+        if magic != self.magic or version != self.version:
+            raise ValueError("Not a snapshot file: %s" % path)
+        self._string_count = struct.unpack_from("<I", self._mmap, self._strings)[0]
+        self._tables = {}
+        offset = struct.calcsize(self._header)
+        for i in range(count):
+            name, table_offset = struct.unpack_from("<8sQ", self._mmap, offset)
+            self._tables[name.rstrip("\0")] = _SnapshotTable(self, table_offset)
+            offset += 16
+
+    def close(self):
+        """
+        Closes the snapshot.
+
+        """
+        self._mmap.close()
+
+    @property
+    def age(self):
+        """
+        Number of seconds since the snapshot was created.
+
+        :rtype: float
+
+        """
+        return time.time() - self.created
+
+    def _string_bytes(self, string_id):
+        start, end = struct.unpack_from("<QQ", self._mmap, self._strings + 4 + string_id * 8)
+        return self._mmap[start:end]
+
+    def string(self, string_id):
+        """
+        Returns the string with the given id, as stored in string columns.
+
+        :rtype: unicode
+
+        """
+        if string_id == self._no_string:
+            return None
+        return self._string_bytes(string_id).decode("utf-8")
+
+    def string_id(self, value):
+        """
+        Returns the id of a string, or None if the snapshot does not contain it.
+
+        :rtype: int
+
+        """
+        if isinstance(value, unicode):
+            value = value.encode("utf-8")
+        lo, hi = 0, self._string_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._string_bytes(mid) < value:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self._string_count and self._string_bytes(lo) == value:
+            return lo
+        return None
+
+    def _find(self, table, key, key_of_row):
+        lo, hi = 0, table.rows
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if key_of_row(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < table.rows and key_of_row(lo) == key:
+            return lo
+        return None
+
+    def get_job(self, connection, job_id, array_index=0):
+        """
+        Returns a job from the snapshot.
+
+        :param OpenLavaConnection connection: The connection instance given to the job
+        :rtype: Job
+        :raises: NoSuchJobError if the job is not in the snapshot
+
+        """
+        table = self._tables["jobs"]
+        row = self._find(table, (int(job_id), int(array_index)),
+                         lambda r: (table.value("job_id", r), table.value("array_index", r)))
+        if row is None:
+            raise NoSuchJobError("Job %s[%s] does not exist" % (job_id, array_index))
+        return Job(connection, data=table.record(row))
+
+    def get_job_list(self, connection, job_id=0, array_index=-1, queue_name=None, host_name=None, user_name="all",
+                     job_state="ACT", job_name=None, where=None):
+        """
+        Returns jobs from the snapshot that match the criteria, takes the same arguments as
+        :py:meth:`Job.get_job_list`.  Only the matching records are decoded.
+
+        :rtype: list
+
+        """
+        predicate = None
+        if where is not None:
+            if not isinstance(where, JobFilter):
+                where = JobFilter(where)
+            plan, predicate = where.plan(queue_name, host_name, user_name, job_state, job_name)
+            if plan is None:
+                return []
+            queue_name, host_name, user_name, job_state, job_name = (
+                plan["queue_name"], plan["host_name"], plan["user_name"], plan["job_state"], plan["job_name"])
+        table = self._tables["jobs"]
+        rows = range(table.rows)
+        if job_id:
+            job_ids = table.column("job_id")
+            rows = [r for r in rows if job_ids[r] == job_id]
+            if array_index != -1:
+                array_indexes = table.column("array_index")
+                rows = [r for r in rows if array_indexes[r] == array_index]
+        for column, value in (("queue", queue_name), ("user_name", None if user_name == "all" else user_name)):
+            if value is not None:
+                string_id = self.string_id(value)
+                values = table.column(column)
+                rows = [r for r in rows if values[r] == string_id]
+        statuses = Job.job_states.get(job_state or "ACT")
+        if statuses is not None:
+            ids = set(self.string_id(s) for s in statuses)
+            values = table.column("status")
+            rows = [r for r in rows if values[r] in ids]
+        if host_name is not None:
+            values = table.column("execution_hosts")
+            rows = [r for r in rows if host_name in (self.string(values[r]) or "").split()]
+        records = [table.record(r) for r in rows]
+        if job_name is not None:
+            records = [r for r in records if r.get('name') == job_name]
+        if predicate is not None:
+            records = [r for r in records if predicate(r)]
+        return [Job(connection, data=r) for r in records]
+
+    def _get(self, table_name, name):
+        table = self._tables[table_name]
+        string_id = self.string_id(name)
+        if string_id is None:
+            return None
+        names = table.column("name")
+        row = self._find(table, string_id, lambda r: names[r])
+        return None if row is None else table.record(row)
+
+    def get_host(self, connection, host_name):
+        """
+        Returns a host from the snapshot.
+
+        :rtype: Host
+        :raises: NoSuchHostError if the host is not in the snapshot
+
+        """
+        data = self._get("hosts", host_name)
+        if data is None:
+            raise NoSuchHostError("Host %s does not exist" % host_name)
+        return Host(connection, data=data)
+
+    def get_host_list(self, connection):
+        """
+        Returns every host in the snapshot.
+
+        :rtype: list
+
+        """
+        table = self._tables["hosts"]
+        return [Host(connection, data=table.record(r)) for r in range(table.rows)]
+
+    def get_hosts_by_names(self, connection, host_names):
+        """
+        Returns hosts from the snapshot, takes the same arguments as :py:meth:`Host.get_hosts_by_names`.
+
+        :rtype: list
+
+        """
+        if len(host_names) == 1 and host_names[0] == "all":
+            return self.get_host_list(connection)
+        elif len(host_names) == 0:
+            return [self.get_host(connection, socket.gethostname())]
+        return [self.get_host(connection, host_name) for host_name in host_names]
+
+    def get_queue(self, connection, queue_name):
+        """
+        Returns a queue from the snapshot.
+
+        :rtype: Queue
+        :raises: NoSuchQueueError if the queue is not in the snapshot
+
+        """
+        data = self._get("queues", queue_name)
+        if data is None:
+            raise NoSuchQueueError("Queue %s does not exist" % queue_name)
+        return Queue(connection, data=data)
+
+    def get_queue_list(self, connection):
+        """
+        Returns every queue in the snapshot.
+
+        :rtype: list
+
+        """
+        table = self._tables["queues"]
+        return [Queue(connection, data=table.record(r)) for r in range(table.rows)]
+
+    def get_queues_by_names(self, connection, queue_names):
+        """
+        Returns queues from the snapshot, takes the same arguments as :py:meth:`Queue.get_queues_by_names`.
+        The snapshot does not record which queue is the default, so at least one queue name must be given.
+
+        :rtype: list
+        :raises: ValueError if no queue names are given
+
+        """
+        if len(queue_names) == 1 and queue_names[0] == "all":
+            return self.get_queue_list(connection)
+        elif len(queue_names) == 0:
+            raise ValueError("Snapshots do not record the default queue, give a queue name or all")
+        return [self.get_queue(connection, queue_name) for queue_name in queue_names]
+
+
+class Categorical(object):
+    """
+    Dictionary encoded column of strings, as used by :py:class:`JobTable`.  Each value is stored as an integer
+    code indexing into the list of categories.
+
+    .. py:attribute:: codes
+
+        NumPy array of integer codes, one per row.
+
+    .. py:attribute:: categories
+
+        List of distinct values, the code of a value is its position in this list.
+
+    """
+
+    def __init__(self, codes, categories):
+        self.codes = codes
+        self.categories = categories
+        self._index = dict((v, i) for i, v in enumerate(categories))
+
+    @classmethod
+    def from_values(cls, values, count=-1):
+        """
+        Encodes an iterable of values.
+
+        :param values: Iterable of hashable values
+        :param int count: Number of values, if known
+        :returns: Categorical of the values
+        :rtype: Categorical
+
+        """
+        index = {}
+        codes = numpy.fromiter((index.setdefault(v, len(index)) for v in values), numpy.int32, count)
+        categories = [None] * len(index)
+        for v, i in index.iteritems():
+            categories[i] = v
+        return cls(codes, categories)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, item):
+        if isinstance(item, (int, long, numpy.integer)):
+            return self.categories[self.codes[item]]
+        return Categorical(self.codes[item], self.categories)
+
+    def __eq__(self, value):
+        code = self._index.get(value)
+        if code is None:
+            return numpy.zeros(len(self.codes), dtype=bool)
+        return self.codes == code
+
+    def __ne__(self, value):
+        return ~self.__eq__(value)
+
+    def isin(self, values):
+        """
+        Returns a boolean mask of rows whose value is one of values.
+
+        :param values: Iterable of values
+        :rtype: numpy.ndarray
+
+        """
+        codes = [self._index[v] for v in values if v in self._index]
+        return numpy.in1d(self.codes, codes)
+
+    def tolist(self):
+        """
+        Returns the decoded values as a list.
+
+        :rtype: list
+
+        """
+        categories = self.categories
+        return [categories[c] for c in self.codes]
+
+
+class JobTable(object):
+    """
+    Column oriented table of jobs, built directly from the job records returned by the server without
+    creating :py:class:`Job` objects.  Numeric fields are NumPy arrays, string fields are
+    :py:class:`Categorical` columns.  Requires NumPy.
+
+    Example::
+
+        >>> from olwclient import JobTable, OpenLavaConnection
+        >>> c=OpenLavaConnection(ConnectionArgs)
+        >>> table=JobTable.get_job_table(c, job_state="PEND")
+        >>> table.count_by("queue", "user_name", weight="requested_slots")
+        {(u'normal', u'irvined'): 24.0}
+
+    .. py:attribute:: numeric_columns
+
+        Names and NumPy types of the numeric columns.
+
+    .. py:attribute:: categorical_columns
+
+        Names of the string columns, and functions that return the value of the column from a job record.
+
+    """
+    numeric_columns = (
+        ('job_id', 'int64'),
+        ('array_index', 'int64'),
+        ('submit_time', 'int64'),
+        ('start_time', 'int64'),
+        ('end_time', 'int64'),
+        ('cpu_time', 'float64'),
+        ('requested_slots', 'int64'),
+    )
+    categorical_columns = (
+        ('user_name', lambda r: r['user_name']),
+        ('queue', lambda r: r['queue']['name']),
+        ('status', lambda r: r['status']['name']),
+    )
+
+    @classmethod
+    def get_job_table(cls, connection, **kwargs):
+        """
+        Fetches jobs from the server and returns them as a table.  Takes the same arguments as
+        :py:meth:`Job.get_job_list`.
+
+        :returns: Table of matching jobs
+        :rtype: JobTable
+
+        """
+        return cls(Job.get_job_data(connection, **kwargs))
+
+    def __init__(self, records=None, columns=None):
+        """
+        :param list records: Job records as returned by :py:meth:`Job.get_job_data`
+        :param dict columns: Pre-built columns, used internally when filtering
+
+        """
+        if numpy is None:
+            raise ImportError("JobTable requires numpy")
+        if columns is None:
+            records = records or []
+            count = len(records)
+            columns = {}
+            for name, dtype in self.numeric_columns:
+                columns[name] = numpy.fromiter((r[name] for r in records), dtype, count)
+            for name, getter in self.categorical_columns:
+                columns[name] = Categorical.from_values((getter(r) for r in records), count)
+        self.columns = columns
+
+    def __len__(self):
+        return len(self.columns['job_id'])
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def mask(self, **kwargs):
+        """
+        Returns a boolean mask of rows where every named column matches.  Values may be a single value, or
+        a list, tuple or set of values to match any of.
+
+        :rtype: numpy.ndarray
+
+        """
+        result = numpy.ones(len(self), dtype=bool)
+        for name, value in kwargs.iteritems():
+            column = self.columns[name]
+            if isinstance(value, (list, tuple, set, frozenset)):
+                if isinstance(column, Categorical):
+                    result &= column.isin(value)
+                else:
+                    result &= numpy.in1d(column, list(value))
+            else:
+                result &= column == value
+        return result
+
+    def filter(self, mask=None, **kwargs):
+        """
+        Returns a new table containing only the matching rows.
+
+        :param numpy.ndarray mask: Optional boolean mask, for example ``table["requested_slots"] > 16``
+        :param kwargs: Column values to match, as for :py:meth:`mask`
+        :returns: Filtered table
+        :rtype: JobTable
+
+        """
+        if kwargs:
+            keyword_mask = self.mask(**kwargs)
+            mask = keyword_mask if mask is None else mask & keyword_mask
+        if mask is None:
+            return self
+        return self.__class__(columns=dict((name, column[mask]) for name, column in self.columns.iteritems()))
+
+    def count_by(self, *names, **kwargs):
+        """
+        Counts rows grouped by one or more categorical columns.
+
+        :param names: Names of the categorical columns to group by
+        :param str weight: Name of a numeric column to sum instead of counting rows
+        :returns: Dictionary mapping a tuple of column values to the count or sum, groups with no rows are left out
+        :rtype: dict
+
+        """
+        weight = kwargs.get('weight')
+        columns = [self.columns[name] for name in names]
+        key = numpy.zeros(len(self), dtype=numpy.int64)
+        size = 1
+        for column in columns:
+            key = key * len(column.categories) + column.codes
+            size *= len(column.categories)
+        weights = self.columns[weight] if weight else None
+        totals = numpy.bincount(key, weights=weights, minlength=size)
+        counts = numpy.bincount(key, minlength=size) if weights is not None else totals
+        result = {}
+        for k in numpy.flatnonzero(counts):
+            group = []
+            rest = int(k)
+            for column in reversed(columns):
+                rest, code = divmod(rest, len(column.categories))
+                group.append(column.categories[code])
+            group.reverse()
+            result[tuple(group)] = totals[k].item()
+        return result
+
+    def datetimes(self, name):
+        """
+        Returns a numeric time column, in seconds since the epoch, as NumPy datetime64 values in UTC.
+
+        :param str name: Name of the column, for example submit_time
+        :rtype: numpy.ndarray
+
+        """
+        return self.columns[name].astype('datetime64[s]')
 
 
-__ALL__ = [OpenLavaConnection, RemoteServerError, AuthenticationError, Host, Job, ExecutionHost]
+__ALL__ = [OpenLavaConnection, TokenOpenLavaConnection, RemoteServerError, AuthenticationError, Host, Job,
+           ExecutionHost, HostReference, HostCache, IdentityMap, JobChanges, JobWatcher, JobWaiter, EventStream, Event,
+           ClusterMirror, JobIndex, JobHistory, Snapshot, JobFilter, JobTable, Categorical, refresh_all,
+           DecoderPool, JsonCodec, StreamDecoder, dump_objects, load_objects]
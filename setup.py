@@ -29,6 +29,10 @@ setup(
     license="GPL v2",
     keywords="Openlava Web Clients",
     packages=['olwclient'],
+    extras_require={
+        'table': ['numpy'],
+        'fastjson': ['ujson>=2', 'simplejson'],
+    },
     classifiers=[
         "Development Status :: 3 - Alpha",
         "Topic :: Utilities",